@@ -0,0 +1,54 @@
+from typing import Optional
+
+from fastapi import Request
+
+from app.db.redis_cache import RedisCache
+from app.db.dynamodb import DynamoRepository
+from app.db.snapshot import SnapshotManager
+from app.integrations.paypal_client import AsyncPayPalClient
+from app.integrations.webhook_signature import WebhookVerifier
+from app.services.premium import PremiumResolver
+from app.services.startup import StartupChecks
+from app.services.webhooks import WebhookProcessor, WebhookQueue
+
+
+# Per-worker clients are created once in the lifespan handler (app.main) and
+# stored on app.state; these providers hand them to routes via Depends().
+
+def get_cache(request: Request) -> RedisCache:
+    return request.app.state.cache
+
+
+def get_repo(request: Request) -> DynamoRepository:
+    return request.app.state.repo
+
+
+def get_resolver(request: Request) -> PremiumResolver:
+    return request.app.state.resolver
+
+
+def get_startup(request: Request) -> StartupChecks:
+    return request.app.state.startup
+
+
+def get_snapshot(request: Request) -> Optional[SnapshotManager]:
+    return request.app.state.snapshot
+
+
+def get_paypal(request: Request) -> Optional[AsyncPayPalClient]:
+    # None when PayPal credentials are not configured
+    return request.app.state.paypal
+
+
+def get_webhook_verifier(request: Request) -> Optional[WebhookVerifier]:
+    # None when PAYPAL_WEBHOOK_ID is not configured
+    return request.app.state.webhook_verifier
+
+
+def get_webhook_processor(request: Request) -> WebhookProcessor:
+    return request.app.state.webhooks
+
+
+def get_webhook_queue(request: Request) -> Optional[WebhookQueue]:
+    # None when WEBHOOK_QUEUE_ENABLED is off
+    return request.app.state.webhook_queue
@@ -0,0 +1,275 @@
+"""Line-protocol premium lookups for co-located callers (no HTTP, no JSON).
+
+Enabled with LOOKUP_TCP_PORT and/or LOOKUP_UNIX_SOCKET and started by each API worker
+next to the FastAPI app (app.main lifespan), answering through the same PremiumResolver.
+
+Protocol (ASCII, newline-terminated; "\\r\\n" is accepted):
+
+    request  one line of one or more emails separated by spaces
+    reply    one line with one character per email, in request order:
+               1  premium          0  not premium
+               -  invalid email    !  database unavailable
+             or "ERR <reason>" for a line that cannot be answered at all
+
+An empty request line gets an empty reply (a cheap ping). Callers may pipeline: write any
+number of lines without waiting and read the replies back in order. Lines that arrive
+together are answered together, with up to LOOKUP_MAX_BATCH emails per resolve round (one
+pipelined cache read and one DynamoDB BatchGetItem per 100 misses), so a pipelined burst
+costs about as much as a single batch request. A line longer than LOOKUP_MAX_LINE_BYTES gets
+"ERR line too long" and the connection is closed.
+
+Every worker binds the TCP port with SO_REUSEPORT, so the kernel spreads connections over
+the workers. A Unix socket path can only be served by one process: the worker holding an
+flock on "<path>.lock" owns it, and the other workers retry periodically in case it exits.
+"""
+import asyncio
+import fcntl
+import os
+from collections import deque
+from typing import Deque, List, Optional
+
+from app.core.config import settings
+from app.core.emails import normalize_email
+from app.services.premium import DatabaseUnavailable, PremiumResolver
+
+PREMIUM = ord("1")
+NOT_PREMIUM = ord("0")
+INVALID = ord("-")
+UNAVAILABLE = ord("!")
+ERR_LINE_TOO_LONG = b"ERR line too long\n"
+ERR_TOO_MANY = b"ERR too many emails\n"
+# Seconds between attempts to take over the Unix socket from a worker that exited
+UNIX_STANDBY_INTERVAL = 5.0
+# Group-accessible so callers outside the container user can connect
+UNIX_SOCKET_MODE = 0o660
+
+
+class _LookupProtocol(asyncio.Protocol):
+    """One connection: complete lines are queued by data_received and answered in order by a task."""
+
+    def __init__(self, server: "LookupServer"):
+        self.server = server
+        self.transport: Optional[asyncio.Transport] = None
+        self._buffer = bytearray()
+        self._lines: Deque[Optional[bytes]] = deque()
+        self._ready = asyncio.Event()
+        self._writable = asyncio.Event()
+        self._writable.set()
+        self._reading_paused = False
+        self._eof = False
+        self._overflow = False
+        self._task: Optional[asyncio.Task] = None
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.transport = transport  # type: ignore[assignment]
+        self.server._connections.add(self)
+        self._task = asyncio.ensure_future(self._answer_lines())
+
+    def data_received(self, data: bytes) -> None:
+        if self._overflow:
+            return
+        buf = self._buffer
+        buf += data
+        end = buf.rfind(b"\n")
+        if end >= 0:
+            self._lines.extend(bytes(buf[:end]).split(b"\n"))
+            del buf[:end + 1]
+            self._ready.set()
+            # Stop reading while a large pipelined backlog is answered
+            if len(self._lines) > self.server.max_pending_lines and not self._reading_paused:
+                self._reading_paused = True
+                self.transport.pause_reading()
+        if len(buf) > settings.lookup_max_line_bytes:
+            # None marks the overlong line; its reply is the error and the connection closes
+            self._overflow = True
+            self._lines.append(None)
+            self._ready.set()
+            self.transport.pause_reading()
+
+    def eof_received(self) -> bool:
+        # Answer what was sent before the half-close, then close from _answer_lines
+        self._eof = True
+        self._ready.set()
+        return True
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        self.server._connections.discard(self)
+        self._writable.set()
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    def pause_writing(self) -> None:
+        self._writable.clear()
+
+    def resume_writing(self) -> None:
+        self._writable.set()
+
+    async def _answer_lines(self) -> None:
+        lines = self._lines
+        try:
+            while True:
+                await self._ready.wait()
+                self._ready.clear()
+                while lines:
+                    batch = self.server.take_batch(lines)
+                    if batch[-1] is None:
+                        reply = await self.server.answer(batch[:-1]) + ERR_LINE_TOO_LONG
+                        await self._writable.wait()
+                        self.transport.write(reply)
+                        self.transport.close()
+                        return
+                    reply = await self.server.answer(batch)
+                    # Respect the transport's flow control before queueing more output
+                    await self._writable.wait()
+                    if self.transport.is_closing():
+                        return
+                    self.transport.write(reply)
+                    if self._reading_paused and len(lines) <= self.server.max_pending_lines // 2:
+                        self._reading_paused = False
+                        self.transport.resume_reading()
+                if self._eof:
+                    self.transport.close()
+                    return
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print("[LookupServer] connection failed:", repr(e))
+            self.transport.abort()
+
+
+class LookupServer:
+    """TCP and/or Unix socket listeners for one worker; see the module docstring for the protocol."""
+
+    def __init__(self, resolver: PremiumResolver):
+        self.resolver = resolver
+        self.max_batch = max(1, settings.lookup_max_batch)
+        # Queued lines per connection before reading is paused
+        self.max_pending_lines = max(64, self.max_batch)
+        self._servers: List[asyncio.AbstractServer] = []
+        self._connections: "set[_LookupProtocol]" = set()
+        self._unix_lock_fd: Optional[int] = None
+        self._unix_standby: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if settings.lookup_tcp_port:
+            server = await loop.create_server(
+                lambda: _LookupProtocol(self),
+                settings.lookup_tcp_host,
+                settings.lookup_tcp_port,
+                reuse_port=True,
+            )
+            self._servers.append(server)
+        if settings.lookup_unix_socket:
+            if not await self._try_serve_unix():
+                self._unix_standby = asyncio.create_task(self._unix_standby_loop())
+
+    async def _try_serve_unix(self) -> bool:
+        """Serve LOOKUP_UNIX_SOCKET if no other worker does; returns True when this worker owns it."""
+        path = settings.lookup_unix_socket
+        fd = os.open(path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        try:
+            # Holding the lock means any socket file left at the path is stale
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            server = await asyncio.get_running_loop().create_unix_server(lambda: _LookupProtocol(self), path)
+            os.chmod(path, UNIX_SOCKET_MODE)
+        except BaseException:
+            os.close(fd)
+            raise
+        self._unix_lock_fd = fd
+        self._servers.append(server)
+        return True
+
+    async def _unix_standby_loop(self) -> None:
+        while True:
+            await asyncio.sleep(UNIX_STANDBY_INTERVAL)
+            try:
+                if await self._try_serve_unix():
+                    return
+            except Exception as e:
+                print("[LookupServer] unix socket takeover failed:", repr(e))
+
+    def take_batch(self, lines: Deque[Optional[bytes]]) -> List[Optional[bytes]]:
+        """Pop queued lines up to about max_batch emails (at least one line, stopping after a None)."""
+        batch: List[Optional[bytes]] = []
+        emails = 0
+        while lines:
+            line = lines[0]
+            if line is not None:
+                emails += line.count(b" ") + 1
+                if batch and emails > self.max_batch:
+                    break
+            batch.append(lines.popleft())
+            if line is None:
+                break
+        return batch
+
+    async def answer(self, lines: List[bytes]) -> bytes:
+        """Reply bytes for `lines`, resolving every valid email in one resolve_many round."""
+        parsed: List[Optional[List[Optional[str]]]] = []
+        valid: List[str] = []
+        for line in lines:
+            tokens = line.decode("utf-8", "replace").split()
+            if len(tokens) > self.max_batch:
+                parsed.append(None)
+                continue
+            keys: List[Optional[str]] = []
+            for token in tokens:
+                try:
+                    key = normalize_email(token).lower()
+                except ValueError:  # pydantic's email error
+                    key = None
+                else:
+                    valid.append(key)
+                keys.append(key)
+            parsed.append(keys)
+
+        answers = {}
+        unavailable = False
+        if valid:
+            try:
+                answers = await self.resolver.resolve_many(valid)
+            except DatabaseUnavailable:
+                unavailable = True
+
+        out = bytearray()
+        for keys in parsed:
+            if keys is None:
+                out += ERR_TOO_MANY
+                continue
+            for key in keys:
+                if key is None:
+                    out.append(INVALID)
+                elif unavailable:
+                    out.append(UNAVAILABLE)
+                else:
+                    out.append(PREMIUM if answers[key][0] else NOT_PREMIUM)
+            out.append(10)
+        return bytes(out)
+
+    async def close(self) -> None:
+        if self._unix_standby is not None:
+            self._unix_standby.cancel()
+            await asyncio.gather(self._unix_standby, return_exceptions=True)
+        for server in self._servers:
+            server.close()
+        for conn in list(self._connections):
+            conn.transport.close()
+        for server in self._servers:
+            await server.wait_closed()
+        if self._unix_lock_fd is not None:
+            # Remove the socket before giving up the lock so a standby worker binds a fresh path
+            try:
+                os.unlink(settings.lookup_unix_socket)
+            except FileNotFoundError:
+                pass
+            os.close(self._unix_lock_fd)
+            self._unix_lock_fd = None
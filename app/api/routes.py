@@ -1,183 +1,149 @@
-from fastapi import APIRouter, HTTPException, Request, status
-from pydantic import EmailStr
-from app.models.schemas import PremiumCheckRequest, PremiumCheckResponse
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import JSONResponse, Response
+from app.api.deps import (
+    get_cache,
+    get_resolver,
+    get_startup,
+    get_webhook_processor,
+    get_webhook_queue,
+    get_webhook_verifier,
+)
+from app.models.schemas import (
+    CheckEmail,
+    PremiumCheckBatchRequest,
+    PremiumCheckBatchResponse,
+    PremiumCheckRequest,
+    PremiumCheckResponse,
+    encode_check_response,
+)
+from app.db.cache_warmer import warmup_status
 from app.db.redis_cache import RedisCache
-from app.db.dynamodb import DynamoRepository
 from app.core.config import settings
-from app.integrations.paypal_client import PayPalClient
+from app.core.metrics import WEBHOOK_EVENTS
+from app.integrations.webhook_signature import CertificateUnavailable, WebhookSignatureError, WebhookVerifier
+from app.services.premium import DatabaseUnavailable, PremiumResolver
+from app.services.startup import StartupChecks
+from app.services.webhooks import WEBHOOK_HEADER_KEYS, WebhookProcessor, WebhookQueue
 
 router = APIRouter()
 
 
-@router.get("/health")
-async def health():
+@router.get("/live")
+async def live():
+    # Liveness: the worker's event loop answers; no dependencies are touched
     return {"status": "ok"}
 
 
-@router.post("/premium/check", response_model=PremiumCheckResponse)
-async def premium_check(payload: PremiumCheckRequest):
-    cache = RedisCache()
-    repo = DynamoRepository()
+@router.get("/ready")
+async def ready(cache: RedisCache = Depends(get_cache),
+                startup: StartupChecks = Depends(get_startup)):
+    # 503 until the table check and pool warm-up are done, then while the cache is warming,
+    # so the load balancer holds traffic back
+    body = await _status_body(cache, startup)
+    if body["status"] != "ok":
+        return JSONResponse(body, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return body
+
+
+@router.get("/health")
+async def health(cache: RedisCache = Depends(get_cache),
+                 startup: StartupChecks = Depends(get_startup)):
+    # Same report as /ready, but always 200: existing monitors read the status from the body
+    return await _status_body(cache, startup)
+
+
+async def _status_body(cache: RedisCache, startup: StartupChecks) -> dict:
+    body = {"status": "ok"}
+    if cache.l1 is not None:
+        # Per-worker L1 counters, useful for sizing L1_CACHE_MAX_ENTRIES / L1_CACHE_TTL_SECONDS
+        body["l1"] = cache.l1.stats()
+    body["startup"] = startup.status()
+    body["warmup"] = await warmup_status(cache)
+    if not startup.ready:
+        body["status"] = "starting"
+    elif not body["warmup"]["ready"]:
+        body["status"] = "warming"
+    return body
 
-    # Check cache first
-    cached = await cache.get_premium(payload.email)
-    if cached is not None:
-        return PremiumCheckResponse(email=payload.email, premium=cached, source="cache")
 
-    # Fallback to DB
+@router.post("/premium/check", response_model=PremiumCheckResponse)
+async def premium_check(payload: PremiumCheckRequest,
+                        resolver: PremiumResolver = Depends(get_resolver)):
+    # Cache first, then DB; concurrent misses for the same email share one DB read
     try:
-        premium = await repo.is_premium(payload.email)
-    except Exception:
+        premium, source = await resolver.resolve(payload.email)
+    except DatabaseUnavailable:
         # Upstream issue (AWS), surface as 503 for caller to decide retries
         raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Database unavailable")
+    return _check_response(payload.email, premium, source)
 
-    # Update cache (fire-and-forget)
-    try:
-        await cache.set_premium(payload.email, premium)
-    except Exception:
-        # Cache failure should not fail the request
-        pass
 
-    return PremiumCheckResponse(email=payload.email, premium=premium, source="db")
+@router.get("/premium/check", response_model=PremiumCheckResponse)
+async def premium_check_get(email: CheckEmail,
+                            resolver: PremiumResolver = Depends(get_resolver)):
+    try:
+        premium, source = await resolver.resolve(email)
+    except DatabaseUnavailable:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Database unavailable")
+    return _check_response(email, premium, source)
 
 
-@router.get("/premium/check", response_model=PremiumCheckResponse)
-async def premium_check_get(email: EmailStr):
-    cache = RedisCache()
-    repo = DynamoRepository()
+def _check_response(email: str, premium: bool, source: str):
+    if settings.premium_fast_path:
+        # Pre-encoded body: returning a Response skips response_model validation and serialization
+        return Response(encode_check_response(email, premium, source), media_type="application/json")
+    return PremiumCheckResponse(email=email, premium=premium, source=source)
 
-    cached = await cache.get_premium(email)
-    if cached is not None:
-        return PremiumCheckResponse(email=email, premium=cached, source="cache")
 
+@router.post("/premium/check/batch", response_model=PremiumCheckBatchResponse)
+async def premium_check_batch(payload: PremiumCheckBatchRequest,
+                              resolver: PremiumResolver = Depends(get_resolver)):
+    # Snapshot, then one pipelined cache read, then one BatchGetItem per 100 misses
     try:
-        premium = await repo.is_premium(email)
-    except Exception:
+        answers = await resolver.resolve_many(payload.emails)
+    except DatabaseUnavailable:
         raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Database unavailable")
-
-    try:
-        await cache.set_premium(email, premium)
-    except Exception:
-        pass
-
-    return PremiumCheckResponse(email=email, premium=premium, source="db")
+    results = []
+    for email in payload.emails:
+        premium, source = answers[email.lower()]
+        results.append(PremiumCheckResponse(email=email, premium=premium, source=source))
+    return PremiumCheckBatchResponse(results=results)
 
 
 @router.post("/webhooks/paypal")
-async def paypal_webhook(request: Request):
-    # Parse webhook, resolve payer email via order_id, and upsert into DynamoDB
+async def paypal_webhook(request: Request,
+                         processor: WebhookProcessor = Depends(get_webhook_processor),
+                         queue: Optional[WebhookQueue] = Depends(get_webhook_queue),
+                         verifier: Optional[WebhookVerifier] = Depends(get_webhook_verifier)):
+    # Queue the raw event for the consumers and acknowledge PayPal right away;
+    # process inline when queueing is disabled or Redis rejects the append
     try:
         raw = await request.body()
     except Exception:
         raw = b""
+    headers = {k: request.headers[k] for k in WEBHOOK_HEADER_KEYS if k in request.headers}
 
-    headers = dict(request.headers)
-    interesting_keys = [
-        "paypal-transmission-id",
-        "paypal-transmission-time",
-        "paypal-transmission-sig",
-        "paypal-cert-url",
-        "paypal-auth-algo",
-        "content-type",
-        "user-agent",
-    ]
-    interesting = {k: headers.get(k) for k in interesting_keys if k in headers}
-
-    body_text = raw.decode("utf-8", errors="replace")
-    if len(body_text) > 4000:
-        body_preview = body_text[:4000] + "…"
-    else:
-        body_preview = body_text
-
-    # print("[PayPal Webhook] method=", request.method, "url=", str(request.url))
-    # print("[PayPal Webhook] headers=", interesting)
-
-    # Try to detect event_type and parse JSON payload
-    event_type = None
-    try:
-        import json
-        payload = json.loads(body_text) if body_text else {}
-        event_type = payload.get("event_type")
-    except Exception:
-        payload = {}
-    print("[PayPal Webhook] event_type=", event_type)
-
-    # Extract order_id if present: resource.supplementary_data.related_ids.order_id
-    order_id = None
-    try:
-        order_id = (
-            payload.get("resource", {})
-                   .get("supplementary_data", {})
-                   .get("related_ids", {})
-                   .get("order_id")
-            if isinstance(payload, dict) else None
-        )
-        if isinstance(order_id, str) and order_id:
-            print("[PayPal Webhook] order_id=", order_id)
-    except Exception:
-        order_id = None
-
-    # Derive UTC date string YYYY-MM-DD from resource.create_time (fallback: today's UTC date)
-    from datetime import datetime, timezone
-    date_str = None
-    try:
-        r_create = (
-            payload.get("resource", {}).get("create_time")
-            if isinstance(payload, dict) else None
-        )
-        if isinstance(r_create, str) and r_create:
-            dt = None
-            try:
-                # canonical Z format
-                dt = datetime.strptime(r_create, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
-            except Exception:
-                try:
-                    # fallback: ISO8601 with offset
-                    dt = datetime.fromisoformat(r_create.replace("Z", "+00:00")).astimezone(timezone.utc)
-                except Exception:
-                    dt = None
-            if dt is not None:
-                date_str = dt.strftime("%Y-%m-%d")
-    except Exception:
-        date_str = None
-    if not date_str:
-        date_str = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-
-    # Resolve payer email: prefer order lookup; fallback to webhook payload
-    email = None
-    try:
-        if isinstance(order_id, str) and order_id:
-            client = PayPalClient()
-            email = client.get_payer_email_by_order_id(order_id)
-    except Exception:
-        email = None
-    if not email:
+    # Only events signed by PayPal for our webhook id are queued or applied
+    if verifier is not None:
         try:
-            email = (
-                payload.get("resource", {})
-                       .get("payer", {})
-                       .get("email_address")
-                if isinstance(payload, dict) else None
-            )
-        except Exception:
-            email = None
-
-    if not email or not isinstance(email, str):
-        print("[PayPal Webhook] No payer email found; skipping DB upsert")
-        return {"status": "ok", "skipped": True}
-
-    # Upsert into DynamoDB with timestamp
-    repo = DynamoRepository()
-    try:
-        if await repo.exists(email):
-            await repo.update_timestamp(email, date_str)
-            action = "updated"
-        else:
-            await repo.put_user_with_timestamp(email, True, date_str)
-            action = "created"
-    except Exception as e:
-        # Avoid failing the webhook; log and return ok
-        print("[PayPal Webhook] DynamoDB upsert failed:", repr(e))
-        return {"status": "ok", "error": "dynamodb"}
-
-    return {"status": "ok", "email": email, "date": date_str, "action": action}
+            await verifier.verify(raw, headers)
+        except WebhookSignatureError as e:
+            WEBHOOK_EVENTS.labels("invalid_signature").inc()
+            print("[PayPal Webhook] rejected:", e)
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid webhook signature")
+        except CertificateUnavailable as e:
+            # PayPal redelivers on non-2xx responses
+            print("[PayPal Webhook] could not verify:", e)
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail="Signing certificate unavailable")
+
+    if queue is not None:
+        try:
+            await queue.enqueue(raw, headers)
+            return {"status": "ok", "queued": True}
+        except Exception as e:
+            print("[PayPal Webhook] enqueue failed; processing inline:", repr(e))
+
+    return await processor.process(raw, headers)
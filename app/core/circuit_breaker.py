@@ -0,0 +1,120 @@
+"""Circuit breaker for async calls to a dependency (DynamoDB on the premium check path).
+
+closed     calls go through. `failure_threshold` consecutive failures open the breaker.
+           Calls slower than `latency_budget` count as failures even when they succeed,
+           and callers stop waiting after `timeout`, which also counts as a failure.
+open       calls fail immediately with CircuitOpen for `reset_seconds`.
+half-open  one trial call is let through. Success closes the breaker, failure reopens it,
+           and other calls keep failing fast meanwhile.
+
+A timed-out call is not interrupted: a blocking boto3 call keeps its executor thread until
+botocore's own timeouts end it. While the breaker is open no new calls are started, so
+threads do not pile up behind a slow dependency.
+
+Per worker and only touched from the event loop, so no locking.
+"""
+import asyncio
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from app.core.metrics import CIRCUIT_BREAKER_REJECTIONS, CIRCUIT_BREAKER_STATE
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+_STATE_VALUES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+
+class CircuitOpen(Exception):
+    """Raised instead of making a call while the breaker is open."""
+
+
+class CircuitBreaker:
+    def __init__(self,
+                 name: str,
+                 failure_threshold: int,
+                 reset_seconds: float,
+                 latency_budget: Optional[float] = None,
+                 timeout: Optional[float] = None,
+                 enabled: bool = True):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.latency_budget = latency_budget or None
+        self.timeout = timeout or None
+        self.enabled = enabled
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self._state_gauge = CIRCUIT_BREAKER_STATE.labels(name)
+        self._rejections = CIRCUIT_BREAKER_REJECTIONS.labels(name)
+        self._state_gauge.set(0)
+
+    @property
+    def is_open(self) -> bool:
+        """True while calls would be rejected (open and not yet due for a trial)."""
+        if not self.enabled or self.state == CLOSED:
+            return False
+        if self.state == OPEN:
+            return time.monotonic() - self.opened_at < self.reset_seconds
+        return self._trial_running
+
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            print(f"[CircuitBreaker] {self.name}: {self.state} -> {state}")
+            self.state = state
+            self._state_gauge.set(_STATE_VALUES[state])
+
+    def _admit(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.reset_seconds:
+                return False
+            self._set_state(HALF_OPEN)
+        if self._trial_running:
+            return False
+        self._trial_running = True
+        return True
+
+    def _on_success(self) -> None:
+        self.failures = 0
+        self._set_state(CLOSED)
+
+    def _on_failure(self) -> None:
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._set_state(OPEN)
+
+    async def call(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """Await `fn()` under the breaker; raises CircuitOpen, asyncio.TimeoutError or fn's error."""
+        if not self.enabled:
+            return await fn()
+        if not self._admit():
+            self._rejections.inc()
+            raise CircuitOpen(f"{self.name} circuit open")
+        trial = self.state == HALF_OPEN
+        started = time.monotonic()
+        try:
+            if self.timeout is not None:
+                result = await asyncio.wait_for(fn(), self.timeout)
+            else:
+                result = await fn()
+        except asyncio.CancelledError:
+            # The caller went away; says nothing about the dependency
+            raise
+        except Exception:
+            self._on_failure()
+            raise
+        finally:
+            if trial:
+                self._trial_running = False
+        if self.latency_budget is not None and time.monotonic() - started > self.latency_budget:
+            self._on_failure()
+        else:
+            self._on_success()
+        return result
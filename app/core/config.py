@@ -18,19 +18,185 @@ class Settings(BaseSettings):
 
     # API
     api_prefix: str = Field(default="/v1", validation_alias="API_PREFIX")
+    # Upper bound on emails accepted by POST /premium/check/batch
+    premium_batch_max_emails: int = Field(default=1000, validation_alias="PREMIUM_BATCH_MAX_EMAILS")
+    # Check routes: regex email normalization (full email-validator parse only for unusual
+    # addresses), memoized per worker, and pre-encoded JSON bodies; same responses as EmailStr
+    premium_fast_path: bool = Field(default=True, validation_alias="PREMIUM_FAST_PATH")
+    premium_email_memo_size: int = Field(default=4096, validation_alias="PREMIUM_EMAIL_MEMO_SIZE")
+
+    # Line-protocol lookup server for co-located callers (app/api/lookup_server.py), off unless a
+    # port or socket path is set. Every worker binds the TCP port (SO_REUSEPORT); the Unix socket
+    # is served by one worker at a time
+    lookup_tcp_host: str = Field(default="127.0.0.1", validation_alias="LOOKUP_TCP_HOST")
+    lookup_tcp_port: int = Field(default=0, validation_alias="LOOKUP_TCP_PORT")
+    lookup_unix_socket: Optional[str] = Field(default=None, validation_alias="LOOKUP_UNIX_SOCKET")
+    # Pipelined lines are answered together, up to this many emails per resolve round
+    lookup_max_batch: int = Field(default=1000, validation_alias="LOOKUP_MAX_BATCH")
+    lookup_max_line_bytes: int = Field(default=65536, validation_alias="LOOKUP_MAX_LINE_BYTES")
+
+    # Prometheus metrics on GET /metrics (not under API_PREFIX). With several uvicorn workers,
+    # set PROMETHEUS_MULTIPROC_DIR to an empty directory so every worker's samples are merged
+    metrics_enabled: bool = Field(default=True, validation_alias="METRICS_ENABLED")
+
+    # Startup (app/services/startup.py): the DynamoDB table check runs once per deployment,
+    # i.e. once per STARTUP_TABLE_CHECK_TTL_SECONDS across all workers (Redis lock + marker);
+    # GET /ready stays 503 until it is done and this many pooled connections are open
+    startup_table_check_ttl_seconds: int = Field(default=6 * 3600, validation_alias="STARTUP_TABLE_CHECK_TTL_SECONDS")
+    startup_warm_connections: int = Field(default=4, validation_alias="STARTUP_WARM_CONNECTIONS")
 
     # Redis
     redis_url: str = Field(default="redis://redis:6379/0", validation_alias="REDIS_URL")
     redis_ttl_seconds: int = Field(default=3600, validation_alias="REDIS_TTL_SECONDS")
+    # Connection pool shared by all requests in a worker process
+    redis_max_connections: int = Field(default=64, validation_alias="REDIS_MAX_CONNECTIONS")
+    redis_socket_timeout: float = Field(default=2.0, validation_alias="REDIS_SOCKET_TIMEOUT")
+    redis_socket_connect_timeout: float = Field(default=2.0, validation_alias="REDIS_SOCKET_CONNECT_TIMEOUT")
+    redis_socket_keepalive: bool = Field(default=True, validation_alias="REDIS_SOCKET_KEEPALIVE")
+    redis_health_check_interval: int = Field(default=30, validation_alias="REDIS_HEALTH_CHECK_INTERVAL")
+    # Storage layout for premium flags: "keys" (premium:<email>) or "buckets" (digests packed
+    # into REDIS_BUCKET_COUNT hashes); see app/db/cache_layout.py and scripts/migrate_cache_layout.py
+    redis_cache_layout: str = Field(default="keys", validation_alias="REDIS_CACHE_LAYOUT")
+    redis_bucket_count: int = Field(default=65536, validation_alias="REDIS_BUCKET_COUNT")
+    # "field" (HPEXPIRE, Redis >= 7.4), "embedded" (expiry stored in the value) or "auto"
+    redis_bucket_expiry: str = Field(default="auto", validation_alias="REDIS_BUCKET_EXPIRY")
+
+    # Stale-while-revalidate: flags stay in Redis REDIS_STALE_GRACE_SECONDS past REDIS_TTL_SECONDS.
+    # In that window the check routes answer from the stale entry and reload it in the background
+    redis_stale_grace_seconds: int = Field(default=3600, validation_alias="REDIS_STALE_GRACE_SECONDS")
+
+    # In-process L1 cache in front of Redis (per worker), invalidated over Redis pub/sub
+    l1_cache_enabled: bool = Field(default=True, validation_alias="L1_CACHE_ENABLED")
+    l1_cache_max_entries: int = Field(default=10000, validation_alias="L1_CACHE_MAX_ENTRIES")
+    l1_cache_ttl_seconds: float = Field(default=30.0, validation_alias="L1_CACHE_TTL_SECONDS")
+    l1_invalidation_channel: str = Field(default="premium-invalidate", validation_alias="L1_INVALIDATION_CHANNEL")
+
+    # Premium check path: single-flight DB loads and probabilistic early refresh (XFetch)
+    # Cross-worker lock: a short Redis lock so only one worker reloads a key from DynamoDB
+    premium_lock_enabled: bool = Field(default=False, validation_alias="PREMIUM_LOCK_ENABLED")
+    premium_lock_ttl_ms: int = Field(default=2000, validation_alias="PREMIUM_LOCK_TTL_MS")
+    premium_lock_wait_ms: int = Field(default=500, validation_alias="PREMIUM_LOCK_WAIT_MS")
+    # Refresh when now - beta * db_latency * ln(rand()) passes the key's expiry; beta > 1 refreshes earlier
+    premium_early_refresh_enabled: bool = Field(default=True, validation_alias="PREMIUM_EARLY_REFRESH_ENABLED")
+    premium_early_refresh_beta: float = Field(default=1.0, validation_alias="PREMIUM_EARLY_REFRESH_BETA")
+
+    # Subscription expiry: premium lasts PREMIUM_PERIOD_DAYS from the purchase day (0 = forever).
+    # Items get a DynamoDB TTL attribute plus an expiry-day index swept by scripts/sweep_expired.py,
+    # and cached flags never outlive the entitlement
+    premium_period_days: int = Field(default=0, validation_alias="PREMIUM_PERIOD_DAYS")
+    # Kept outside the premium:* cache namespace, which scripts/migrate_cache_layout.py scans and deletes
+    premium_sweep_checkpoint_key: str = Field(default="sweep:premium:day", validation_alias="PREMIUM_SWEEP_CHECKPOINT_KEY")
+    premium_sweep_initial_lookback_days: int = Field(default=7, validation_alias="PREMIUM_SWEEP_INITIAL_LOOKBACK_DAYS")
+
+    # Memory-mapped premium-set snapshot (sorted email hashes + Bloom filter) for negative lookups.
+    # Disabled unless SNAPSHOT_PATH is set; rebuilt by scripts/build_premium_snapshot.py
+    snapshot_path: Optional[str] = Field(default=None, validation_alias="SNAPSHOT_PATH")
+    snapshot_false_positive_rate: float = Field(default=0.01, validation_alias="SNAPSHOT_FALSE_POSITIVE_RATE")
+    snapshot_reload_interval_seconds: float = Field(default=30.0, validation_alias="SNAPSHOT_RELOAD_INTERVAL_SECONDS")
+
+    # Cache warm-up: preload premium:<email> for every table row (one worker per deployment)
+    cache_warm_on_startup: bool = Field(default=False, validation_alias="CACHE_WARM_ON_STARTUP")
+    cache_warm_segments: int = Field(default=4, validation_alias="CACHE_WARM_SEGMENTS")
+    cache_warm_batch_size: int = Field(default=500, validation_alias="CACHE_WARM_BATCH_SIZE")
+    # Warmed TTLs are spread over REDIS_TTL_SECONDS * (1 +/- jitter)
+    cache_warm_ttl_jitter: float = Field(default=0.2, validation_alias="CACHE_WARM_TTL_JITTER")
+    cache_warm_progress_key: str = Field(default="cache:warm", validation_alias="CACHE_WARM_PROGRESS_KEY")
+    # /ready reports 503 while warming until this fraction is loaded or the Redis hit ratio is reached
+    cache_warm_ready_ratio: float = Field(default=0.95, validation_alias="CACHE_WARM_READY_RATIO")
+    cache_warm_ready_hit_ratio: float = Field(default=0.9, validation_alias="CACHE_WARM_READY_HIT_RATIO")
 
     # AWS / DynamoDB
     aws_region: str = Field(default="us-east-1", validation_alias="AWS_REGION")
     dynamodb_table: str = Field(default="paypal_premium_users", validation_alias="DYNAMODB_TABLE")
+    # botocore HTTP connection pool shared by all requests in a worker process
+    dynamodb_max_pool_connections: int = Field(default=64, validation_alias="DYNAMODB_MAX_POOL_CONNECTIONS")
+    dynamodb_connect_timeout: float = Field(default=2.0, validation_alias="DYNAMODB_CONNECT_TIMEOUT")
+    dynamodb_read_timeout: float = Field(default=5.0, validation_alias="DYNAMODB_READ_TIMEOUT")
+    dynamodb_tcp_keepalive: bool = Field(default=True, validation_alias="DYNAMODB_TCP_KEEPALIVE")
+    dynamodb_max_attempts: int = Field(default=3, validation_alias="DYNAMODB_MAX_ATTEMPTS")
+    # How async callers reach DynamoDB:
+    #   "executor"   - dedicated thread pool sized by DYNAMODB_EXECUTOR_WORKERS (default)
+    #   "aiobotocore" - native async reads (requires `pip install aiobotocore`); writes use the executor
+    #   "thread"     - asyncio.to_thread on the loop's default pool (legacy fallback)
+    dynamodb_backend: str = Field(default="executor", validation_alias="DYNAMODB_BACKEND")
+    dynamodb_executor_workers: int = Field(default=64, validation_alias="DYNAMODB_EXECUTOR_WORKERS")
+    # Strongly consistent reads cost 2x RCU; eventually consistent is fine for a cache-backed check
+    dynamodb_consistent_read: bool = Field(default=False, validation_alias="DYNAMODB_CONSISTENT_READ")
+    # Circuit breaker for DynamoDB reads on the check path: opens after N consecutive failures
+    # (errors, calls over the latency budget, or callers giving up after the timeout) and fails
+    # fast for DYNAMODB_BREAKER_RESET_SECONDS before letting one trial call through
+    dynamodb_breaker_enabled: bool = Field(default=True, validation_alias="DYNAMODB_BREAKER_ENABLED")
+    dynamodb_breaker_failure_threshold: int = Field(default=5, validation_alias="DYNAMODB_BREAKER_FAILURE_THRESHOLD")
+    dynamodb_breaker_reset_seconds: float = Field(default=10.0, validation_alias="DYNAMODB_BREAKER_RESET_SECONDS")
+    dynamodb_breaker_latency_budget_ms: int = Field(default=500, validation_alias="DYNAMODB_BREAKER_LATENCY_BUDGET_MS")
+    dynamodb_breaker_timeout_ms: int = Field(default=2000, validation_alias="DYNAMODB_BREAKER_TIMEOUT_MS")
+    # Retries of UnprocessedKeys/UnprocessedItems returned by batch operations
+    dynamodb_batch_max_retries: int = Field(default=5, validation_alias="DYNAMODB_BATCH_MAX_RETRIES")
+    # Consecutive throttles one call of a table-wide job (app/db/scan.py) may absorb before the job fails;
+    # the shared backoff tops out at 10s, so the default allows a few minutes of throttling
+    dynamodb_scan_max_throttle_retries: int = Field(default=30, validation_alias="DYNAMODB_SCAN_MAX_THROTTLE_RETRIES")
 
     # PayPal
     paypal_client_id: Optional[str] = Field(default=None, validation_alias="PAYPAL_CLIENT_ID")
     paypal_client_secret: Optional[str] = Field(default=None, validation_alias="PAYPAL_CLIENT_SECRET")
     paypal_base_url: str = Field(default="https://api-m.sandbox.paypal.com", validation_alias="PAYPAL_BASE_URL")
+    # Webhook signatures are verified locally against PayPal's signing certificate when the
+    # webhook id is set; certificates are only downloaded from these hosts (or origins)
+    paypal_webhook_id: Optional[str] = Field(default=None, validation_alias="PAYPAL_WEBHOOK_ID")
+    paypal_webhook_cert_hosts: str = Field(
+        default="api.paypal.com,api-m.paypal.com,api.sandbox.paypal.com,api-m.sandbox.paypal.com",
+        validation_alias="PAYPAL_WEBHOOK_CERT_HOSTS",
+    )
+    paypal_webhook_cert_cache_size: int = Field(default=16, validation_alias="PAYPAL_WEBHOOK_CERT_CACHE_SIZE")
+    # Webhook ingestion: POST /webhooks/paypal appends to a Redis Stream, consumers process it
+    webhook_queue_enabled: bool = Field(default=True, validation_alias="WEBHOOK_QUEUE_ENABLED")
+    webhook_stream: str = Field(default="paypal:webhooks", validation_alias="WEBHOOK_STREAM")
+    webhook_stream_maxlen: int = Field(default=100000, validation_alias="WEBHOOK_STREAM_MAXLEN")
+    webhook_consumer_group: str = Field(default="webhook-processors", validation_alias="WEBHOOK_CONSUMER_GROUP")
+    # Consumer tasks per API worker (0 = run scripts/webhook_consumer.py instead)
+    webhook_consumers: int = Field(default=1, validation_alias="WEBHOOK_CONSUMERS")
+    webhook_batch_size: int = Field(default=16, validation_alias="WEBHOOK_BATCH_SIZE")
+    webhook_block_ms: int = Field(default=1000, validation_alias="WEBHOOK_BLOCK_MS")
+    webhook_reclaim_idle_ms: int = Field(default=60000, validation_alias="WEBHOOK_RECLAIM_IDLE_MS")
+    webhook_max_deliveries: int = Field(default=5, validation_alias="WEBHOOK_MAX_DELIVERIES")
+    webhook_processing_ttl_seconds: int = Field(default=300, validation_alias="WEBHOOK_PROCESSING_TTL_SECONDS")
+    webhook_dedupe_ttl_seconds: int = Field(default=7 * 24 * 3600, validation_alias="WEBHOOK_DEDUPE_TTL_SECONDS")
+
+    # Pooled async HTTP client used by the API process (httpx, HTTP/2 when the server offers it)
+    paypal_http2: bool = Field(default=True, validation_alias="PAYPAL_HTTP2")
+    paypal_http_max_connections: int = Field(default=20, validation_alias="PAYPAL_HTTP_MAX_CONNECTIONS")
+    paypal_http_timeout: float = Field(default=10.0, validation_alias="PAYPAL_HTTP_TIMEOUT")
+    # Share the OAuth token through Redis so every worker and cron script reuses one token
+    paypal_token_cache_enabled: bool = Field(default=True, validation_alias="PAYPAL_TOKEN_CACHE_ENABLED")
+    # Cluster-wide PayPal request budgets: Redis token buckets shared by every worker and script,
+    # per endpoint and for the whole app (requests/second, 0 = unlimited), each holding
+    # PAYPAL_RATE_BURST_SECONDS of tokens. Bulk callers (sync, cron scripts) leave
+    # PAYPAL_RATE_WEBHOOK_RESERVE of every bucket to the webhook path
+    paypal_rate_limit_enabled: bool = Field(default=True, validation_alias="PAYPAL_RATE_LIMIT_ENABLED")
+    paypal_rate_global_per_second: float = Field(default=30.0, validation_alias="PAYPAL_RATE_GLOBAL_PER_SECOND")
+    paypal_rate_oauth_per_second: float = Field(default=1.0, validation_alias="PAYPAL_RATE_OAUTH_PER_SECOND")
+    paypal_rate_reporting_per_second: float = Field(default=5.0, validation_alias="PAYPAL_RATE_REPORTING_PER_SECOND")
+    paypal_rate_orders_per_second: float = Field(default=20.0, validation_alias="PAYPAL_RATE_ORDERS_PER_SECOND")
+    paypal_rate_burst_seconds: float = Field(default=2.0, validation_alias="PAYPAL_RATE_BURST_SECONDS")
+    paypal_rate_webhook_reserve: float = Field(default=0.3, validation_alias="PAYPAL_RATE_WEBHOOK_RESERVE")
+    paypal_rate_max_wait_seconds: float = Field(default=30.0, validation_alias="PAYPAL_RATE_MAX_WAIT_SECONDS")
+    # 429 answers are retried after Retry-After, or a jittered exponential backoff without one
+    paypal_max_retries: int = Field(default=3, validation_alias="PAYPAL_MAX_RETRIES")
+    paypal_backoff_base_seconds: float = Field(default=0.5, validation_alias="PAYPAL_BACKOFF_BASE_SECONDS")
+    paypal_backoff_max_seconds: float = Field(default=30.0, validation_alias="PAYPAL_BACKOFF_MAX_SECONDS")
+    # Webhook order_id -> payer email answers kept in Redis (0 disables); an order's payer never
+    # changes. "Not found" is kept briefly, since a new order can 404 for a moment
+    paypal_order_cache_ttl_seconds: int = Field(default=30 * 24 * 3600, validation_alias="PAYPAL_ORDER_CACHE_TTL_SECONDS")
+    paypal_order_negative_ttl_seconds: int = Field(default=600, validation_alias="PAYPAL_ORDER_NEGATIVE_TTL_SECONDS")
+    # Transaction sync (scripts/paypal_fetch_hourly_transactions.py): time slices fetched in parallel,
+    # every page followed, high-water mark kept in Redis
+    paypal_sync_slice_minutes: int = Field(default=60, validation_alias="PAYPAL_SYNC_SLICE_MINUTES")
+    paypal_sync_concurrency: int = Field(default=4, validation_alias="PAYPAL_SYNC_CONCURRENCY")
+    paypal_sync_requests_per_second: float = Field(default=5.0, validation_alias="PAYPAL_SYNC_REQUESTS_PER_SECOND")
+    paypal_sync_page_size: int = Field(default=500, validation_alias="PAYPAL_SYNC_PAGE_SIZE")
+    paypal_sync_overlap_minutes: int = Field(default=180, validation_alias="PAYPAL_SYNC_OVERLAP_MINUTES")
+    paypal_sync_initial_lookback_hours: int = Field(default=24, validation_alias="PAYPAL_SYNC_INITIAL_LOOKBACK_HOURS")
+    paypal_sync_checkpoint_key: str = Field(default="paypal:sync:hwm", validation_alias="PAYPAL_SYNC_CHECKPOINT_KEY")
     # Note: Timestamp offset is determined in code using ZoneInfo("America/New_York").
 
 
@@ -0,0 +1,82 @@
+"""Cheap email normalization for the premium check routes (PREMIUM_FAST_PATH).
+
+pydantic's EmailStr runs the full email-validator parse on every request. Nearly all real
+addresses are plain ASCII (`local@sub.domain.tld`), for which email-validator's answer is
+simply the address with the domain lowercased. Those are recognized with one regex; any
+other input (quoted or Unicode local parts, IDNA, "Name <addr>" forms, whitespace,
+special-use domains, mailbox names email-validator lowercases, invalid input) goes through
+pydantic's own validate_email, so results and error messages are exactly EmailStr's.
+
+Recent results are memoized in a small LRU so repeat lookups skip even the regex.
+"""
+import re
+from collections import OrderedDict
+from typing import Optional
+
+from email_validator import SPECIAL_USE_DOMAIN_NAMES
+from email_validator.rfc_constants import CASE_INSENSITIVE_MAILBOX_NAMES
+from pydantic.networks import validate_email
+
+from app.core.config import settings
+
+# email-validator limits (octets; the fast path is ASCII only, so characters == octets)
+EMAIL_MAX_LENGTH = 254
+LOCAL_PART_MAX_LENGTH = 64
+DNS_LABEL_MAX_LENGTH = 63
+
+# Dot-atom local part over a common subset of atext; domain of two or more hostname labels
+# whose TLD ends with a letter. Labels with "--" (Punycode, "ab--c") are left to the full path.
+_SIMPLE_EMAIL = re.compile(
+    r"([A-Za-z0-9_%+\-]+(?:\.[A-Za-z0-9_%+\-]+)*)"
+    r"@((?:[A-Za-z0-9](?:[A-Za-z0-9\-]*[A-Za-z0-9])?\.)+(?:[A-Za-z0-9][A-Za-z0-9\-]*)?[A-Za-z])"
+)
+_MAILBOX_NAMES = frozenset(CASE_INSENSITIVE_MAILBOX_NAMES)
+_SPECIAL_USE_SUFFIXES = tuple("." + d for d in SPECIAL_USE_DOMAIN_NAMES)
+
+
+def fast_normalize(value: str) -> Optional[str]:
+    """EmailStr's normalized form of `value` if it is a plain ASCII address, else None."""
+    if len(value) > EMAIL_MAX_LENGTH:
+        return None
+    m = _SIMPLE_EMAIL.fullmatch(value)
+    if m is None:
+        return None
+    local, domain = m.groups()
+    if len(local) > LOCAL_PART_MAX_LENGTH or local.lower() in _MAILBOX_NAMES:
+        return None
+    domain = domain.lower()
+    if "--" in domain or domain.endswith(_SPECIAL_USE_SUFFIXES):
+        return None
+    if any(len(label) > DNS_LABEL_MAX_LENGTH for label in domain.split(".")):
+        return None
+    return f"{local}@{domain}"
+
+
+class EmailNormalizer:
+    """Memoized EmailStr-equivalent validation; raises pydantic's error for invalid input.
+
+    Only touched from the event loop (request validation), so no locking.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._memo: "OrderedDict[str, str]" = OrderedDict()
+
+    def __call__(self, value: str) -> str:
+        memo = self._memo
+        hit = memo.get(value)
+        if hit is not None:
+            memo.move_to_end(value)
+            return hit
+        normalized = fast_normalize(value)
+        if normalized is None:
+            # Full parse; raises the same PydanticCustomError as EmailStr
+            normalized = validate_email(value)[1]
+        if self.max_entries > 0:
+            memo[value] = normalized
+            if len(memo) > self.max_entries:
+                memo.popitem(last=False)
+        return normalized
+
+
+normalize_email = EmailNormalizer(settings.premium_email_memo_size)
@@ -0,0 +1,189 @@
+"""Prometheus metrics for the API process (served on GET /metrics).
+
+Under uvicorn with several workers, set PROMETHEUS_MULTIPROC_DIR to an empty directory
+before the workers start (entrypoint.sh does): every worker then writes its samples to
+mmap'd files there and /metrics merges them, so whichever worker answers the scrape
+reports totals for the whole deployment. Gauges are summed over live workers.
+
+Without the variable, metrics are per process (fine for a single worker or a script).
+"""
+import asyncio
+import os
+import time
+from typing import Any, Callable, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+
+# Seconds; from sub-millisecond L1/Redis reads up to PayPal and DynamoDB timeouts
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Webhook receipt to applied, including time spent queued on the stream
+WEBHOOK_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests being handled", multiprocess_mode="livesum",
+)
+REDIS_SECONDS = Histogram(
+    "redis_operation_seconds", "RedisCache round trips (one pipeline each)", ["op"], buckets=LATENCY_BUCKETS,
+)
+DYNAMODB_SECONDS = Histogram(
+    "dynamodb_operation_seconds", "DynamoRepository calls, excluding executor queueing",
+    ["op"], buckets=LATENCY_BUCKETS,
+)
+EXECUTOR_WAIT_SECONDS = Histogram(
+    "executor_wait_seconds", "Time blocking calls waited for a free executor thread",
+    ["executor"], buckets=LATENCY_BUCKETS,
+)
+EXECUTOR_QUEUE_DEPTH = Gauge(
+    "executor_queue_depth", "Blocking calls waiting for a free executor thread",
+    ["executor"], multiprocess_mode="livesum",
+)
+PAYPAL_SECONDS = Histogram(
+    "paypal_request_seconds", "PayPal REST calls by operation and HTTP status ('error' when no response)",
+    ["op", "status"], buckets=LATENCY_BUCKETS,
+)
+CACHE_LOOKUPS = Counter(
+    "cache_lookups_total", "Premium flag lookups by cache layer and result", ["layer", "result"],
+)
+PREMIUM_CHECKS = Counter(
+    "premium_checks_total", "Premium check answers by source", ["source"],
+)
+WEBHOOK_SECONDS = Histogram(
+    "webhook_processing_seconds", "Webhook receipt to applied ('queue' includes time on the stream)",
+    ["mode"], buckets=WEBHOOK_BUCKETS,
+)
+WEBHOOK_EVENTS = Counter(
+    "webhook_events_total", "Webhook events by outcome", ["outcome"],
+)
+PAYPAL_ORDER_LOOKUPS = Counter(
+    "paypal_order_lookups_total",
+    "Webhook payer email resolutions: payload, cache (hit or negative hit), coalesced or remote",
+    ["result"],
+)
+PAYPAL_LIMITER_WAIT_SECONDS = Histogram(
+    "paypal_limiter_wait_seconds", "Time PayPal calls waited for the shared request budget",
+    ["endpoint", "priority"], buckets=LATENCY_BUCKETS + (30.0,),
+)
+PAYPAL_RATE_LIMITED = Counter(
+    "paypal_rate_limited_total", "429 answers from PayPal by endpoint", ["endpoint"],
+)
+CIRCUIT_BREAKER_STATE = Gauge(
+    "circuit_breaker_state", "0 closed, 1 open, 2 half-open (highest over live workers)",
+    ["name"], multiprocess_mode="livemax",
+)
+CIRCUIT_BREAKER_REJECTIONS = Counter(
+    "circuit_breaker_rejections_total", "Calls failed fast because the breaker was open", ["name"],
+)
+STALE_SERVED = Counter(
+    "cache_stale_served_total", "Cached flags served past their soft TTL while being refreshed",
+)
+
+# Pre-bound children for the per-request paths
+L1_HIT = CACHE_LOOKUPS.labels("l1", "hit")
+L1_MISS = CACHE_LOOKUPS.labels("l1", "miss")
+REDIS_HIT = CACHE_LOOKUPS.labels("redis", "hit")
+REDIS_MISS = CACHE_LOOKUPS.labels("redis", "miss")
+CHECK_SOURCES = {s: PREMIUM_CHECKS.labels(s) for s in ("snapshot", "cache", "db")}
+
+
+def multiprocess_enabled() -> bool:
+    return bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR") or os.environ.get("prometheus_multiproc_dir"))
+
+
+def render() -> Tuple[bytes, str]:
+    """Exposition text for every worker (multiprocess) or this process; returns (body, content type)."""
+    if multiprocess_enabled():
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead() -> None:
+    """Drop this worker's live gauges from the shared files (call on worker shutdown)."""
+    if multiprocess_enabled():
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(os.getpid())
+
+
+async def run_in_executor(executor: Any, label: str, histogram: Histogram, op: str,
+                          fn: Callable[..., Any], *args: Any) -> Any:
+    """Run a blocking call on `executor` (None = the loop's default) with queue-depth and latency metrics.
+
+    The queue gauge counts calls submitted but not yet started; a call cancelled before it
+    starts is taken off the gauge here, since it never runs.
+    """
+    depth = EXECUTOR_QUEUE_DEPTH.labels(label)
+    waited = EXECUTOR_WAIT_SECONDS.labels(label)
+    timer = histogram.labels(op)
+    submitted = time.perf_counter()
+    pending = [True]  # popped exactly once, by whichever side gets there first (list.pop is atomic)
+
+    def call() -> Any:
+        try:
+            pending.pop()
+        except IndexError:
+            return None
+        depth.dec()
+        started = time.perf_counter()
+        waited.observe(started - submitted)
+        try:
+            return fn(*args)
+        finally:
+            timer.observe(time.perf_counter() - started)
+
+    depth.inc()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(executor, call)
+    finally:
+        try:
+            pending.pop()
+        except IndexError:
+            pass
+        else:
+            depth.dec()
+
+
+class MetricsMiddleware:
+    """ASGI middleware: in-flight gauge and latency per route template (not per raw path)."""
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: Any, receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = [500]
+
+        async def send_wrapper(message: Any) -> None:
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # FastAPI stores the matched route in the scope; unmatched paths share one label
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.labels(
+                scope["method"], getattr(route, "path", "unmatched"), str(status[0]),
+            ).observe(time.perf_counter() - started)
@@ -0,0 +1,140 @@
+"""Redis storage layouts for premium flags.
+
+RedisCache (and the sync cache warmer) never build premium keys themselves; they ask a
+layout to queue the commands for a read or a write on a pipeline and to parse the replies.
+Pipelines of redis.Redis and redis.asyncio.Redis queue commands the same way, so one
+layout serves both clients.
+
+- KeyLayout ("keys"): one string key `premium:<email>` = "1"/"0" with a TTL. Simple and
+  readable with redis-cli, but every key costs ~60-90 bytes of overhead plus the email.
+- BucketLayout ("buckets"): the lowercased email is hashed to a 12-byte blake2b digest.
+  The first 4 bytes pick one of REDIS_BUCKET_COUNT hashes `pb:<bucket>`, the last 8 bytes
+  are the (binary) field. Buckets stay small enough for Redis' listpack encoding
+  (hash-max-listpack-entries, default 128) when the bucket count is about emails / 100.
+  Expiry is per field:
+    * "field" (Redis >= 7.4): value "1"/"0", expiry via HPEXPIRE, TTL via HPTTL.
+    * "embedded": value "<flag><unix expiry seconds>", checked on read; the bucket key
+      itself expires with its longest-lived field (writes only ever extend the key's TTL,
+      so a short-TTL write never evicts its neighbours). Expired fields that are never
+      read again are removed by `scripts/migrate_cache_layout.py --prune`.
+  Readers understand both value formats, so switching the expiry mode needs no migration.
+"""
+import hashlib
+import time
+from typing import Any, List, Optional, Tuple
+
+from app.core.config import settings
+
+KEY_PREFIX = "premium:"
+BUCKET_PREFIX = "pb:"
+# Redis 7.4 added hash field expiration (HEXPIRE/HPEXPIRE/HPTTL)
+FIELD_EXPIRY_MIN_VERSION = (7, 4)
+# PEXPIRE that only ever extends (EXPIRE ... GT needs Redis 7.0; this works on any version).
+# A key without a TTL gets one, since every bucket write sets an expiry
+_EXTEND_PEXPIRE = (
+    "local t = redis.call('pttl', KEYS[1]) "
+    "if t < tonumber(ARGV[1]) then redis.call('pexpire', KEYS[1], ARGV[1]) end return 0"
+)
+
+
+class KeyLayout:
+    name = "keys"
+
+    def read_width(self, with_ttl: bool) -> int:
+        return 2 if with_ttl else 1
+
+    def queue_read(self, pipe: Any, email: str, with_ttl: bool = False) -> None:
+        pipe.get(f"{KEY_PREFIX}{email}")
+        if with_ttl:
+            pipe.pttl(f"{KEY_PREFIX}{email}")
+
+    def parse_read(self, replies: List[Any], with_ttl: bool = False) -> Tuple[Optional[bool], Optional[int]]:
+        val = replies[0]
+        if val is None:
+            return None, None
+        ttl = replies[1] if with_ttl else None
+        return val == "1", (ttl if ttl is not None and ttl >= 0 else None)
+
+    def queue_write(self, pipe: Any, email: str, premium: bool, ttl_seconds: int) -> None:
+        pipe.setex(f"{KEY_PREFIX}{email}", ttl_seconds, "1" if premium else "0")
+
+
+class BucketLayout:
+    name = "buckets"
+
+    def __init__(self, bucket_count: int, field_expiry: bool):
+        self.bucket_count = bucket_count
+        self.field_expiry = field_expiry
+
+    def locate(self, email: str) -> Tuple[str, bytes]:
+        digest = hashlib.blake2b(email.encode("utf-8"), digest_size=12).digest()
+        bucket = int.from_bytes(digest[:4], "big") % self.bucket_count
+        return f"{BUCKET_PREFIX}{bucket:x}", digest[4:]
+
+    def read_width(self, with_ttl: bool) -> int:
+        return 2 if with_ttl and self.field_expiry else 1
+
+    def queue_read(self, pipe: Any, email: str, with_ttl: bool = False) -> None:
+        key, field = self.locate(email)
+        pipe.hget(key, field)
+        if with_ttl and self.field_expiry:
+            pipe.execute_command("HPTTL", key, "FIELDS", 1, field)
+
+    def parse_read(self, replies: List[Any], with_ttl: bool = False) -> Tuple[Optional[bool], Optional[int]]:
+        val = replies[0]
+        if val is None:
+            return None, None
+        if len(val) > 1:
+            # Embedded expiry: "<flag><expires_at>"
+            remaining_ms = (int(val[1:]) - time.time()) * 1000
+            if remaining_ms <= 0:
+                return None, None
+            return val[0] == "1", int(remaining_ms)
+        ttl = None
+        if with_ttl and self.field_expiry:
+            ttls = replies[1] or [None]
+            ttl = ttls[0] if ttls[0] is not None and ttls[0] >= 0 else None
+        return val == "1", ttl
+
+    def queue_write(self, pipe: Any, email: str, premium: bool, ttl_seconds: int) -> None:
+        key, field = self.locate(email)
+        flag = "1" if premium else "0"
+        if self.field_expiry:
+            pipe.hset(key, field, flag)
+            pipe.execute_command("HPEXPIRE", key, ttl_seconds * 1000, "FIELDS", 1, field)
+        else:
+            pipe.hset(key, field, f"{flag}{int(time.time()) + ttl_seconds}")
+            # Drop the whole bucket once its longest-lived field has expired: extend, never shorten
+            pipe.eval(_EXTEND_PEXPIRE, 1, key, ttl_seconds * 1000)
+
+
+def parse_version(info: dict) -> Tuple[int, ...]:
+    raw = str(info.get("redis_version") or "0")
+    parts = []
+    for piece in raw.split(".")[:3]:
+        try:
+            parts.append(int(piece))
+        except ValueError:
+            break
+    return tuple(parts)
+
+
+def make_bucket_layout(server_info: Optional[dict] = None) -> BucketLayout:
+    """BucketLayout from settings; `server_info` (INFO server) decides REDIS_BUCKET_EXPIRY=auto."""
+    mode = settings.redis_bucket_expiry
+    if mode == "auto":
+        field_expiry = server_info is not None and parse_version(server_info) >= FIELD_EXPIRY_MIN_VERSION
+    else:
+        field_expiry = mode == "field"
+    return BucketLayout(settings.redis_bucket_count, field_expiry)
+
+
+def make_layout(server_info: Optional[dict] = None):
+    """Layout selected by REDIS_CACHE_LAYOUT."""
+    if settings.redis_cache_layout != "buckets":
+        return KeyLayout()
+    return make_bucket_layout(server_info)
+
+
+def needs_server_info() -> bool:
+    return settings.redis_cache_layout == "buckets" and settings.redis_bucket_expiry == "auto"
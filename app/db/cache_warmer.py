@@ -0,0 +1,193 @@
+"""Preload the premium flag cache from a full table scan after a deploy or Redis restart.
+
+Every row in the table is a premium user, so the warmer streams a parallel scan
+(app.db.scan) and writes "1" for each email through pipelined batches, in whichever
+layout REDIS_CACHE_LAYOUT selects (app.db.cache_layout). TTLs are
+spread over REDIS_TTL_SECONDS * (1 +/- CACHE_WARM_TTL_JITTER) so warmed keys do not all
+expire together.
+
+Only one process warms at a time (Redis lock `lock:cache-warm`). Progress lives in the
+Redis hash CACHE_WARM_PROGRESS_KEY (state, loaded, total, started_at, finished_at) so every
+API worker can report it on /health. The warmer is synchronous (threads) and runs either
+from scripts/warm_cache.py or, with CACHE_WARM_ON_STARTUP, in a thread started by the
+lifespan handler.
+"""
+import random
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+import boto3
+from redis import Redis
+
+from app.core.config import settings
+from app.db.cache_layout import make_layout, needs_server_info
+from app.db.dynamodb import EXPIRES_AT
+from app.db.scan import AdaptiveRateLimiter, ParallelScanner
+
+LOCK_KEY = "lock:cache-warm"
+LOCK_TTL_MS = 60_000
+
+
+class WarmupStopped(Exception):
+    """Raised inside scan workers when the warmer was asked to stop."""
+
+
+def jittered_ttl(base: int, jitter: float) -> int:
+    if jitter <= 0:
+        return base
+    return max(1, int(base * random.uniform(1.0 - jitter, 1.0 + jitter)))
+
+
+def _estimate_items(table_name: str, region: str) -> int:
+    # ItemCount is refreshed by DynamoDB about every six hours; good enough for progress
+    try:
+        client = boto3.session.Session(region_name=region).client("dynamodb")
+        return int(client.describe_table(TableName=table_name)["Table"].get("ItemCount") or 0)
+    except Exception as e:
+        print("[Cache Warm] could not estimate item count:", repr(e))
+        return 0
+
+
+def warm_cache(table_name: Optional[str] = None,
+               region: Optional[str] = None,
+               redis_url: Optional[str] = None,
+               segments: Optional[int] = None,
+               batch_size: Optional[int] = None,
+               target_rcu: Optional[float] = None,
+               force: bool = False,
+               stop: Optional[threading.Event] = None) -> Dict[str, str]:
+    """Scan the table into Redis; returns the final progress hash.
+
+    Skips the scan when another process holds the lock, or (unless `force`) when a previous
+    warm-up finished recently enough that its keys cannot have expired yet.
+    """
+    table_name = table_name or settings.dynamodb_table
+    region = region or settings.aws_region
+    segments = segments or settings.cache_warm_segments
+    batch_size = batch_size or settings.cache_warm_batch_size
+    key = settings.cache_warm_progress_key
+    ttl = settings.redis_ttl_seconds
+    jitter = settings.cache_warm_ttl_jitter
+    # Same stale-while-revalidate window as RedisCache writes
+    grace = max(0, settings.redis_stale_grace_seconds)
+    stop = stop or threading.Event()
+
+    client = Redis.from_url(redis_url or settings.redis_url, decode_responses=True,
+                            socket_timeout=settings.redis_socket_timeout)
+    try:
+        previous = client.hgetall(key)
+        fresh_until = float(previous.get("finished_at") or 0) + ttl * (1.0 - jitter)
+        if not force and previous.get("state") == "done" and time.time() < fresh_until:
+            print("[Cache Warm] cache was warmed recently; skipping")
+            return previous
+
+        token = uuid.uuid4().hex
+        if not client.set(LOCK_KEY, token, nx=True, px=LOCK_TTL_MS):
+            print("[Cache Warm] another process is warming the cache")
+            return previous
+
+        info = None
+        if needs_server_info():
+            try:
+                info = client.info("server")
+            except Exception as e:
+                print("[Cache Warm] could not read server version:", repr(e))
+        layout = make_layout(info)
+
+        started = time.time()
+        client.delete(key)
+        client.hset(key, mapping={
+            "state": "running",
+            "loaded": 0,
+            "total": _estimate_items(table_name, region),
+            "started_at": started,
+        })
+        scanner = ParallelScanner(
+            table_name,
+            region,
+            total_segments=segments,
+            limiter=AdaptiveRateLimiter(target_rcu, None),
+            projection="#e, #x",
+            expression_attribute_names={"#e": "email", "#x": EXPIRES_AT},
+        )
+
+        def handle(items: List[Dict], segment: int) -> None:
+            if stop.is_set():
+                raise WarmupStopped()
+            for i in range(0, len(items), batch_size):
+                chunk = items[i:i + batch_size]
+                pipe = client.pipeline(transaction=False)
+                now = time.time()
+                for item in chunk:
+                    entry_ttl = jittered_ttl(ttl, jitter) + grace
+                    if item.get(EXPIRES_AT) is not None:
+                        # Subscription expiry: never cache past it; expired rows are skipped
+                        remaining = int(item[EXPIRES_AT]) - int(now)
+                        if remaining <= 0:
+                            continue
+                        entry_ttl = min(entry_ttl, remaining)
+                    layout.queue_write(pipe, item["email"].lower(), True, entry_ttl)
+                pipe.hincrby(key, "loaded", len(chunk))
+                # Heartbeat: the lock lives as long as pages keep arriving
+                pipe.pexpire(LOCK_KEY, LOCK_TTL_MS)
+                pipe.execute()
+
+        state = "done"
+        try:
+            stats = scanner.run(handle)
+            print(f"[Cache Warm] loaded {stats.items} keys in {stats.seconds:.1f}s "
+                  f"({stats.items / stats.seconds if stats.seconds else 0:.0f}/s)")
+        except WarmupStopped:
+            state = "stopped"
+        except Exception as e:
+            state = "failed"
+            print("[Cache Warm] failed:", repr(e))
+        finally:
+            client.hset(key, mapping={"state": state, "finished_at": time.time()})
+            client.eval(
+                "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end",
+                1, LOCK_KEY, token,
+            )
+        return client.hgetall(key)
+    finally:
+        client.close()
+
+
+async def warmup_status(cache) -> Dict:
+    """Progress of the latest warm-up plus whether this worker should receive traffic.
+
+    Not ready only while a warm-up is running and neither CACHE_WARM_READY_RATIO of the
+    table is loaded nor this worker's Redis hit ratio reached CACHE_WARM_READY_HIT_RATIO.
+    """
+    try:
+        client = await cache.get_client()
+        async with client.pipeline(transaction=False) as pipe:
+            pipe.hgetall(settings.cache_warm_progress_key)
+            pipe.exists(LOCK_KEY)
+            progress, locked = await pipe.execute()
+    except Exception as e:
+        print("[Cache Warm] progress read failed:", repr(e))
+        progress, locked = {}, 0
+    state = progress.get("state")
+    if state == "running" and not locked:
+        # The warmer died without updating its state (lock heartbeat expired)
+        state = "abandoned"
+    loaded = int(progress.get("loaded") or 0)
+    total = int(progress.get("total") or 0)
+    fraction = min(1.0, loaded / total) if total else None
+    hit_ratio = cache.hit_ratio()
+    ready = (
+        state != "running"
+        or (fraction is not None and fraction >= settings.cache_warm_ready_ratio)
+        or (hit_ratio is not None and hit_ratio >= settings.cache_warm_ready_hit_ratio)
+    )
+    return {
+        "state": state or "none",
+        "loaded": loaded,
+        "total": total,
+        "progress": fraction,
+        "redis_hit_ratio": hit_ratio,
+        "ready": ready,
+    }
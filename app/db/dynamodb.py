@@ -1,33 +1,268 @@
-from typing import Optional
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 import asyncio
-from datetime import datetime, timezone
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 import boto3
+from botocore.config import Config
 
 from app.core.config import settings
+from app.core.metrics import DYNAMODB_SECONDS, run_in_executor
+
+# BatchGetItem accepts at most 100 keys per request, BatchWriteItem 25 items
+BATCH_GET_MAX_KEYS = 100
+BATCH_WRITE_MAX_ITEMS = 25
+
+# Subscription expiry (PREMIUM_PERIOD_DAYS): items carry `expires_at` (epoch seconds, the
+# table's TTL attribute) and `expiry_day` (its UTC YYYY-MM-DD, hash key of EXPIRY_INDEX).
+# Items without `expires_at` never expire.
+EXPIRES_AT = "expires_at"
+EXPIRY_DAY = "expiry_day"
+EXPIRY_INDEX = "expiry_day-index"
+
+
+def expiry_for_day(day: str) -> Optional[Tuple[int, str]]:
+    """(expires_at, expiry_day) for a purchase on UTC day `day`, or None when expiry is off.
+
+    The entitlement ends at 00:00 UTC PREMIUM_PERIOD_DAYS after the purchase day.
+    """
+    if settings.premium_period_days <= 0:
+        return None
+    start = datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    end = start + timedelta(days=settings.premium_period_days)
+    return int(end.timestamp()), end.strftime("%Y-%m-%d")
+
+
+def _expiry_attrs(day: str) -> Dict[str, Any]:
+    expiry = expiry_for_day(day)
+    return {} if expiry is None else {EXPIRES_AT: expiry[0], EXPIRY_DAY: expiry[1]}
+
+
+def _active_until(raw: Any, now: float) -> Tuple[bool, Optional[int]]:
+    """(premium, expires_at) for an item's `expires_at` value (None/absent = never expires).
+
+    DynamoDB deletes expired items only eventually (typically within days), so reads check it.
+    """
+    if raw is None:
+        return True, None
+    expires_at = int(raw)
+    return expires_at > now, expires_at
+
+
+def _timestamp_update(timestamp: str) -> Dict[str, Any]:
+    """UpdateItem arguments setting `timestamp` and the matching expiry (removed when expiry is off)."""
+    expiry = expiry_for_day(timestamp)
+    if expiry is None:
+        return {
+            "UpdateExpression": "SET #ts = :ts REMOVE #x, #d",
+            "ExpressionAttributeNames": {"#ts": "timestamp", "#x": EXPIRES_AT, "#d": EXPIRY_DAY},
+            "ExpressionAttributeValues": {":ts": timestamp},
+        }
+    return {
+        "UpdateExpression": "SET #ts = :ts, #x = :x, #d = :d",
+        "ExpressionAttributeNames": {"#ts": "timestamp", "#x": EXPIRES_AT, "#d": EXPIRY_DAY},
+        "ExpressionAttributeValues": {":ts": timestamp, ":x": expiry[0], ":d": expiry[1]},
+    }
+
+
+def _client_config() -> Config:
+    """botocore config sized for a long-lived, shared client."""
+    return Config(
+        max_pool_connections=settings.dynamodb_max_pool_connections,
+        connect_timeout=settings.dynamodb_connect_timeout,
+        read_timeout=settings.dynamodb_read_timeout,
+        tcp_keepalive=settings.dynamodb_tcp_keepalive,
+        retries={"max_attempts": settings.dynamodb_max_attempts, "mode": "standard"},
+    )
 
 
 class DynamoRepository:
-    """Thin wrapper around DynamoDB using boto3. Blocking I/O is offloaded to a thread."""
+    """Thin wrapper around DynamoDB using boto3. Blocking I/O is offloaded to a thread.
 
-    def __init__(self, table_name: Optional[str] = None, region_name: Optional[str] = None):
+    Building the session/resource resolves credentials and opens a connection pool,
+    so the API keeps one instance per worker process (see app.main lifespan).
+
+    With `use_executor` the blocking calls run on a dedicated pool instead of the loop's
+    default executor, so a burst of cache misses cannot starve unrelated to_thread users.
+    """
+
+    def __init__(self,
+                 table_name: Optional[str] = None,
+                 region_name: Optional[str] = None,
+                 use_executor: bool = False):
         self.table_name = table_name or settings.dynamodb_table
         self.region_name = region_name or settings.aws_region
-        # boto3 resources/clients are thread-safe for most operations
-        self._resource = boto3.resource("dynamodb", region_name=self.region_name)
+        # Own session: the default session is shared module state and not thread-safe to build from.
+        # boto3 resources/clients are thread-safe for most operations once built.
+        self._session = boto3.session.Session(region_name=self.region_name)
+        self._resource = self._session.resource("dynamodb", config=_client_config())
         # boto3 uses dynamic attributes; type checkers may not know about Table
         self._table = self._resource.Table(self.table_name)  # type: ignore[attr-defined]
+        self._executor: Optional[ThreadPoolExecutor] = None
+        if use_executor:
+            self._executor = ThreadPoolExecutor(
+                max_workers=settings.dynamodb_executor_workers,
+                thread_name_prefix="dynamodb",
+            )
+
+    async def start(self) -> None:
+        """Async setup hook; the boto3 backends need none."""
+
+    def close(self) -> None:
+        """Release the underlying HTTP connection pool."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        try:
+            self._resource.meta.client.close()
+        except Exception:
+            pass
+
+    async def aclose(self) -> None:
+        self.close()
+
+    async def _run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        # Timed per operation (_get_item_sync -> "get_item"); queueing is reported separately
+        op = fn.__name__.strip("_")
+        if op.endswith("_sync"):
+            op = op[:-len("_sync")]
+        label = "default" if self._executor is None else "dynamodb"
+        return await run_in_executor(self._executor, label, DYNAMODB_SECONDS, op, fn, *args)
 
     # --- sync implementations (run in thread) ---
-    def _get_item_sync(self, email: str) -> bool:
-        """Return True if an item exists for the email; presence implies premium.
+    def _get_item_sync(self, email: str) -> Tuple[bool, Optional[int]]:
+        """Return (premium, expires_at): an item that has not expired means premium.
         """
-        resp = self._table.get_item(Key={"email": email.lower()})
-        return "Item" in resp
+        # Only the key and expiry are transferred; consistency per DYNAMODB_CONSISTENT_READ
+        resp = self._table.get_item(
+            Key={"email": email.lower()},
+            ProjectionExpression="#e, #x",
+            ExpressionAttributeNames={"#e": "email", "#x": EXPIRES_AT},
+            ConsistentRead=settings.dynamodb_consistent_read,
+        )
+        item = resp.get("Item")
+        if item is None:
+            return False, None
+        return _active_until(item.get(EXPIRES_AT), time.time())
 
     def _exists_sync(self, email: str) -> bool:
-        resp = self._table.get_item(Key={"email": email.lower()})
+        resp = self._table.get_item(
+            Key={"email": email.lower()},
+            ProjectionExpression="#e",
+            ExpressionAttributeNames={"#e": "email"},
+            ConsistentRead=settings.dynamodb_consistent_read,
+        )
         return "Item" in resp
 
+    def _batch_get_existing_sync(self, emails: List[str], include_expired: bool = False) -> Dict[str, Optional[int]]:
+        """Map the (lowercased, <=100) emails that have an unexpired item to their expires_at.
+
+        With `include_expired`, items past their expiry that DynamoDB has not deleted yet are
+        included too.
+
+        UnprocessedKeys (throttling / 16MB response cap) are retried with exponential backoff.
+        """
+        request = {
+            self.table_name: {
+                "Keys": [{"email": e} for e in emails],
+                "ProjectionExpression": "#e, #x",
+                "ExpressionAttributeNames": {"#e": "email", "#x": EXPIRES_AT},
+                "ConsistentRead": settings.dynamodb_consistent_read,
+            }
+        }
+        found: Dict[str, Optional[int]] = {}
+        now = time.time()
+        attempt = 0
+        while request:
+            resp = self._resource.batch_get_item(RequestItems=request)
+            for item in resp.get("Responses", {}).get(self.table_name, []):
+                active, expires_at = _active_until(item.get(EXPIRES_AT), now)
+                if active or include_expired:
+                    found[item["email"]] = expires_at
+            request = resp.get("UnprocessedKeys") or {}
+            if not request:
+                break
+            attempt += 1
+            if attempt > settings.dynamodb_batch_max_retries:
+                raise RuntimeError(f"BatchGetItem left unprocessed keys after {attempt - 1} retries")
+            time.sleep(min(0.05 * (2 ** attempt), 1.0))
+        return found
+
+    def _batch_put_with_timestamp_sync(self, items: List[Tuple[str, str]]) -> int:
+        """Put (email, timestamp) items with BatchWriteItem, 25 per request; returns items written.
+
+        UnprocessedItems are retried with exponential backoff. Puts overwrite, so callers
+        only put emails without an item and send the others through _upsert_premium_sync
+        (see app.services.ingest).
+        """
+        written = 0
+        for i in range(0, len(items), BATCH_WRITE_MAX_ITEMS):
+            chunk = items[i:i + BATCH_WRITE_MAX_ITEMS]
+            request = {
+                self.table_name: [
+                    {"PutRequest": {"Item": {"email": email.lower(), "timestamp": ts, **_expiry_attrs(ts)}}}
+                    for email, ts in chunk
+                ]
+            }
+            attempt = 0
+            while request:
+                resp = self._resource.batch_write_item(RequestItems=request)
+                request = resp.get("UnprocessedItems") or {}
+                if not request:
+                    break
+                attempt += 1
+                if attempt > settings.dynamodb_batch_max_retries:
+                    raise RuntimeError(f"BatchWriteItem left unprocessed items after {attempt - 1} retries")
+                time.sleep(min(0.05 * (2 ** attempt), 1.0))
+            written += len(chunk)
+        return written
+
+    def _iter_emails_sync(self) -> Iterator[str]:
+        """Yield every email in the table (full Scan, key only). For offline/batch jobs."""
+        params = {
+            "ProjectionExpression": "#e",
+            "ExpressionAttributeNames": {"#e": "email"},
+        }
+        resp = self._table.scan(**params)
+        while True:
+            for item in resp.get("Items", []):
+                yield item["email"]
+            if "LastEvaluatedKey" not in resp:
+                break
+            resp = self._table.scan(ExclusiveStartKey=resp["LastEvaluatedKey"], **params)
+
+    def _iter_expired_sync(self, day: str, now: int) -> Iterator[Tuple[str, int]]:
+        """Yield (email, expires_at) for items in expiry-day partition `day` that expired by `now`.
+
+        Queries EXPIRY_INDEX (keys only), so the cost is proportional to the due items, not the table.
+        """
+        params = {
+            "IndexName": EXPIRY_INDEX,
+            "KeyConditionExpression": "#d = :d AND #x <= :now",
+            "ExpressionAttributeNames": {"#d": EXPIRY_DAY, "#x": EXPIRES_AT},
+            "ExpressionAttributeValues": {":d": day, ":now": now},
+        }
+        resp = self._table.query(**params)
+        while True:
+            for item in resp.get("Items", []):
+                yield item["email"], int(item[EXPIRES_AT])
+            if "LastEvaluatedKey" not in resp:
+                break
+            resp = self._table.query(ExclusiveStartKey=resp["LastEvaluatedKey"], **params)
+
+    def _delete_expired_sync(self, email: str, now: int) -> bool:
+        """Delete the item if it is still expired; False when it was renewed (or is gone) meanwhile."""
+        try:
+            self._table.delete_item(
+                Key={"email": email.lower()},
+                ConditionExpression="#x <= :now",
+                ExpressionAttributeNames={"#x": EXPIRES_AT},
+                ExpressionAttributeValues={":now": now},
+            )
+            return True
+        except self._resource.meta.client.exceptions.ConditionalCheckFailedException:
+            return False
+
     def _put_item_sync(self, email: str, is_premium: bool) -> None:
         """Insert/overwrite an item for the email with current UTC date timestamp.
         """
@@ -36,6 +271,7 @@ class DynamoRepository:
             Item={
                 "email": email.lower(),
                 "timestamp": ts,
+                **_expiry_attrs(ts),
             }
         )
 
@@ -46,41 +282,276 @@ class DynamoRepository:
             Item={
                 "email": email.lower(),
                 "timestamp": timestamp,
+                **_expiry_attrs(timestamp),
             }
         )
 
     def _update_timestamp_sync(self, email: str, timestamp: str) -> None:
-        # Conditionally update timestamp only if the item exists
+        # Conditionally update timestamp (and expiry) only if the item exists
+        update = _timestamp_update(timestamp)
         self._table.update_item(
             Key={"email": email.lower()},
-            UpdateExpression="SET #ts = :ts",
-            ExpressionAttributeNames={"#ts": "timestamp"},
-            ExpressionAttributeValues={":ts": timestamp},
             ConditionExpression="attribute_exists(email)",
+            **update,
         )
 
+    def _upsert_premium_sync(self, email: str, timestamp: str) -> Tuple[bool, Optional[int]]:
+        """Create the item or refresh its timestamp and expiry in one UpdateItem.
+
+        Returns (created, expires_at), where expires_at is the expiry the item now carries (None
+        = never expires). UpdateItem creates missing items, and ALL_OLD returns no Attributes in
+        that case; an item that had expired but was not deleted yet counts as created. An item
+        that already runs past this purchase's expiry is left alone and its own expiry is
+        returned, so callers never cache the older purchase's.
+        """
+        update = _timestamp_update(timestamp)
+        expires_at = update["ExpressionAttributeValues"].get(":x")
+        if expires_at is not None:
+            # A late or replayed older purchase must not shorten a newer entitlement
+            update["ConditionExpression"] = "attribute_not_exists(#x) OR #x <= :x"
+            update["ReturnValuesOnConditionCheckFailure"] = "ALL_OLD"
+        try:
+            resp = self._table.update_item(Key={"email": email.lower()}, ReturnValues="ALL_OLD", **update)
+        except self._resource.meta.client.exceptions.ConditionalCheckFailedException as e:
+            stored = e.response.get("Item", {}).get(EXPIRES_AT, {}).get("N")
+            if stored is None:
+                # The condition only fails on a later expiry; re-read it if DynamoDB sent none
+                stored = self._table.get_item(
+                    Key={"email": email.lower()},
+                    ProjectionExpression="#x",
+                    ExpressionAttributeNames={"#x": EXPIRES_AT},
+                    ConsistentRead=True,
+                ).get("Item", {}).get(EXPIRES_AT)
+            return False, int(stored) if stored is not None else None
+        old = resp.get("Attributes")
+        created = old is None or not _active_until(old.get(EXPIRES_AT), time.time())[0]
+        return created, expires_at
+
     # --- async API ---
     async def is_premium(self, email: str) -> bool:
-        return await asyncio.to_thread(self._get_item_sync, email)
+        return (await self.premium_until(email))[0]
+
+    async def premium_until(self, email: str) -> Tuple[bool, Optional[int]]:
+        """(premium, expires_at); expires_at is None for entitlements that never expire."""
+        return await self._run(self._get_item_sync, email)
+
+    async def batch_is_premium(self, emails: Iterable[str]) -> Dict[str, bool]:
+        """Premium flags for many emails via BatchGetItem; keys of the result are lowercased emails."""
+        return {e: premium for e, (premium, _) in (await self.batch_premium_until(emails)).items()}
+
+    async def batch_premium_until(self, emails: Iterable[str]) -> Dict[str, Tuple[bool, Optional[int]]]:
+        """(premium, expires_at) for many emails via BatchGetItem, keyed by lowercased email.
+
+        Emails are deduplicated (BatchGetItem rejects duplicate keys) and fetched in chunks of 100,
+        with chunks running concurrently.
+        """
+        normalized = list(dict.fromkeys(e.lower() for e in emails))
+        chunks = [normalized[i:i + BATCH_GET_MAX_KEYS] for i in range(0, len(normalized), BATCH_GET_MAX_KEYS)]
+        found: Dict[str, Optional[int]] = {}
+        for part in await asyncio.gather(*(self._run(self._batch_get_existing_sync, c) for c in chunks)):
+            found.update(part)
+        return {e: ((True, found[e]) if e in found else (False, None)) for e in normalized}
 
     async def exists(self, email: str) -> bool:
-        return await asyncio.to_thread(self._exists_sync, email)
+        return await self._run(self._exists_sync, email)
 
     async def put_user(self, email: str, is_premium: bool) -> None:
-        await asyncio.to_thread(self._put_item_sync, email, is_premium)
+        await self._run(self._put_item_sync, email, is_premium)
 
     async def put_user_with_timestamp(self, email: str, is_premium: bool, timestamp: str) -> None:
-        await asyncio.to_thread(self._put_item_with_timestamp_sync, email, is_premium, timestamp)
+        await self._run(self._put_item_with_timestamp_sync, email, is_premium, timestamp)
 
     async def update_timestamp(self, email: str, timestamp: str) -> None:
-        await asyncio.to_thread(self._update_timestamp_sync, email, timestamp)
+        await self._run(self._update_timestamp_sync, email, timestamp)
+
+    async def upsert_premium(self, email: str, timestamp: str) -> Tuple[bool, Optional[int]]:
+        return await self._run(self._upsert_premium_sync, email, timestamp)
+
+
+class AioDynamoRepository(DynamoRepository):
+    """DynamoRepository whose read path (is_premium/exists/batch_is_premium) is native async
+    via aiobotocore. Writes and offline helpers still go through the boto3 executor path.
+
+    aiobotocore is optional (it pins its own botocore); install it to use DYNAMODB_BACKEND=aiobotocore.
+    """
+
+    def __init__(self, table_name: Optional[str] = None, region_name: Optional[str] = None):
+        super().__init__(table_name, region_name, use_executor=True)
+        self._aio_client: Any = None
+        self._aio_ctx: Any = None
+
+    async def start(self) -> None:
+        try:
+            from aiobotocore.config import AioConfig
+            from aiobotocore.session import get_session
+        except ImportError as e:
+            raise RuntimeError("DYNAMODB_BACKEND=aiobotocore requires the aiobotocore package") from e
+        config = AioConfig(
+            max_pool_connections=settings.dynamodb_max_pool_connections,
+            connect_timeout=settings.dynamodb_connect_timeout,
+            read_timeout=settings.dynamodb_read_timeout,
+            tcp_keepalive=settings.dynamodb_tcp_keepalive,
+            retries={"max_attempts": settings.dynamodb_max_attempts, "mode": "standard"},
+        )
+        self._aio_ctx = get_session().create_client("dynamodb", region_name=self.region_name, config=config)
+        self._aio_client = await self._aio_ctx.__aenter__()
+
+    async def aclose(self) -> None:
+        if self._aio_ctx is not None:
+            await self._aio_ctx.__aexit__(None, None, None)
+            self._aio_ctx = None
+            self._aio_client = None
+        self.close()
+
+    async def _get_key(self, email: str) -> Tuple[bool, Optional[int]]:
+        with DYNAMODB_SECONDS.labels("get_item").time():
+            resp = await self._aio_client.get_item(
+                TableName=self.table_name,
+                Key={"email": {"S": email.lower()}},
+                ProjectionExpression="#e, #x",
+                ExpressionAttributeNames={"#e": "email", "#x": EXPIRES_AT},
+                ConsistentRead=settings.dynamodb_consistent_read,
+            )
+        item = resp.get("Item")
+        if item is None:
+            return False, None
+        return _active_until(item.get(EXPIRES_AT, {}).get("N"), time.time())
+
+    async def premium_until(self, email: str) -> Tuple[bool, Optional[int]]:
+        return await self._get_key(email)
+
+    async def exists(self, email: str) -> bool:
+        # Presence, as in DynamoRepository: an expired item that is not deleted yet still exists
+        with DYNAMODB_SECONDS.labels("get_item").time():
+            resp = await self._aio_client.get_item(
+                TableName=self.table_name,
+                Key={"email": {"S": email.lower()}},
+                ProjectionExpression="#e",
+                ExpressionAttributeNames={"#e": "email"},
+                ConsistentRead=settings.dynamodb_consistent_read,
+            )
+        return "Item" in resp
+
+    async def _batch_get_existing(self, emails: List[str]) -> Dict[str, Optional[int]]:
+        request = {
+            self.table_name: {
+                "Keys": [{"email": {"S": e}} for e in emails],
+                "ProjectionExpression": "#e, #x",
+                "ExpressionAttributeNames": {"#e": "email", "#x": EXPIRES_AT},
+                "ConsistentRead": settings.dynamodb_consistent_read,
+            }
+        }
+        found: Dict[str, Optional[int]] = {}
+        now = time.time()
+        attempt = 0
+        while request:
+            with DYNAMODB_SECONDS.labels("batch_get_existing").time():
+                resp = await self._aio_client.batch_get_item(RequestItems=request)
+            for item in resp.get("Responses", {}).get(self.table_name, []):
+                active, expires_at = _active_until(item.get(EXPIRES_AT, {}).get("N"), now)
+                if active:
+                    found[item["email"]["S"]] = expires_at
+            request = resp.get("UnprocessedKeys") or {}
+            if not request:
+                break
+            attempt += 1
+            if attempt > settings.dynamodb_batch_max_retries:
+                raise RuntimeError(f"BatchGetItem left unprocessed keys after {attempt - 1} retries")
+            await asyncio.sleep(min(0.05 * (2 ** attempt), 1.0))
+        return found
+
+    async def batch_premium_until(self, emails: Iterable[str]) -> Dict[str, Tuple[bool, Optional[int]]]:
+        normalized = list(dict.fromkeys(e.lower() for e in emails))
+        chunks = [normalized[i:i + BATCH_GET_MAX_KEYS] for i in range(0, len(normalized), BATCH_GET_MAX_KEYS)]
+        found: Dict[str, Optional[int]] = {}
+        for part in await asyncio.gather(*(self._batch_get_existing(c) for c in chunks)):
+            found.update(part)
+        return {e: ((True, found[e]) if e in found else (False, None)) for e in normalized}
+
+
+def create_repository() -> DynamoRepository:
+    """Build the repository for the API process according to DYNAMODB_BACKEND."""
+    backend = settings.dynamodb_backend.lower()
+    if backend == "aiobotocore":
+        return AioDynamoRepository()
+    if backend == "thread":
+        return DynamoRepository()
+    if backend != "executor":
+        print(f"[DynamoDB] unknown DYNAMODB_BACKEND={settings.dynamodb_backend!r}; using executor")
+    return DynamoRepository(use_executor=True)
+
+
+def expiry_enabled() -> bool:
+    return settings.premium_period_days > 0
+
+
+def table_definition(table_name: str, with_expiry_index: bool = True) -> Dict[str, Any]:
+    """CreateTable arguments: partition key `email`, on-demand billing and (optionally) the expiry index."""
+    definition = {
+        "TableName": table_name,
+        "AttributeDefinitions": [
+            {"AttributeName": "email", "AttributeType": "S"},
+            {"AttributeName": EXPIRY_DAY, "AttributeType": "S"},
+            {"AttributeName": EXPIRES_AT, "AttributeType": "N"},
+        ],
+        "KeySchema": [{"AttributeName": "email", "KeyType": "HASH"}],
+        "GlobalSecondaryIndexes": [_expiry_index()],
+        "BillingMode": "PAY_PER_REQUEST",
+        "Tags": [{"Key": "app", "Value": "paypal-premium-manager"}],
+    }
+    if not with_expiry_index:
+        definition["AttributeDefinitions"] = definition["AttributeDefinitions"][:1]
+        del definition["GlobalSecondaryIndexes"]
+    return definition
+
+
+def _expiry_index() -> Dict[str, Any]:
+    # Sparse: only items with an expiry are indexed. Keys only, the sweep needs nothing else
+    return {
+        "IndexName": EXPIRY_INDEX,
+        "KeySchema": [
+            {"AttributeName": EXPIRY_DAY, "KeyType": "HASH"},
+            {"AttributeName": EXPIRES_AT, "KeyType": "RANGE"},
+        ],
+        "Projection": {"ProjectionType": "KEYS_ONLY"},
+    }
+
+
+def ensure_expiry_schema(client: Any, table_name: str, table: Dict[str, Any]) -> None:
+    """Add the expiry index and enable TTL on `expires_at` for tables created before them.
+
+    `table` is the DescribeTable "Table" dict. Adding the index to an existing table starts
+    a backfill; DynamoDB serves the table normally meanwhile. Needs dynamodb:UpdateTable,
+    DescribeTimeToLive and UpdateTimeToLive, so it is only run by scripts/create_table.py and
+    scripts/sweep_expired.py, never on the API's readiness path.
+    """
+    indexes = {i["IndexName"] for i in table.get("GlobalSecondaryIndexes", [])}
+    if EXPIRY_INDEX not in indexes:
+        print(f"[DynamoDB] adding index {EXPIRY_INDEX} to {table_name}")
+        try:
+            client.update_table(
+                TableName=table_name,
+                AttributeDefinitions=table_definition(table_name)["AttributeDefinitions"][1:],
+                GlobalSecondaryIndexUpdates=[{"Create": _expiry_index()}],
+            )
+        except client.exceptions.ResourceInUseException:
+            # Another process is already updating the table
+            pass
+    ttl = client.describe_time_to_live(TableName=table_name).get("TimeToLiveDescription", {})
+    if ttl.get("TimeToLiveStatus") not in ("ENABLED", "ENABLING"):
+        print(f"[DynamoDB] enabling TTL on {table_name}.{EXPIRES_AT}")
+        client.update_time_to_live(
+            TableName=table_name,
+            TimeToLiveSpecification={"Enabled": True, "AttributeName": EXPIRES_AT},
+        )
 
 
 def ensure_table_exists(table_name: str, region: str) -> None:
     """Ensure the DynamoDB table exists; create it if missing.
 
-    Idempotent: If the table already exists, returns immediately.
-    Blocks until the table is ACTIVE when creating.
+    Idempotent: If it exists, returns after DescribeTable. Blocks until the table is ACTIVE
+    when creating. A new table gets the expiry index when PREMIUM_PERIOD_DAYS > 0; TTL and the
+    index on existing tables are left to ensure_expiry_schema (scripts).
     """
     client = boto3.client("dynamodb", region_name=region)
     try:
@@ -96,13 +567,7 @@ def ensure_table_exists(table_name: str, region: str) -> None:
 
     try:
         # Create table with partition key 'email' (S) and on-demand billing
-        client.create_table(
-            TableName=table_name,
-            AttributeDefinitions=[{"AttributeName": "email", "AttributeType": "S"}],
-            KeySchema=[{"AttributeName": "email", "KeyType": "HASH"}],
-            BillingMode="PAY_PER_REQUEST",
-            Tags=[{"Key": "app", "Value": "paypal-premium-manager"}],
-        )
+        client.create_table(**table_definition(table_name, with_expiry_index=expiry_enabled()))
     except client.exceptions.ResourceInUseException:
         # Another worker/process already initiated creation; just wait
         pass
@@ -1,32 +1,364 @@
-from typing import Optional
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 from redis.asyncio import Redis, from_url
 
 from app.core.config import settings
+from app.core.metrics import L1_HIT, L1_MISS, REDIS_HIT, REDIS_MISS, REDIS_SECONDS
+from app.db.cache_layout import make_layout, needs_server_info
+
+
+class LocalCache:
+    """Bounded in-process TTL/LRU map used as an L1 in front of Redis.
+
+    Only touched from the event loop, so no locking. Entries expire after `ttl_seconds`
+    and the least recently used entry is evicted once `max_entries` is reached.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self._data: "OrderedDict[str, Tuple[bool, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key: str) -> Optional[bool]:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            L1_MISS.inc()
+            return None
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            L1_MISS.inc()
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        L1_HIT.inc()
+        return value
+
+    def set(self, key: str, value: bool, max_ttl: Optional[float] = None) -> None:
+        """Store `value` for the L1 TTL, or for `max_ttl` seconds if that is shorter."""
+        if key in self._data:
+            self._data.move_to_end(key)
+        ttl = self.ttl if max_ttl is None else min(self.ttl, max_ttl)
+        self._data[key] = (value, time.monotonic() + ttl)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: str) -> None:
+        if self._data.pop(key, None) is not None:
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
 
 
 class RedisCache:
-    def __init__(self, url: Optional[str] = None, ttl_seconds: Optional[int] = None):
+    """Async Redis cache for premium flags.
+
+    How flags are laid out in Redis (one key per email, or digests packed into hash
+    buckets) is decided by REDIS_CACHE_LAYOUT; see app.db.cache_layout.
+
+    One instance is meant to live for the whole worker process (see the lifespan
+    handler in app.main); all requests share its connection pool.
+
+    When enabled, a LocalCache (L1) answers repeat lookups without a Redis round trip.
+    Writers call `invalidate()` which publishes the email on a pub/sub channel so every
+    worker's listener drops it from its L1.
+    """
+
+    def __init__(self,
+                 url: Optional[str] = None,
+                 ttl_seconds: Optional[int] = None,
+                 max_connections: Optional[int] = None,
+                 l1: Optional[LocalCache] = None):
         self.url = url or settings.redis_url
         self.ttl = ttl_seconds or settings.redis_ttl_seconds
+        # Entries are kept `grace` seconds past the soft TTL; a remaining TTL <= grace means stale
+        self.grace = max(0, settings.redis_stale_grace_seconds)
+        self.max_connections = max_connections or settings.redis_max_connections
         self._client: Optional[Redis] = None
+        if l1 is None and settings.l1_cache_enabled:
+            l1 = LocalCache(settings.l1_cache_max_entries, settings.l1_cache_ttl_seconds)
+        self.l1 = l1
+        self.invalidation_channel = settings.l1_invalidation_channel
+        self._listener: Optional[asyncio.Task] = None
+        self._invalidation_hooks: List[Callable[[str], None]] = []
+        # Redis lookups (after L1) for this worker, reported on /health
+        self.hits = 0
+        self.misses = 0
+        self._layout = None
 
     async def get_client(self) -> Redis:
         if self._client is None:
-            self._client = from_url(self.url, decode_responses=True)
+            # from_url builds a pool owned by the client; aclose() releases it
+            self._client = from_url(
+                self.url,
+                decode_responses=True,
+                max_connections=self.max_connections,
+                socket_timeout=settings.redis_socket_timeout,
+                socket_connect_timeout=settings.redis_socket_connect_timeout,
+                socket_keepalive=settings.redis_socket_keepalive,
+                health_check_interval=settings.redis_health_check_interval,
+            )
         return self._client
 
-    async def get_premium(self, email: str) -> Optional[bool]:
+    async def get_layout(self):
+        """Storage layout (app.db.cache_layout), resolved once; may ask the server for its version."""
+        if self._layout is None:
+            info = None
+            if needs_server_info():
+                try:
+                    client = await self.get_client()
+                    info = await client.info("server")
+                except Exception as e:
+                    print("[RedisCache] could not read server version; using embedded expiry:", repr(e))
+            self._layout = make_layout(info)
+        return self._layout
+
+    async def _read(self, emails: List[str], with_ttl: bool) -> List[Tuple[Optional[bool], Optional[int]]]:
+        """Read (flag, ttl_ms) for lowercased emails from Redis in one pipelined round trip."""
+        layout = await self.get_layout()
         client = await self.get_client()
-        val = await client.get(f"premium:{email.lower()}")
-        if val is None:
+        with REDIS_SECONDS.labels("get" if len(emails) == 1 else "get_many").time():
+            async with client.pipeline(transaction=False) as pipe:
+                for email in emails:
+                    layout.queue_read(pipe, email, with_ttl)
+                replies = await pipe.execute()
+        width = layout.read_width(with_ttl)
+        out = []
+        for i in range(len(emails)):
+            flag, ttl = layout.parse_read(replies[i * width:(i + 1) * width], with_ttl)
+            if flag is None:
+                self.misses += 1
+                REDIS_MISS.inc()
+            else:
+                self.hits += 1
+                REDIS_HIT.inc()
+                if self.l1 is not None:
+                    # Never keep a copy past the Redis entry (which may be clamped to an expiry)
+                    self.l1.set(emails[i], flag, None if ttl is None else ttl / 1000.0)
+            out.append((flag, ttl))
+        return out
+
+    def entry_ttl(self, is_premium: bool, expires_at: Optional[int], now: float) -> Tuple[bool, int]:
+        """(flag, TTL seconds) to store: premium entries are clamped to the subscription's expiry.
+
+        An already expired entitlement is stored as not premium. The grace window is dropped
+        once clamped, since a stale "premium" must not outlive the entitlement either.
+        """
+        ttl = self.ttl + self.grace
+        if not is_premium or expires_at is None:
+            return is_premium, ttl
+        remaining = int(expires_at - now)
+        if remaining <= 0:
+            return False, ttl
+        return True, min(ttl, remaining)
+
+    async def _write(self, flags: Dict[str, bool], expires: Optional[Dict[str, Optional[int]]] = None) -> None:
+        layout = await self.get_layout()
+        client = await self.get_client()
+        now = time.time()
+        entries = {
+            email: self.entry_ttl(is_premium, expires.get(email) if expires else None, now)
+            for email, is_premium in flags.items()
+        }
+        with REDIS_SECONDS.labels("set" if len(flags) == 1 else "set_many").time():
+            async with client.pipeline(transaction=False) as pipe:
+                for email, (flag, ttl) in entries.items():
+                    layout.queue_write(pipe, email, flag, ttl)
+                await pipe.execute()
+        if self.l1 is not None:
+            for email, (flag, ttl) in entries.items():
+                self.l1.set(email, flag, ttl)
+
+    async def get_premium(self, email: str) -> Optional[bool]:
+        email = email.lower()
+        if self.l1 is not None:
+            local = self.l1.get(email)
+            if local is not None:
+                return local
+        premium, _ = (await self._read([email], with_ttl=False))[0]
+        return premium
+
+    async def set_premium(self, email: str, is_premium: bool, expires_at: Optional[int] = None):
+        """Cache a flag; with `expires_at` (epoch seconds) the entry ends with the subscription."""
+        email = email.lower()
+        await self._write({email: is_premium}, {email: expires_at})
+
+    def is_stale(self, ttl_ms: Optional[int]) -> bool:
+        """True when an entry with `ttl_ms` left is past its soft TTL (in the grace window)."""
+        return ttl_ms is not None and ttl_ms <= self.grace * 1000
+
+    async def get_premium_with_ttl(self, email: str) -> Tuple[Optional[bool], Optional[int]]:
+        """Return (flag, remaining TTL in ms) in one round trip.
+
+        The TTL includes the grace window (see `is_stale`). L1 hits return a None TTL: the
+        Redis expiry is unknown there and L1 entries are short-lived.
+        """
+        email = email.lower()
+        if self.l1 is not None:
+            local = self.l1.get(email)
+            if local is not None:
+                return local, None
+        premium, ttl = (await self._read([email], with_ttl=True))[0]
+        return premium, ttl
+
+    async def get_premium_many(self, emails: Iterable[str]) -> Dict[str, Optional[bool]]:
+        """Look up many emails in one pipelined round trip; keys of the result are lowercased emails."""
+        normalized = list(dict.fromkeys(e.lower() for e in emails))
+        if not normalized:
+            return {}
+        result: Dict[str, Optional[bool]] = {}
+        remote = normalized
+        if self.l1 is not None:
+            remote = []
+            for e in normalized:
+                local = self.l1.get(e)
+                if local is None:
+                    remote.append(e)
+                else:
+                    result[e] = local
+        if remote:
+            for e, (flag, _) in zip(remote, await self._read(remote, with_ttl=False)):
+                result[e] = flag
+        return {e: result[e] for e in normalized}
+
+    async def get_premium_many_with_ttl(self, emails: Iterable[str]) -> Dict[str, Tuple[Optional[bool], Optional[int]]]:
+        """Like get_premium_many, with each entry's remaining TTL in ms (None for L1 hits)."""
+        normalized = list(dict.fromkeys(e.lower() for e in emails))
+        if not normalized:
+            return {}
+        result: Dict[str, Tuple[Optional[bool], Optional[int]]] = {}
+        remote = normalized
+        if self.l1 is not None:
+            remote = []
+            for e in normalized:
+                local = self.l1.get(e)
+                if local is None:
+                    remote.append(e)
+                else:
+                    result[e] = (local, None)
+        if remote:
+            for e, entry in zip(remote, await self._read(remote, with_ttl=True)):
+                result[e] = entry
+        return {e: result[e] for e in normalized}
+
+    async def set_premium_many(self, flags: Dict[str, bool], expires: Optional[Dict[str, Optional[int]]] = None):
+        """Write many flags in one pipelined round trip (no MULTI/EXEC); `expires` as in set_premium."""
+        if not flags:
+            return
+        await self._write(
+            {email.lower(): is_premium for email, is_premium in flags.items()},
+            {email.lower(): exp for email, exp in expires.items()} if expires else None,
+        )
+
+    def hit_ratio(self, min_lookups: int = 100) -> Optional[float]:
+        """Redis hit ratio of this worker, or None before `min_lookups` lookups."""
+        lookups = self.hits + self.misses
+        if lookups < min_lookups:
             return None
-        return val == "1"
+        return self.hits / lookups
+
+    # --- short-lived locks (SET NX PX + compare-and-delete) ---
+    _RELEASE_LOCK = (
+        "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+    )
 
-    async def set_premium(self, email: str, is_premium: bool):
+    async def acquire_lock(self, name: str, ttl_ms: int) -> Optional[str]:
+        """Try to take `lock:<name>`; returns the owner token, or None if someone else holds it."""
+        token = uuid.uuid4().hex
         client = await self.get_client()
-        await client.setex(f"premium:{email.lower()}", self.ttl, "1" if is_premium else "0")
+        if await client.set(f"lock:{name}", token, nx=True, px=ttl_ms):
+            return token
+        return None
+
+    async def release_lock(self, name: str, token: str):
+        client = await self.get_client()
+        await client.eval(self._RELEASE_LOCK, 1, f"lock:{name}", token)
+
+    # --- L1 invalidation over pub/sub ---
+    async def invalidate(self, email: str):
+        """Drop the email from this worker's L1 and tell every other worker to do the same."""
+        email = email.lower()
+        if self.l1 is not None:
+            self.l1.invalidate(email)
+        client = await self.get_client()
+        await client.publish(self.invalidation_channel, email)
+
+    def add_invalidation_hook(self, hook: Callable[[str], None]):
+        """Call `hook(email)` for every invalidation received (e.g. snapshot deltas)."""
+        self._invalidation_hooks.append(hook)
+
+    async def start_invalidation_listener(self):
+        if self._listener is not None:
+            return
+        self._listener = asyncio.create_task(self._listen_invalidations())
+
+    async def _listen_invalidations(self):
+        backoff = 0.5
+        while True:
+            pubsub = None
+            try:
+                client = await self.get_client()
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                await pubsub.subscribe(self.invalidation_channel)
+                # Anything published while we were not subscribed is lost; start clean
+                if self.l1 is not None:
+                    self.l1.clear()
+                backoff = 0.5
+                while True:
+                    message = await pubsub.get_message(timeout=1.0)
+                    if message and message.get("type") == "message":
+                        email = message["data"]
+                        if self.l1 is not None:
+                            self.l1.invalidate(email)
+                        for hook in self._invalidation_hooks:
+                            hook(email)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print("[RedisCache] invalidation listener error:", repr(e))
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.aclose()
+                    except Exception:
+                        pass
 
     async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
         if self._client:
-            await self._client.close()
+            await self._client.aclose()
             self._client = None
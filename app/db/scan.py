@@ -0,0 +1,264 @@
+"""Parallel, resumable, rate-adaptive DynamoDB table scans for maintenance jobs.
+
+ParallelScanner splits a Scan into `total_segments` (Segment/TotalSegments) handled by a
+thread pool. After each page is handled, the segment's LastEvaluatedKey is saved to a local
+JSON checkpoint so an interrupted run resumes where it stopped. AdaptiveRateLimiter paces
+reads and writes against an optional RCU/WCU-per-second budget using the capacity DynamoDB
+reports, halves the rate on throttling and recovers it gradually.
+
+Example:
+    scanner = ParallelScanner(table, region, total_segments=8, checkpoint_path="job.ckpt")
+    def handle(items, segment):
+        for item in items:
+            scanner.call("write", scanner.table().update_item, Key=..., ...)
+    stats = scanner.run(handle)
+"""
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from app.core.config import settings
+
+THROTTLE_CODES = {
+    "ProvisionedThroughputExceededException",
+    "ThrottlingException",
+    "RequestLimitExceeded",
+}
+
+
+def is_throttle(error: Exception) -> bool:
+    return isinstance(error, ClientError) and error.response.get("Error", {}).get("Code") in THROTTLE_CODES
+
+
+class AdaptiveRateLimiter:
+    """Capacity-unit pacing shared by all scan threads.
+
+    Each kind ("read"/"write") has a bucket refilled at the current rate (units/second).
+    Callers wait while the bucket is in debt, then pay the consumed capacity afterwards,
+    since DynamoDB only reports it in the response. With no target the bucket is unlimited
+    and only throttling backoff applies.
+    """
+
+    def __init__(self, target_rcu: Optional[float] = None, target_wcu: Optional[float] = None):
+        self._lock = threading.Lock()
+        self._target = {"read": target_rcu, "write": target_wcu}
+        self._rate = {"read": target_rcu, "write": target_wcu}
+        self._balance = {"read": 0.0, "write": 0.0}
+        self._last = {"read": time.monotonic(), "write": time.monotonic()}
+        self._pause_until = 0.0
+        self._backoff = 0.0
+        self.throttles = 0
+        self.consumed = {"read": 0.0, "write": 0.0}
+
+    def acquire(self, kind: str) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self._pause_until - now
+                rate = self._rate[kind]
+                if wait <= 0 and rate:
+                    # Refill, capped at one second of burst
+                    self._balance[kind] = min(rate, self._balance[kind] + (now - self._last[kind]) * rate)
+                    self._last[kind] = now
+                    if self._balance[kind] < 0:
+                        wait = -self._balance[kind] / rate
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def record(self, kind: str, units: float) -> None:
+        with self._lock:
+            self.consumed[kind] += units
+            if self._rate[kind]:
+                self._balance[kind] -= units
+            # Additive recovery towards the target after successful calls
+            target = self._target[kind]
+            if target and self._rate[kind] < target:
+                self._rate[kind] = min(target, self._rate[kind] + target * 0.05)
+            self._backoff = max(0.0, self._backoff * 0.5 - 0.01)
+
+    def throttled(self, kind: str) -> None:
+        with self._lock:
+            self.throttles += 1
+            if self._rate[kind]:
+                self._rate[kind] = max(1.0, self._rate[kind] * 0.5)
+            # Everyone pauses with jittered exponential backoff
+            self._backoff = min(max(self._backoff * 2, 0.1), 10.0)
+            self._pause_until = max(self._pause_until, time.monotonic() + self._backoff * random.uniform(0.5, 1.0))
+
+    def rates(self) -> Dict[str, Optional[float]]:
+        with self._lock:
+            return dict(self._rate)
+
+
+def _encode_key(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return {"__decimal__": str(value)}
+    if isinstance(value, dict):
+        return {k: _encode_key(v) for k, v in value.items()}
+    return value
+
+
+def _decode_key(value: Any) -> Any:
+    if isinstance(value, dict):
+        if set(value) == {"__decimal__"}:
+            return Decimal(value["__decimal__"])
+        return {k: _decode_key(v) for k, v in value.items()}
+    return value
+
+
+@dataclass
+class ScanStats:
+    pages: int = 0
+    items: int = 0
+    seconds: float = 0.0
+    throttles: int = 0
+    consumed: Dict[str, float] = field(default_factory=dict)
+
+
+class ParallelScanner:
+    def __init__(self,
+                 table_name: Optional[str] = None,
+                 region: Optional[str] = None,
+                 total_segments: int = 8,
+                 workers: Optional[int] = None,
+                 checkpoint_path: Optional[str] = None,
+                 limiter: Optional[AdaptiveRateLimiter] = None,
+                 projection: Optional[str] = None,
+                 expression_attribute_names: Optional[Dict[str, str]] = None,
+                 page_limit: Optional[int] = None,
+                 consistent_read: bool = False,
+                 max_throttle_retries: Optional[int] = None):
+        self.table_name = table_name or settings.dynamodb_table
+        self.region = region or settings.aws_region
+        self.total_segments = total_segments
+        self.workers = workers or total_segments
+        self.checkpoint_path = checkpoint_path
+        self.limiter = limiter or AdaptiveRateLimiter()
+        self.max_throttle_retries = (settings.dynamodb_scan_max_throttle_retries
+                                     if max_throttle_retries is None else max_throttle_retries)
+        self.scan_params: Dict[str, Any] = {"ReturnConsumedCapacity": "TOTAL", "ConsistentRead": consistent_read}
+        if projection:
+            self.scan_params["ProjectionExpression"] = projection
+        if expression_attribute_names:
+            self.scan_params["ExpressionAttributeNames"] = expression_attribute_names
+        if page_limit:
+            self.scan_params["Limit"] = page_limit
+        self._local = threading.local()
+        self._ckpt_lock = threading.Lock()
+        self._state: Dict[str, Any] = {}
+        self._stats_lock = threading.Lock()
+        self.stats = ScanStats()
+
+    def table(self):
+        """Thread-local Table (boto3 resources must not be shared between threads)."""
+        table = getattr(self._local, "table", None)
+        if table is None:
+            session = boto3.session.Session(region_name=self.region)
+            # Few SDK retries: throttling is handled by the adaptive limiter instead
+            resource = session.resource("dynamodb", config=Config(retries={"max_attempts": 2, "mode": "standard"}))
+            table = resource.Table(self.table_name)  # type: ignore[attr-defined]
+            self._local.table = table
+        return table
+
+    def call(self, kind: str, fn: Callable[..., Dict], **kwargs: Any) -> Dict:
+        """Run a DynamoDB call under the limiter, retrying throttles; returns the response.
+
+        `kind` is "read" or "write"; ReturnConsumedCapacity is added so usage can be paced.
+        Raises RuntimeError once the call has been throttled more than `max_throttle_retries`
+        times in a row, so a table that stays throttled fails the job instead of hanging it
+        (the checkpoint lets a rerun resume).
+        """
+        kwargs.setdefault("ReturnConsumedCapacity", "TOTAL")
+        attempt = 0
+        while True:
+            self.limiter.acquire(kind)
+            try:
+                resp = fn(**kwargs)
+            except ClientError as e:
+                if not is_throttle(e):
+                    raise
+                self.limiter.throttled(kind)
+                attempt += 1
+                if attempt > self.max_throttle_retries:
+                    raise RuntimeError(f"DynamoDB {kind} still throttled after {attempt - 1} retries") from e
+                continue
+            consumed = resp.get("ConsumedCapacity") or {}
+            self.limiter.record(kind, float(consumed.get("CapacityUnits") or 0.0))
+            return resp
+
+    # --- checkpoint ---
+    def _load_checkpoint(self) -> None:
+        self._state = {"table": self.table_name, "total_segments": self.total_segments, "segments": {}}
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return
+        with open(self.checkpoint_path) as f:
+            state = json.load(f)
+        if state.get("table") != self.table_name or state.get("total_segments") != self.total_segments:
+            raise RuntimeError(
+                f"Checkpoint {self.checkpoint_path} is for {state.get('table')} with "
+                f"{state.get('total_segments')} segments; delete it or match the settings"
+            )
+        self._state = state
+
+    def _save_checkpoint(self, segment: int, last_key: Optional[Dict], done: bool) -> None:
+        if not self.checkpoint_path:
+            return
+        with self._ckpt_lock:
+            self._state["segments"][str(segment)] = {"last_key": _encode_key(last_key), "done": done}
+            tmp = f"{self.checkpoint_path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(self._state, f)
+            os.replace(tmp, self.checkpoint_path)
+
+    # --- scan ---
+    def _scan_segment(self, segment: int, handle_page: Callable[[List[Dict], int], None]) -> None:
+        saved = self._state["segments"].get(str(segment)) or {}
+        if saved.get("done"):
+            return
+        start_key = _decode_key(saved.get("last_key"))
+        table = self.table()
+        while True:
+            params = dict(self.scan_params, Segment=segment, TotalSegments=self.total_segments)
+            if start_key:
+                params["ExclusiveStartKey"] = start_key
+            resp = self.call("read", table.scan, **params)
+            items = resp.get("Items", [])
+            handle_page(items, segment)
+            with self._stats_lock:
+                self.stats.pages += 1
+                self.stats.items += len(items)
+            start_key = resp.get("LastEvaluatedKey")
+            self._save_checkpoint(segment, start_key, done=start_key is None)
+            if start_key is None:
+                return
+
+    def run(self, handle_page: Callable[[List[Dict], int], None]) -> ScanStats:
+        """Scan every segment, calling `handle_page(items, segment)` from worker threads.
+
+        The handler must be thread-safe. A page's checkpoint is saved only after its handler
+        returns, so a crash re-delivers at most one page per segment. The checkpoint file is
+        removed when every segment finished.
+        """
+        started = time.perf_counter()
+        self._load_checkpoint()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="scan") as pool:
+            futures = [pool.submit(self._scan_segment, s, handle_page) for s in range(self.total_segments)]
+            for fut in futures:
+                fut.result()
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        self.stats.seconds = time.perf_counter() - started
+        self.stats.throttles = self.limiter.throttles
+        self.stats.consumed = dict(self.limiter.consumed)
+        return self.stats
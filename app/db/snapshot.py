@@ -0,0 +1,252 @@
+"""Compact on-disk snapshot of the premium set for network-free negative lookups.
+
+File layout (native byte order, checked via the header):
+
+    header   struct HEADER_FORMAT (48 bytes)
+    hashes   n x uint64, sorted   -- 64-bit blake2b prefix of each lowercased email
+    bloom    m_bits / 8 bytes     -- Bloom filter over the same digests (double hashing)
+
+Every worker mmaps the same file read-only, so the pages are shared through the OS page
+cache and lookups read straight from the mapping. A key that is in neither the Bloom
+filter nor the sorted array was not premium when the snapshot was built; emails changed
+since then (webhook writes) are tracked as deltas in Redis and always fall through to
+the normal cache/DB path.
+"""
+import asyncio
+import hashlib
+import math
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from typing import Iterable, Optional, Set, Tuple
+
+from app.core.config import settings
+
+MAGIC = b"PPMSNAP1"
+VERSION = 1
+# magic, version, byteorder (0=little, 1=big), k, n, m_bits, built_at, reserved
+HEADER_FORMAT = "=8sHHIQQQQ"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+DELTA_KEY = "snapshot:delta"
+# Deltas recorded slightly before a build started are kept, to cover clock skew between hosts
+DELTA_MARGIN_SECONDS = 300
+
+
+def delta_mapping(emails: Iterable[str]) -> dict:
+    """ZADD mapping recording `emails` as changed since the snapshot (score: now)."""
+    now = time.time()
+    return {e.lower(): now for e in emails}
+
+
+async def record_deltas(cache, emails: Iterable[str]) -> None:
+    """Record changed emails in `snapshot:delta` for every worker, with or without a SnapshotManager.
+
+    No-op without SNAPSHOT_PATH: nothing reads or trims the set then.
+    """
+    mapping = delta_mapping(emails)
+    if not settings.snapshot_path or not mapping:
+        return
+    client = await cache.get_client()
+    await client.zadd(DELTA_KEY, mapping)
+
+
+def _digest(email: str) -> Tuple[int, int]:
+    d = hashlib.blake2b(email.lower().encode("utf-8"), digest_size=16).digest()
+    # Second hash forced odd so the probe sequence never degenerates
+    return int.from_bytes(d[:8], "little"), int.from_bytes(d[8:], "little") | 1
+
+
+def _bloom_size(n: int, fp_rate: float) -> Tuple[int, int]:
+    n = max(n, 1)
+    m = int(math.ceil(-n * math.log(fp_rate) / (math.log(2) ** 2)))
+    m = max(64, (m + 7) // 8 * 8)
+    k = max(1, int(round(m / n * math.log(2))))
+    return m, k
+
+
+def build_snapshot(emails: Iterable[str], path: str, fp_rate: Optional[float] = None) -> int:
+    """Write a snapshot of `emails` to `path` atomically; returns the number of entries.
+
+    The file is written next to `path` and renamed over it, so workers that still map the
+    previous file keep a consistent view until they reload.
+    """
+    fp_rate = fp_rate or settings.snapshot_false_positive_rate
+    built_at = int(time.time())
+    hashes = array("Q")
+    seconds = array("Q")
+    for email in emails:
+        h1, h2 = _digest(email)
+        hashes.append(h1)
+        seconds.append(h2)
+
+    m_bits, k = _bloom_size(len(hashes), fp_rate)
+    bloom = bytearray(m_bits // 8)
+    for h1, h2 in zip(hashes, seconds):
+        for i in range(k):
+            pos = (h1 + i * h2) % m_bits
+            bloom[pos >> 3] |= 1 << (pos & 7)
+
+    # Duplicates (shouldn't happen for a key scan) are harmless for bisect
+    ordered = array("Q", sorted(hashes))
+    byteorder = 0 if sys.byteorder == "little" else 1
+    header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, byteorder, k, len(ordered), m_bits, built_at, 0)
+
+    tmp = f"{path}.tmp.{os.getpid()}"
+    with open(tmp, "wb") as f:
+        f.write(header)
+        ordered.tofile(f)
+        f.write(bloom)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return len(ordered)
+
+
+class PremiumSnapshot:
+    """Read-only mmap view over a snapshot file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self.mtime = os.fstat(f.fileno()).st_mtime
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, byteorder, k, n, m_bits, built_at, _ = struct.unpack_from(HEADER_FORMAT, self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self._mm.close()
+            raise ValueError(f"{path} is not a premium snapshot (v{VERSION})")
+        if byteorder != (0 if sys.byteorder == "little" else 1):
+            self._mm.close()
+            raise ValueError(f"{path} was built on a host with a different byte order")
+        self.k = k
+        self.count = n
+        self.m_bits = m_bits
+        self.built_at = built_at
+        # Zero-copy views into the mapping
+        view = memoryview(self._mm)
+        self._view = view
+        self._hashes = view[HEADER_SIZE:HEADER_SIZE + n * 8].cast("Q")
+        self._bloom_offset = HEADER_SIZE + n * 8
+
+    def _in_bloom(self, h1: int, h2: int) -> bool:
+        mm = self._mm
+        m_bits = self.m_bits
+        base = self._bloom_offset
+        for i in range(self.k):
+            pos = (h1 + i * h2) % m_bits
+            if not mm[base + (pos >> 3)] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def contains(self, email: str) -> bool:
+        """True if the email was in the table when the snapshot was built (hash-collision safe side)."""
+        h1, h2 = _digest(email)
+        if not self._in_bloom(h1, h2):
+            return False
+        i = bisect_left(self._hashes, h1)
+        return i < self.count and self._hashes[i] == h1
+
+    def close(self) -> None:
+        self._hashes.release()
+        self._view.release()
+        self._mm.close()
+
+
+class SnapshotManager:
+    """Per-worker owner of the current PremiumSnapshot plus emails changed since it was built.
+
+    - `definitely_not_premium(email)` answers from memory only.
+    - Webhook writers call `record_delta(email)`; the delta is stored in a Redis sorted set
+      (scored by time) and pushed to every worker through the L1 invalidation channel.
+    - A background task reloads the file when it is replaced and re-reads the deltas.
+    """
+
+    def __init__(self, cache, path: Optional[str] = None):
+        self.cache = cache
+        self.path = path or settings.snapshot_path
+        self.snapshot: Optional[PremiumSnapshot] = None
+        self._deltas: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        await self._reload()
+        self.cache.add_invalidation_hook(self._deltas.add)
+        self._task = asyncio.create_task(self._reload_loop())
+
+    def definitely_not_premium(self, email: str) -> bool:
+        snap = self.snapshot
+        if snap is None:
+            return False
+        email = email.lower()
+        if email in self._deltas:
+            return False
+        return not snap.contains(email)
+
+    async def record_delta(self, email: str) -> None:
+        self._deltas.add(email.lower())
+        await record_deltas(self.cache, [email])
+
+    def stats(self) -> dict:
+        snap = self.snapshot
+        return {
+            "loaded": snap is not None,
+            "entries": snap.count if snap else 0,
+            "built_at": snap.built_at if snap else None,
+            "deltas": len(self._deltas),
+        }
+
+    async def _reload(self) -> None:
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return
+        current = self.snapshot
+        if current is None or mtime != current.mtime:
+            try:
+                fresh = PremiumSnapshot(self.path)
+            except Exception as e:
+                print("[Snapshot] failed to load", self.path, repr(e))
+                return
+            self.snapshot = fresh
+            if current is not None:
+                current.close()
+            print(f"[Snapshot] loaded {fresh.count} entries built_at={fresh.built_at}")
+        await self._load_deltas()
+
+    async def _load_deltas(self) -> None:
+        snap = self.snapshot
+        if snap is None:
+            return
+        try:
+            client = await self.cache.get_client()
+            since = snap.built_at - DELTA_MARGIN_SECONDS
+            members = await client.zrangebyscore(DELTA_KEY, since, "+inf")
+        except Exception as e:
+            print("[Snapshot] failed to load deltas:", repr(e))
+            return
+        # Replace rather than merge so entries folded into a newer snapshot are dropped
+        self._deltas.clear()
+        self._deltas.update(members)
+
+    async def _reload_loop(self) -> None:
+        while True:
+            await asyncio.sleep(settings.snapshot_reload_interval_seconds)
+            try:
+                await self._reload()
+            except Exception as e:
+                print("[Snapshot] reload error:", repr(e))
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.snapshot is not None:
+            self.snapshot.close()
+            self.snapshot = None
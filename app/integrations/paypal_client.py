@@ -1,24 +1,106 @@
+import asyncio
 import base64
+import json
 import time
-from datetime import datetime, timedelta, timezone
+import uuid
+from datetime import datetime, timezone
 import os
-from typing import Dict, List, Optional, cast
+from typing import Any, Dict, Iterator, List, Optional, Tuple, cast
 
+import httpx
 import requests
 
 from app.core.config import settings
+from app.core.metrics import PAYPAL_ORDER_LOOKUPS, PAYPAL_SECONDS
+from app.core.singleflight import SingleFlight
+from app.integrations.paypal_limiter import (
+    BULK,
+    WEBHOOK,
+    AsyncPayPalRateLimiter,
+    PayPalRateLimiter,
+    app_scope,
+    backoff_delay,
+    retry_after_seconds,
+)
+
+# Tokens are treated as expired this many seconds early
+TOKEN_EXPIRY_MARGIN = 60
+# Holder of the refresh lock fetches a new token within this window
+TOKEN_LOCK_TTL_MS = 10000
+TOKEN_LOCK_WAIT_SECONDS = 5.0
+# Redis key for a cached order_id -> payer email answer ("" records "not found")
+ORDER_EMAIL_KEY = "paypal:order-email:{order_id}"
+_RELEASE_LOCK = (
+    "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+)
+
+
+def format_paypal_time(dt: datetime) -> str:
+    # Use UTC timezone and output like 2014-07-12T00:00:00+0000 (offset without colon)
+    return dt.astimezone(timezone.utc).replace(microsecond=0).strftime("%Y-%m-%dT%H:%M:%S%z")
+
+
+def normalize_transaction(t: Dict) -> Dict:
+    """Reduce a reporting API transaction_detail to {date, email, amount}."""
+    payer_info = t.get("payer_info", {})
+    payer_email = payer_info.get("email_address")
+    tx_info = t.get("transaction_info", {})
+    amount = None
+    amt = tx_info.get("transaction_amount") or {}
+    if "value" in amt:
+        amount = f"{amt.get('value')} {amt.get('currency_code', '')}".strip()
+    # Use transaction initiation/creation time
+    date = tx_info.get("transaction_initiation_date") or tx_info.get("transaction_updated_date")
+    return {
+        "date": date,
+        "email": payer_email,
+        "amount": amount,
+    }
+
+
+def _token_keys(client_id: str, base_url: str) -> Tuple[str, str]:
+    """Redis keys for the shared token and its refresh lock (per app + environment)."""
+    scope = app_scope(client_id, base_url)
+    return f"paypal:oauth:{scope}", f"lock:paypal:oauth:{scope}"
+
+
+def _encode_token(payload: Dict[str, Any]) -> Tuple[str, int, Dict[str, Any]]:
+    """Turn an OAuth response into (stored JSON, Redis TTL seconds, record)."""
+    expires_in = int(payload.get("expires_in", 28800))  # default 8h
+    record = {
+        "access_token": payload["access_token"],
+        "expires_at": time.time() + expires_in,
+        "scope": payload.get("scope"),
+    }
+    return json.dumps(record), max(1, expires_in - TOKEN_EXPIRY_MARGIN), record
+
+
+def _decode_token(raw: Optional[str]) -> Optional[Dict[str, Any]]:
+    if not raw:
+        return None
+    try:
+        record = json.loads(raw)
+    except Exception:
+        return None
+    if time.time() >= float(record.get("expires_at", 0)) - TOKEN_EXPIRY_MARGIN:
+        return None
+    return record
 
 
 class PayPalClient:
     """Minimal PayPal REST API client for OAuth and transaction search.
 
     Note: This uses blocking requests; for occasional cron jobs this is acceptable.
+    The API process uses AsyncPayPalClient instead. Both share the OAuth token through
+    Redis (PAYPAL_TOKEN_CACHE_ENABLED), so the refresh cron keeps every process supplied,
+    and both draw on the same request budgets (app.integrations.paypal_limiter) at `priority`.
     """
 
     def __init__(self,
                  client_id: Optional[str] = None,
                  client_secret: Optional[str] = None,
-                 base_url: Optional[str] = None):
+                 base_url: Optional[str] = None,
+                 priority: str = BULK):
         self.client_id = client_id or settings.paypal_client_id
         self.client_secret = client_secret or settings.paypal_client_secret
         self.base_url = (base_url or settings.paypal_base_url).rstrip("/")
@@ -29,48 +111,154 @@ class PayPalClient:
         self._token_expiry = 0.0   # type: float
         self._token_scopes = None  # type: Optional[str]
         self._debug = os.getenv("PAYPAL_DEBUG") not in (None, "", "0", "false", "False")
+        self._token_key, self._lock_key = _token_keys(self.client_id, self.base_url)
+        self._redis = None  # type: Any
+        self.limiter = PayPalRateLimiter(app_scope(self.client_id, self.base_url), priority)
+        # Keep-alive pool reused across pages/slices (sync jobs fetch concurrently from a few threads)
+        self._http = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=settings.paypal_http_max_connections)
+        self._http.mount("https://", adapter)
+        self._http.mount("http://", adapter)
+
+    def _shared_store(self):
+        """Lazily connected sync Redis client for the shared token; None when disabled/unavailable."""
+        if not settings.paypal_token_cache_enabled:
+            return None
+        if self._redis is None:
+            from redis import Redis
+            self._redis = Redis.from_url(
+                settings.redis_url,
+                decode_responses=True,
+                socket_timeout=settings.redis_socket_timeout,
+                socket_connect_timeout=settings.redis_socket_connect_timeout,
+            )
+        return self._redis
+
+    def _send(self, op: str, method: str, url: str, **kwargs: Any) -> requests.Response:
+        """One HTTP call within the shared budget, each attempt timed into paypal_request_seconds{op, status}.
+
+        A 429 pauses the endpoint for every process and is retried up to PAYPAL_MAX_RETRIES
+        times, after Retry-After or a jittered exponential backoff; the last answer is returned.
+        """
+        attempt = 0
+        while True:
+            self.limiter.acquire(op)
+            started = time.perf_counter()
+            status = "error"
+            try:
+                resp = self._http.request(method, url, **kwargs)
+                status = str(resp.status_code)
+            finally:
+                PAYPAL_SECONDS.labels(op, status).observe(time.perf_counter() - started)
+            if resp.status_code != 429 or attempt >= settings.paypal_max_retries:
+                return resp
+            delay = backoff_delay(attempt, retry_after_seconds(resp.headers))
+            self.limiter.pause(op, delay)
+            time.sleep(delay)
+            attempt += 1
+
+    def _use_record(self, record: Dict[str, Any]) -> str:
+        self._access_token = record["access_token"]
+        self._token_expiry = float(record["expires_at"])
+        self._token_scopes = record.get("scope")
+        return cast(str, self._access_token)
+
+    def _read_shared_token(self) -> Optional[Dict[str, Any]]:
+        try:
+            store = self._shared_store()
+            return _decode_token(store.get(self._token_key)) if store is not None else None
+        except Exception as e:
+            if self._debug:
+                print("[PayPal] shared token read failed:", repr(e))
+            return None
 
     def get_access_token(self, force_refresh: bool = False) -> str:
-        if not force_refresh and self._access_token and time.time() < self._token_expiry - 60:
+        if not force_refresh and self._access_token and time.time() < self._token_expiry - TOKEN_EXPIRY_MARGIN:
             if self._access_token is None:
                 raise RuntimeError("Access token is not available")
             return self._access_token
 
-        token_url = f"{self.base_url}/v1/oauth2/token"
-        # cast because we validate in __init__ they are present
-        auth = (cast(str, self.client_id), cast(str, self.client_secret))
-        data = {"grant_type": "client_credentials"}
-        resp = requests.post(token_url, data=data, auth=auth, timeout=20)
-        resp.raise_for_status()
-        payload = resp.json()
-        self._access_token = payload["access_token"]
-        expires_in = int(payload.get("expires_in", 28800))  # default 8h
-        self._token_expiry = time.time() + expires_in
-        self._token_scopes = payload.get("scope")
-        if self._debug:
-            print("[PayPal] Issued token; scopes:", self._token_scopes, "expires_in:", expires_in)
-        return cast(str, self._access_token)
+        if not force_refresh:
+            record = self._read_shared_token()
+            if record is not None:
+                return self._use_record(record)
+
+        # Only one process refreshes at a time; the others wait for its token
+        store = None
+        lock_token = uuid.uuid4().hex
+        try:
+            store = self._shared_store()
+            if store is not None and not store.set(self._lock_key, lock_token, nx=True, px=TOKEN_LOCK_TTL_MS):
+                if not force_refresh:
+                    deadline = time.time() + TOKEN_LOCK_WAIT_SECONDS
+                    while time.time() < deadline:
+                        time.sleep(0.1)
+                        record = self._read_shared_token()
+                        if record is not None:
+                            return self._use_record(record)
+                store = None  # we do not own the lock
+        except Exception:
+            store = None
 
-    def search_transactions_last_hour(self) -> List[Dict]:
-        now = datetime.now(timezone.utc)
-        start_time = now - timedelta(hours=24)
-        return self.search_transactions(start_time, now)
+        try:
+            token_url = f"{self.base_url}/v1/oauth2/token"
+            # cast because we validate in __init__ they are present
+            auth = (cast(str, self.client_id), cast(str, self.client_secret))
+            data = {"grant_type": "client_credentials"}
+            resp = self._send("oauth_token", "POST", token_url, data=data, auth=auth, timeout=20)
+            resp.raise_for_status()
+            raw, ttl, record = _encode_token(resp.json())
+            self._use_record(record)
+            if self._debug:
+                print("[PayPal] Issued token; scopes:", self._token_scopes, "expires_in:", ttl + TOKEN_EXPIRY_MARGIN)
+            try:
+                shared = self._shared_store()
+                if shared is not None:
+                    shared.set(self._token_key, raw, ex=ttl)
+            except Exception as e:
+                if self._debug:
+                    print("[PayPal] shared token write failed:", repr(e))
+            return cast(str, self._access_token)
+        finally:
+            if store is not None:
+                try:
+                    store.eval(_RELEASE_LOCK, 1, self._lock_key, lock_token)
+                except Exception:
+                    pass
 
     def search_transactions(self, start_time: datetime, end_time: datetime) -> List[Dict]:
-        # Use UTC timezone and output like 2014-07-12T00:00:00+0000 (offset without colon)
-        def fmt(dt: datetime) -> str:
-            return dt.astimezone(timezone.utc).replace(microsecond=0).strftime("%Y-%m-%dT%H:%M:%S%z")
+        """All transactions in the window as one list. Prefer iter_transactions for large windows."""
+        return list(self.iter_transactions(start_time, end_time))
 
+    def iter_transactions(self, start_time: datetime, end_time: datetime, page_size: int = 500) -> Iterator[Dict]:
+        """Yield normalized {date, email, amount} items for every page of the window."""
+        page = 1
+        while True:
+            data = self.fetch_transactions_page(start_time, end_time, page, page_size)
+            for t in data.get("transaction_details", []):
+                yield normalize_transaction(t)
+            total_pages = int(data.get("total_pages") or 1)
+            if page >= total_pages:
+                break
+            page += 1
+
+    def fetch_transactions_page(self, start_time: datetime, end_time: datetime, page: int, page_size: int) -> Dict:
+        """One raw page of GET /v1/reporting/transactions (page numbers start at 1)."""
         token = self.get_access_token()
         headers = {"Authorization": f"Bearer {token}"}
         params = {
-            "start_date": fmt(start_time),
-            "end_date": fmt(end_time),
+            "start_date": format_paypal_time(start_time),
+            "end_date": format_paypal_time(end_time),
             "fields": "all",
-            "page_size": 100
+            "page_size": page_size,
+            "page": page,
         }
         url = f"{self.base_url}/v1/reporting/transactions"
-        resp = requests.get(url, headers=headers, params=params, timeout=30)
+        resp = self._send("transactions", "GET", url, headers=headers, params=params, timeout=30)
+        if resp.status_code == 401:
+            # Token revoked/expired early: refresh once and retry
+            headers = {"Authorization": f"Bearer {self.get_access_token(force_refresh=True)}"}
+            resp = self._send("transactions", "GET", url, headers=headers, params=params, timeout=30)
         try:
             resp.raise_for_status()
         except requests.HTTPError as e:
@@ -83,27 +271,7 @@ class PayPalClient:
             if self._debug:
                 print("[PayPal]", msg)
             raise
-        data = resp.json()
-
-        # Normalize a list of {date, email, amount}
-        items: List[Dict] = []
-        txns = data.get("transaction_details", [])
-        for t in txns:
-            payer_info = t.get("payer_info", {})
-            payer_email = payer_info.get("email_address")
-            tx_info = t.get("transaction_info", {})
-            amount = None
-            amt = tx_info.get("transaction_amount") or {}
-            if "value" in amt:
-                amount = f"{amt.get('value')} {amt.get('currency_code', '')}".strip()
-            # Use transaction initiation/creation time
-            date = tx_info.get("transaction_initiation_date") or tx_info.get("transaction_updated_date")
-            items.append({
-                "date": date,
-                "email": payer_email,
-                "amount": amount,
-            })
-        return items
+        return resp.json()
 
     def get_payer_email_by_order_id(self, order_id: str) -> Optional[str]:
         """Return the payer email for a given PayPal order_id using Checkout Orders API.
@@ -119,7 +287,7 @@ class PayPalClient:
         url = f"{self.base_url}/v2/checkout/orders/{order_id}"
         if self._debug:
             print("[PayPal] GET", url)
-        resp = requests.get(url, headers=headers, timeout=20)
+        resp = self._send("order", "GET", url, headers=headers, timeout=20)
         if resp.status_code == 404:
             return None
         try:
@@ -152,7 +320,7 @@ class PayPalClient:
         headers = {"Authorization": f"Bearer {token}"}
         url = f"{self.base_url}/v2/payments/captures/{capture_id}"
         print(url)
-        resp = requests.get(url, headers=headers, timeout=20)
+        resp = self._send("capture", "GET", url, headers=headers, timeout=20)
         try:
             resp.raise_for_status()
         except requests.HTTPError:
@@ -167,3 +335,205 @@ class PayPalClient:
             print("[PayPal] Non-JSON capture response:", resp.text)
             return
         print("[PayPal] capture:", data)
+
+
+class AsyncPayPalClient:
+    """Async PayPal client for the API process.
+
+    One instance per worker (see app.main lifespan) owns a pooled httpx.AsyncClient
+    (HTTP/2 when available), so calls never block the event loop and connections are reused.
+    The OAuth token lives in Redis next to PayPalClient's, guarded by a refresh lock.
+    Order lookups for webhooks go through payer_email_for_order, which caches them in Redis.
+    Calls draw on the shared request budgets at webhook priority (see PayPalClient).
+    """
+
+    def __init__(self,
+                 cache=None,
+                 client_id: Optional[str] = None,
+                 client_secret: Optional[str] = None,
+                 base_url: Optional[str] = None,
+                 priority: str = WEBHOOK):
+        self.client_id = client_id or settings.paypal_client_id
+        self.client_secret = client_secret or settings.paypal_client_secret
+        self.base_url = (base_url or settings.paypal_base_url).rstrip("/")
+        if not self.client_id or not self.client_secret:
+            raise RuntimeError("PAYPAL_CLIENT_ID and PAYPAL_CLIENT_SECRET must be set")
+        # RedisCache (or None): provides the shared token store and lock
+        self.cache = cache if settings.paypal_token_cache_enabled else None
+        # RedisCache (or None) for order_id -> payer email answers
+        self.order_cache = cache if settings.paypal_order_cache_ttl_seconds > 0 else None
+        self._order_lookups = SingleFlight()
+        self.limiter = AsyncPayPalRateLimiter(cache, app_scope(self.client_id, self.base_url), priority)
+        self._token_key, lock_key = _token_keys(self.client_id, self.base_url)
+        self._lock_name = lock_key[len("lock:"):]
+        self._record: Optional[Dict[str, Any]] = None
+        self._refreshing: Optional[asyncio.Task] = None
+        self._debug = os.getenv("PAYPAL_DEBUG") not in (None, "", "0", "false", "False")
+        self._http = httpx.AsyncClient(
+            base_url=self.base_url,
+            http2=settings.paypal_http2,
+            limits=httpx.Limits(
+                max_connections=settings.paypal_http_max_connections,
+                max_keepalive_connections=settings.paypal_http_max_connections,
+            ),
+            timeout=httpx.Timeout(settings.paypal_http_timeout),
+        )
+
+    async def aclose(self) -> None:
+        await self._http.aclose()
+
+    async def get_access_token(self, force_refresh: bool = False) -> str:
+        record = self._record
+        if not force_refresh and record and time.time() < record["expires_at"] - TOKEN_EXPIRY_MARGIN:
+            return record["access_token"]
+        if not force_refresh:
+            shared = await self._read_shared_token()
+            if shared is not None:
+                self._record = shared
+                return shared["access_token"]
+        # Coalesce refreshes within this worker
+        if self._refreshing is None:
+            self._refreshing = asyncio.ensure_future(self._refresh(force_refresh))
+            self._refreshing.add_done_callback(lambda _: setattr(self, "_refreshing", None))
+        return await asyncio.shield(self._refreshing)
+
+    async def _read_shared_token(self) -> Optional[Dict[str, Any]]:
+        if self.cache is None:
+            return None
+        try:
+            client = await self.cache.get_client()
+            return _decode_token(await client.get(self._token_key))
+        except Exception as e:
+            if self._debug:
+                print("[PayPal] shared token read failed:", repr(e))
+            return None
+
+    async def _refresh(self, force_refresh: bool) -> str:
+        lock_token: Optional[str] = None
+        if self.cache is not None:
+            try:
+                lock_token = await self.cache.acquire_lock(self._lock_name, TOKEN_LOCK_TTL_MS)
+            except Exception:
+                lock_token = None
+            else:
+                if lock_token is None and not force_refresh:
+                    # Another worker/script is refreshing; wait for its token
+                    deadline = time.time() + TOKEN_LOCK_WAIT_SECONDS
+                    while time.time() < deadline:
+                        await asyncio.sleep(0.1)
+                        shared = await self._read_shared_token()
+                        if shared is not None:
+                            self._record = shared
+                            return shared["access_token"]
+        try:
+            resp = await self._send(
+                "oauth_token", "POST", "/v1/oauth2/token",
+                data={"grant_type": "client_credentials"},
+                auth=(cast(str, self.client_id), cast(str, self.client_secret)),
+            )
+            resp.raise_for_status()
+            raw, ttl, record = _encode_token(resp.json())
+            self._record = record
+            if self._debug:
+                print("[PayPal] Issued token; scopes:", record.get("scope"), "expires_in:", ttl + TOKEN_EXPIRY_MARGIN)
+            if self.cache is not None:
+                try:
+                    client = await self.cache.get_client()
+                    await client.set(self._token_key, raw, ex=ttl)
+                except Exception as e:
+                    if self._debug:
+                        print("[PayPal] shared token write failed:", repr(e))
+            return record["access_token"]
+        finally:
+            if lock_token is not None:
+                try:
+                    await self.cache.release_lock(self._lock_name, lock_token)
+                except Exception:
+                    pass
+
+    async def _send(self, op: str, method: str, path: str, **kwargs: Any) -> httpx.Response:
+        """Async variant of PayPalClient._send (shared budget, 429 retries with backoff)."""
+        attempt = 0
+        while True:
+            await self.limiter.acquire(op)
+            started = time.perf_counter()
+            status = "error"
+            try:
+                resp = await self._http.request(method, path, **kwargs)
+                status = str(resp.status_code)
+            finally:
+                PAYPAL_SECONDS.labels(op, status).observe(time.perf_counter() - started)
+            if resp.status_code != 429 or attempt >= settings.paypal_max_retries:
+                return resp
+            delay = backoff_delay(attempt, retry_after_seconds(resp.headers))
+            await self.limiter.pause(op, delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _get(self, op: str, path: str) -> httpx.Response:
+        token = await self.get_access_token()
+        resp = await self._send(op, "GET", path, headers={"Authorization": f"Bearer {token}"})
+        if resp.status_code == 401:
+            # Token revoked/expired early: refresh once and retry
+            token = await self.get_access_token(force_refresh=True)
+            resp = await self._send(op, "GET", path, headers={"Authorization": f"Bearer {token}"})
+        return resp
+
+    async def get_payer_email_by_order_id(self, order_id: str) -> Optional[str]:
+        """Async variant of PayPalClient.get_payer_email_by_order_id (GET /v2/checkout/orders/{id})."""
+        if not order_id:
+            return None
+        path = f"/v2/checkout/orders/{order_id}"
+        if self._debug:
+            print("[PayPal] GET", self.base_url + path)
+        resp = await self._get("order", path)
+        if resp.status_code == 404:
+            return None
+        try:
+            resp.raise_for_status()
+        except httpx.HTTPStatusError:
+            if self._debug:
+                print("[PayPal] order lookup failed:", resp.status_code, resp.text)
+            raise
+        data = resp.json()
+        payer = data.get("payer", {}) if isinstance(data, dict) else {}
+        email = payer.get("email_address") if isinstance(payer, dict) else None
+        return email if isinstance(email, str) else None
+
+    async def payer_email_for_order(self, order_id: str) -> Optional[str]:
+        """get_payer_email_by_order_id through the shared order cache.
+
+        Answers are kept in Redis for PAYPAL_ORDER_CACHE_TTL_SECONDS; "not found" (404 or no
+        payer email) for PAYPAL_ORDER_NEGATIVE_TTL_SECONDS. Concurrent lookups of one order in
+        this worker share one request. Errors (429, 5xx, timeouts) are raised, not cached.
+        """
+        if not order_id:
+            return None
+        key = ORDER_EMAIL_KEY.format(order_id=order_id)
+        if self.order_cache is not None:
+            try:
+                client = await self.order_cache.get_client()
+                cached = await client.get(key)
+            except Exception as e:
+                if self._debug:
+                    print("[PayPal] order cache read failed:", repr(e))
+                cached = None
+            if cached is not None:
+                PAYPAL_ORDER_LOOKUPS.labels("cache").inc()
+                return cached or None
+        if self._order_lookups.in_flight(order_id):
+            PAYPAL_ORDER_LOOKUPS.labels("coalesced").inc()
+        return await self._order_lookups.do(order_id, lambda: self._lookup_order(order_id, key))
+
+    async def _lookup_order(self, order_id: str, key: str) -> Optional[str]:
+        PAYPAL_ORDER_LOOKUPS.labels("remote").inc()
+        email = await self.get_payer_email_by_order_id(order_id)
+        ttl = settings.paypal_order_cache_ttl_seconds if email else settings.paypal_order_negative_ttl_seconds
+        if self.order_cache is not None and ttl > 0:
+            try:
+                client = await self.order_cache.get_client()
+                await client.set(key, email or "", ex=ttl)
+            except Exception as e:
+                if self._debug:
+                    print("[PayPal] order cache write failed:", repr(e))
+        return email
@@ -0,0 +1,261 @@
+"""Cluster-wide budgets for outbound PayPal calls, shared by every API worker and script.
+
+Each call takes one token from two Redis token buckets in one Lua script: its endpoint's
+bucket (oauth, reporting or orders; PAYPAL_RATE_<ENDPOINT>_PER_SECOND) and a bucket for the
+whole app (PAYPAL_RATE_GLOBAL_PER_SECOND). Each bucket holds PAYPAL_RATE_BURST_SECONDS worth
+of tokens. The script reads the clock with Redis TIME, so hosts with skewed clocks share
+one timeline. It returns how long to wait when a token is not available, and callers sleep
+that long and try again, up to PAYPAL_RATE_MAX_WAIT_SECONDS.
+
+Priorities: webhook-path calls (the API process) may empty a bucket. Bulk callers (the
+hourly sync, cron scripts) must leave PAYPAL_RATE_WEBHOOK_RESERVE of every bucket untouched,
+so a sync running at full speed never starves the order lookups of incoming webhooks.
+
+A 429 from PayPal pauses its endpoint for every process: the Retry-After delay, or a
+jittered exponential backoff without one, is stored as a Redis key that the script checks
+first (see backoff_delay and the clients' _send).
+
+Without Redis, calls are not limited (fail open); 429s are still retried with backoff.
+"""
+import asyncio
+import hashlib
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import PAYPAL_LIMITER_WAIT_SECONDS, PAYPAL_RATE_LIMITED
+
+WEBHOOK = "webhook"
+BULK = "bulk"
+# paypal_request_seconds op -> budget
+ENDPOINTS = {
+    "oauth_token": "oauth",
+    "transactions": "reporting",
+    "order": "orders",
+    "capture": "orders",
+}
+
+# KEYS: endpoint bucket, global bucket, endpoint pause
+# ARGV: endpoint rate, endpoint burst, global rate, global burst, reserve fraction
+# Returns 0 when a token was taken from both buckets, else milliseconds to wait
+_TAKE = """
+if redis.replicate_commands then redis.replicate_commands() end
+local paused = redis.call('PTTL', KEYS[3])
+if paused > 0 then return paused end
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local reserve = tonumber(ARGV[5])
+local wait = 0
+local left = {}
+for i = 1, 2 do
+  local rate = tonumber(ARGV[i * 2 - 1])
+  local burst = tonumber(ARGV[i * 2])
+  if rate > 0 then
+    local state = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate / 1000)
+    -- Bulk callers leave the reserve, but can always use a full bucket
+    local short = 1 + math.min(burst * reserve, burst - 1) - tokens
+    if short > 0 then
+      wait = math.max(wait, math.ceil(short * 1000 / rate))
+    end
+    left[i] = tokens
+  end
+end
+if wait > 0 then return wait end
+for i = 1, 2 do
+  if left[i] then
+    local rate = tonumber(ARGV[i * 2 - 1])
+    local burst = tonumber(ARGV[i * 2])
+    redis.call('HSET', KEYS[i], 'tokens', left[i] - 1, 'ts', now)
+    redis.call('PEXPIRE', KEYS[i], math.ceil(burst * 1000 / rate) + 1000)
+  end
+end
+return 0
+"""
+
+# Extends the pause on an endpoint, never shortens it. KEYS: pause key; ARGV: milliseconds
+_PAUSE = """
+if redis.call('PTTL', KEYS[1]) < tonumber(ARGV[1]) then
+  redis.call('SET', KEYS[1], '1', 'PX', ARGV[1])
+end
+return 0
+"""
+
+
+class RateLimitTimeout(Exception):
+    """No token became available within PAYPAL_RATE_MAX_WAIT_SECONDS."""
+
+
+def _rate(endpoint: str) -> float:
+    return {
+        "oauth": settings.paypal_rate_oauth_per_second,
+        "reporting": settings.paypal_rate_reporting_per_second,
+        "orders": settings.paypal_rate_orders_per_second,
+    }.get(endpoint, 0.0)
+
+
+def _burst(rate: float) -> float:
+    return max(1.0, rate * settings.paypal_rate_burst_seconds) if rate > 0 else 0.0
+
+
+def bucket_keys(scope: str, endpoint: str) -> List[str]:
+    prefix = f"paypal:ratelimit:{scope}"
+    return [f"{prefix}:{endpoint}", f"{prefix}:all", f"{prefix}:{endpoint}:paused"]
+
+
+def bucket_args(endpoint: str, priority: str) -> List[Any]:
+    rate = _rate(endpoint)
+    global_rate = settings.paypal_rate_global_per_second
+    reserve = 0.0 if priority == WEBHOOK else min(0.9, max(0.0, settings.paypal_rate_webhook_reserve))
+    return [rate, _burst(rate), global_rate, _burst(global_rate), reserve]
+
+
+def app_scope(client_id: str, base_url: str) -> str:
+    """Redis key scope for one PayPal app and environment (budgets, shared OAuth token)."""
+    return hashlib.sha1(f"{client_id}|{base_url}".encode("utf-8")).hexdigest()[:16]
+
+
+def retry_after_seconds(headers: Any) -> Optional[float]:
+    """Seconds from a Retry-After header (delta-seconds form), or None."""
+    raw = headers.get("Retry-After") if headers is not None else None
+    try:
+        return max(0.0, float(raw)) if raw is not None else None
+    except ValueError:
+        return None
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float]) -> float:
+    """Delay before retry `attempt` (0-based): Retry-After when PayPal sent one, else full jitter."""
+    if retry_after is not None:
+        return min(retry_after, settings.paypal_backoff_max_seconds)
+    cap = min(settings.paypal_backoff_max_seconds, settings.paypal_backoff_base_seconds * (2 ** attempt))
+    return random.uniform(0, cap)
+
+
+def _record(endpoint: str, priority: str, waited: float) -> None:
+    PAYPAL_LIMITER_WAIT_SECONDS.labels(endpoint, priority).observe(waited)
+
+
+class PayPalRateLimiter:
+    """Blocking limiter for PayPalClient (cron scripts and the sync's worker threads)."""
+
+    def __init__(self, scope: str, priority: str = BULK):
+        self.scope = scope
+        self.priority = priority
+        self.enabled = settings.paypal_rate_limit_enabled
+        self._redis = None  # type: Any
+        self._take = None  # type: Any
+        self._pause = None  # type: Any
+        self._lock = threading.Lock()
+
+    def _scripts(self) -> Tuple[Any, Any]:
+        with self._lock:
+            if self._redis is None:
+                from redis import Redis
+                self._redis = Redis.from_url(
+                    settings.redis_url,
+                    decode_responses=True,
+                    socket_timeout=settings.redis_socket_timeout,
+                    socket_connect_timeout=settings.redis_socket_connect_timeout,
+                )
+                self._take = self._redis.register_script(_TAKE)
+                self._pause = self._redis.register_script(_PAUSE)
+        return self._take, self._pause
+
+    def acquire(self, op: str) -> float:
+        """Wait for a token for `op`'s endpoint; returns the seconds waited."""
+        endpoint = ENDPOINTS.get(op, "other")
+        if not self.enabled:
+            return 0.0
+        started = time.monotonic()
+        deadline = started + settings.paypal_rate_max_wait_seconds
+        keys = bucket_keys(self.scope, endpoint)
+        args = bucket_args(endpoint, self.priority)
+        while True:
+            try:
+                take, _ = self._scripts()
+                wait_ms = int(take(keys=keys, args=args))
+            except Exception as e:
+                print("[PayPal Limiter] Redis unavailable; not limiting:", repr(e))
+                wait_ms = 0
+            if wait_ms <= 0:
+                waited = time.monotonic() - started
+                _record(endpoint, self.priority, waited)
+                return waited
+            if time.monotonic() + wait_ms / 1000.0 > deadline:
+                _record(endpoint, self.priority, time.monotonic() - started)
+                raise RateLimitTimeout(f"PayPal {endpoint} budget exhausted")
+            time.sleep(wait_ms / 1000.0)
+
+    def pause(self, op: str, seconds: float) -> None:
+        """Hold every process's calls to `op`'s endpoint for `seconds` (after a 429)."""
+        endpoint = ENDPOINTS.get(op, "other")
+        PAYPAL_RATE_LIMITED.labels(endpoint).inc()
+        if not self.enabled or seconds <= 0:
+            return
+        try:
+            _, pause = self._scripts()
+            pause(keys=[bucket_keys(self.scope, endpoint)[2]], args=[int(seconds * 1000)])
+        except Exception as e:
+            print("[PayPal Limiter] could not share the pause:", repr(e))
+
+
+class AsyncPayPalRateLimiter:
+    """Event-loop limiter for AsyncPayPalClient; uses the worker's pooled RedisCache client."""
+
+    def __init__(self, cache, scope: str, priority: str = WEBHOOK):
+        self.cache = cache
+        self.scope = scope
+        self.priority = priority
+        self.enabled = settings.paypal_rate_limit_enabled and cache is not None
+        self._scripts: Dict[int, Tuple[Any, Any]] = {}
+
+    async def _get_scripts(self) -> Tuple[Any, Any]:
+        client = await self.cache.get_client()
+        # Script objects are bound to a client; the cache may replace its client on reconnect
+        scripts = self._scripts.get(id(client))
+        if scripts is None:
+            scripts = (client.register_script(_TAKE), client.register_script(_PAUSE))
+            self._scripts = {id(client): scripts}
+        return scripts
+
+    async def acquire(self, op: str) -> float:
+        """Wait for a token for `op`'s endpoint; returns the seconds waited."""
+        endpoint = ENDPOINTS.get(op, "other")
+        if not self.enabled:
+            return 0.0
+        started = time.monotonic()
+        deadline = started + settings.paypal_rate_max_wait_seconds
+        keys = bucket_keys(self.scope, endpoint)
+        args = bucket_args(endpoint, self.priority)
+        while True:
+            try:
+                take, _ = await self._get_scripts()
+                wait_ms = int(await take(keys=keys, args=args))
+            except Exception as e:
+                print("[PayPal Limiter] Redis unavailable; not limiting:", repr(e))
+                wait_ms = 0
+            if wait_ms <= 0:
+                waited = time.monotonic() - started
+                _record(endpoint, self.priority, waited)
+                return waited
+            if time.monotonic() + wait_ms / 1000.0 > deadline:
+                _record(endpoint, self.priority, time.monotonic() - started)
+                raise RateLimitTimeout(f"PayPal {endpoint} budget exhausted")
+            await asyncio.sleep(wait_ms / 1000.0)
+
+    async def pause(self, op: str, seconds: float) -> None:
+        """Hold every process's calls to `op`'s endpoint for `seconds` (after a 429)."""
+        endpoint = ENDPOINTS.get(op, "other")
+        PAYPAL_RATE_LIMITED.labels(endpoint).inc()
+        if not self.enabled or seconds <= 0:
+            return
+        try:
+            _, pause = await self._get_scripts()
+            await pause(keys=[bucket_keys(self.scope, endpoint)[2]], args=[int(seconds * 1000)])
+        except Exception as e:
+            print("[PayPal Limiter] could not share the pause:", repr(e))
@@ -0,0 +1,185 @@
+"""Checkpointed, parallel walk of PayPal's transaction reporting API.
+
+TransactionSync splits the window since the last checkpoint into time slices, fetches the
+slices concurrently (every page of each slice) under a shared request-rate limit, and yields
+normalized transactions as slices complete. The high-water mark only advances over a
+contiguous prefix of completed slices, so a crash never skips a gap. It is tracked, not
+saved: the caller saves it once the transactions are stored (save_checkpoint), so rows
+fetched but never written are read again by the next run.
+"""
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import requests
+
+from app.core.config import settings
+from app.integrations.paypal_client import PayPalClient, normalize_transaction
+
+# The reporting API rejects requests spanning over 31 days and result sets over 10k rows
+MAX_WINDOW = timedelta(days=31)
+MIN_SLICE = timedelta(minutes=1)
+
+
+class RateLimiter:
+    """Thread-safe pacing of requests to at most `rate` per second (evenly spaced)."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class TransactionSync:
+    """Sync engine over PayPalClient.fetch_transactions_page; see the module docstring."""
+
+    def __init__(self,
+                 client: Optional[PayPalClient] = None,
+                 slice_minutes: Optional[int] = None,
+                 concurrency: Optional[int] = None,
+                 requests_per_second: Optional[float] = None,
+                 page_size: Optional[int] = None,
+                 checkpoint_key: Optional[str] = None):
+        self.client = client or PayPalClient()
+        # Every slice is its own request, so it must stay within the API's 31 days
+        self.slice = min(MAX_WINDOW, timedelta(minutes=slice_minutes or settings.paypal_sync_slice_minutes))
+        self.concurrency = concurrency or settings.paypal_sync_concurrency
+        self.page_size = page_size or settings.paypal_sync_page_size
+        self.limiter = RateLimiter(requests_per_second or settings.paypal_sync_requests_per_second)
+        self.checkpoint_key = checkpoint_key or settings.paypal_sync_checkpoint_key
+        self._redis = None
+        self.pages_fetched = 0
+        self.items_yielded = 0
+        # End of the contiguous completed prefix of the current window (see iter_window)
+        self.high_water_mark: Optional[datetime] = None
+        self._count_lock = threading.Lock()
+
+    # --- checkpoint (Redis, shared by every host running the cron) ---
+    def _store(self):
+        if self._redis is None:
+            from redis import Redis
+            self._redis = Redis.from_url(settings.redis_url, decode_responses=True,
+                                         socket_timeout=settings.redis_socket_timeout)
+        return self._redis
+
+    def load_checkpoint(self) -> Optional[datetime]:
+        try:
+            raw = self._store().get(self.checkpoint_key)
+        except Exception as e:
+            print("[PayPal Sync] checkpoint read failed:", repr(e))
+            return None
+        if not raw:
+            return None
+        try:
+            return datetime.fromisoformat(raw)
+        except ValueError:
+            return None
+
+    def save_checkpoint(self, hwm: datetime) -> None:
+        try:
+            self._store().set(self.checkpoint_key, hwm.astimezone(timezone.utc).isoformat())
+        except Exception as e:
+            print("[PayPal Sync] checkpoint write failed:", repr(e))
+
+    # --- fetching ---
+    def _fetch_page(self, start: datetime, end: datetime, page: int) -> Dict:
+        self.limiter.acquire()
+        data = self.client.fetch_transactions_page(start, end, page, self.page_size)
+        with self._count_lock:
+            self.pages_fetched += 1
+        return data
+
+    def _fetch_slice(self, start: datetime, end: datetime) -> List[Dict]:
+        """Every page of one slice; halves the slice when PayPal reports it as too large."""
+        try:
+            first = self._fetch_page(start, end, 1)
+        except requests.HTTPError as e:
+            too_large = e.response is not None and "RESULTSET_TOO_LARGE" in (e.response.text or "")
+            if too_large and end - start > MIN_SLICE:
+                mid = start + (end - start) / 2
+                return self._fetch_slice(start, mid) + self._fetch_slice(mid, end)
+            raise
+        items = [normalize_transaction(t) for t in first.get("transaction_details", [])]
+        total_pages = int(first.get("total_pages") or 1)
+        for page in range(2, total_pages + 1):
+            data = self._fetch_page(start, end, page)
+            items.extend(normalize_transaction(t) for t in data.get("transaction_details", []))
+        return items
+
+    def _slices(self, start: datetime, end: datetime) -> List[Tuple[datetime, datetime]]:
+        out = []
+        cursor = start
+        while cursor < end:
+            nxt = min(cursor + self.slice, end)
+            out.append((cursor, nxt))
+            cursor = nxt
+        return out
+
+    def iter_window(self, start: datetime, end: datetime, checkpoint: bool = False) -> Iterator[Dict]:
+        """Yield transactions in [start, end) slice by slice as they complete (any order).
+
+        With `checkpoint`, `high_water_mark` is advanced to the end of the longest run of
+        completed slices from `start`; nothing is written to Redis. Windows longer than the
+        API's 31 days (a long outage) are walked in full, slice by slice.
+        """
+        slices = self._slices(start, end)
+        if end - start > MAX_WINDOW:
+            print(f"[PayPal Sync] catching up {end - start} of transactions in {len(slices)} slices")
+        completed: Set[int] = set()
+        next_contiguous = 0
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="paypal-sync") as pool:
+            pending: Dict[Future, int] = {}
+            queue = list(enumerate(slices))
+            queue.reverse()
+            while queue or pending:
+                # Bound in-flight slices so memory stays proportional to concurrency
+                while queue and len(pending) < self.concurrency:
+                    idx, (s, e) = queue.pop()
+                    pending[pool.submit(self._fetch_slice, s, e)] = idx
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                for fut in done:
+                    idx = pending.pop(fut)
+                    try:
+                        items = fut.result()
+                    except Exception:
+                        for other in pending:
+                            other.cancel()
+                        raise
+                    for item in items:
+                        self.items_yielded += 1
+                        yield item
+                    completed.add(idx)
+                    if checkpoint:
+                        advanced = False
+                        while next_contiguous in completed:
+                            next_contiguous += 1
+                            advanced = True
+                        if advanced:
+                            self.high_water_mark = slices[next_contiguous - 1][1]
+
+    def run(self) -> Iterator[Dict]:
+        """Yield transactions since the last checkpoint (minus a re-scan overlap for late rows).
+
+        Call save_checkpoint(high_water_mark) after the transactions have been stored.
+        """
+        now = datetime.now(timezone.utc)
+        hwm = self.load_checkpoint()
+        if hwm is None:
+            start = now - timedelta(hours=settings.paypal_sync_initial_lookback_hours)
+        else:
+            # PayPal makes transactions searchable with a delay; re-read that tail each run
+            start = hwm - timedelta(minutes=settings.paypal_sync_overlap_minutes)
+        print(f"[PayPal Sync] window {start.isoformat()} -> {now.isoformat()} (checkpoint={hwm})")
+        yield from self.iter_window(start, now, checkpoint=True)
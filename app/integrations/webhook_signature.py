@@ -0,0 +1,217 @@
+"""Local verification of PayPal webhook signatures (no verify-webhook-signature round trip).
+
+PayPal signs "<transmission id>|<transmission time>|<webhook id>|<crc32 of the raw body>"
+with the private key of the certificate at PAYPAL-CERT-URL, using PAYPAL-AUTH-ALGO
+(SHA256withRSA). The webhook id is ours (PAYPAL_WEBHOOK_ID), so an event signed for another
+webhook, or with a body changed in transit, does not verify.
+
+- The certificate URL must be https on a host in PAYPAL_WEBHOOK_CERT_HOSTS; anything else
+  is rejected before any download. Entries may also be origins such as
+  "http://127.0.0.1:8001" for local stand-ins.
+- Parsed certificates are kept per worker in an LRU (PAYPAL_WEBHOOK_CERT_CACHE_SIZE) until
+  their notAfter. The PEM is shared through Redis (`paypal:webhook:cert:<hash of URL>`,
+  expiring with the certificate), so one download serves every worker, and concurrent
+  misses for one URL are coalesced.
+- Once the certificate is cached, a verification is a CRC32 and one RSA public-key
+  operation: tens of microseconds, no I/O.
+
+The certificate fetcher is injectable (`fetcher(url) -> PEM bytes`), so self-signed
+certificates can be verified without network access.
+"""
+import base64
+import binascii
+import hashlib
+import time
+import zlib
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, FrozenSet, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.asymmetric.rsa import RSAPublicKey
+
+from app.core.config import settings
+from app.core.metrics import PAYPAL_SECONDS
+from app.core.singleflight import SingleFlight
+
+CERT_KEY = "paypal:webhook:cert:{digest}"
+_HASHES = {
+    "SHA256withRSA": hashes.SHA256,
+    "SHA384withRSA": hashes.SHA384,
+    "SHA512withRSA": hashes.SHA512,
+}
+
+Fetcher = Callable[[str], Awaitable[bytes]]
+
+
+class WebhookSignatureError(Exception):
+    """The event is not signed by PayPal for this webhook; reject it."""
+
+
+class CertificateUnavailable(Exception):
+    """The signing certificate could not be downloaded; the delivery can be retried."""
+
+
+def parse_cert_origins(raw: str) -> FrozenSet[Tuple[str, str]]:
+    """(scheme, host[:port]) pairs from a comma-separated list of hosts (https) or origins."""
+    origins = set()
+    for entry in raw.split(","):
+        entry = entry.strip().rstrip("/")
+        if not entry:
+            continue
+        if "://" in entry:
+            url = urlsplit(entry)
+            origins.add((url.scheme.lower(), url.netloc.lower()))
+        else:
+            origins.add(("https", entry.lower()))
+    return frozenset(origins)
+
+
+def signed_message(transmission_id: str, transmission_time: str, webhook_id: str, raw: bytes) -> bytes:
+    return f"{transmission_id}|{transmission_time}|{webhook_id}|{zlib.crc32(raw)}".encode()
+
+
+def load_certificate(pem: bytes, now: float) -> Tuple[RSAPublicKey, float]:
+    """(public key, notAfter epoch) of a PEM certificate valid at `now`."""
+    try:
+        cert = x509.load_pem_x509_certificate(pem)
+    except ValueError as e:
+        raise WebhookSignatureError(f"unreadable certificate: {e}") from e
+    not_before = cert.not_valid_before_utc.timestamp()
+    not_after = cert.not_valid_after_utc.timestamp()
+    if not not_before <= now < not_after:
+        raise WebhookSignatureError("certificate is not valid now")
+    key = cert.public_key()
+    if not isinstance(key, RSAPublicKey):
+        raise WebhookSignatureError("certificate key is not RSA")
+    return key, not_after
+
+
+class WebhookVerifier:
+    """Checks PAYPAL-TRANSMISSION-SIG on incoming events; one instance per worker."""
+
+    def __init__(self,
+                 cache=None,
+                 webhook_id: Optional[str] = None,
+                 cert_hosts: Optional[str] = None,
+                 fetcher: Optional[Fetcher] = None,
+                 max_certs: Optional[int] = None):
+        self.webhook_id = webhook_id or settings.paypal_webhook_id
+        if not self.webhook_id:
+            raise RuntimeError("PAYPAL_WEBHOOK_ID must be set to verify webhook signatures")
+        # RedisCache (or None): shares downloaded certificates between workers
+        self.cache = cache
+        self.origins = parse_cert_origins(cert_hosts if cert_hosts is not None else settings.paypal_webhook_cert_hosts)
+        self.max_certs = max(1, max_certs if max_certs is not None else settings.paypal_webhook_cert_cache_size)
+        self._fetcher = fetcher
+        self._http: Optional[httpx.AsyncClient] = None
+        self._certs: "OrderedDict[str, Tuple[RSAPublicKey, float]]" = OrderedDict()
+        self._loading = SingleFlight()
+
+    async def aclose(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+
+    async def verify(self, raw: bytes, headers: Dict[str, str]) -> None:
+        """Return if `raw` carries a valid signature; raises WebhookSignatureError or CertificateUnavailable.
+
+        `headers` uses lowercase names (see app.services.webhooks.WEBHOOK_HEADER_KEYS).
+        """
+        transmission_id = headers.get("paypal-transmission-id")
+        transmission_time = headers.get("paypal-transmission-time")
+        signature = headers.get("paypal-transmission-sig")
+        cert_url = headers.get("paypal-cert-url")
+        algo = headers.get("paypal-auth-algo")
+        if not (transmission_id and transmission_time and signature and cert_url and algo):
+            raise WebhookSignatureError("missing signature headers")
+        hash_type = _HASHES.get(algo)
+        if hash_type is None:
+            raise WebhookSignatureError(f"unsupported auth algo {algo!r}")
+        self.check_cert_url(cert_url)
+        try:
+            sig = base64.b64decode(signature, validate=True)
+        except (binascii.Error, ValueError) as e:
+            raise WebhookSignatureError("signature is not base64") from e
+
+        key = await self.public_key(cert_url)
+        message = signed_message(transmission_id, transmission_time, self.webhook_id, raw)
+        try:
+            key.verify(sig, message, padding.PKCS1v15(), hash_type())
+        except InvalidSignature as e:
+            raise WebhookSignatureError("signature mismatch") from e
+
+    def check_cert_url(self, cert_url: str) -> None:
+        url = urlsplit(cert_url)
+        if (url.scheme.lower(), url.netloc.lower()) not in self.origins or url.username or url.password:
+            raise WebhookSignatureError(f"certificate URL not allowed: {cert_url}")
+
+    async def public_key(self, cert_url: str) -> RSAPublicKey:
+        entry = self._certs.get(cert_url)
+        if entry is not None:
+            if time.time() < entry[1]:
+                self._certs.move_to_end(cert_url)
+                return entry[0]
+            del self._certs[cert_url]
+        return await self._loading.do(cert_url, lambda: self._load(cert_url))
+
+    async def _load(self, cert_url: str) -> RSAPublicKey:
+        now = time.time()
+        redis_key = CERT_KEY.format(digest=hashlib.sha1(cert_url.encode()).hexdigest())
+        shared = await self._read_shared(redis_key)
+        loaded = None
+        if shared is not None:
+            try:
+                loaded = load_certificate(shared.encode(), now)
+            except WebhookSignatureError:
+                loaded = None  # expired or damaged copy; download again
+        if loaded is None:
+            try:
+                pem = await self._fetch(cert_url)
+            except Exception as e:
+                raise CertificateUnavailable(f"certificate download failed: {e!r}") from e
+            loaded = load_certificate(pem, now)
+            await self._write_shared(redis_key, pem, int(loaded[1] - now))
+
+        self._certs[cert_url] = loaded
+        self._certs.move_to_end(cert_url)
+        while len(self._certs) > self.max_certs:
+            self._certs.popitem(last=False)
+        return loaded[0]
+
+    async def _fetch(self, cert_url: str) -> bytes:
+        if self._fetcher is not None:
+            return await self._fetcher(cert_url)
+        if self._http is None:
+            self._http = httpx.AsyncClient(timeout=httpx.Timeout(settings.paypal_http_timeout))
+        started = time.perf_counter()
+        status = "error"
+        try:
+            resp = await self._http.get(cert_url)
+            status = str(resp.status_code)
+        finally:
+            PAYPAL_SECONDS.labels("webhook_cert", status).observe(time.perf_counter() - started)
+        resp.raise_for_status()
+        return resp.content
+
+    async def _read_shared(self, redis_key: str) -> Optional[str]:
+        if self.cache is None:
+            return None
+        try:
+            client = await self.cache.get_client()
+            return await client.get(redis_key)
+        except Exception as e:
+            print("[Webhook Signature] shared certificate read failed:", repr(e))
+            return None
+
+    async def _write_shared(self, redis_key: str, pem: bytes, ttl: int) -> None:
+        if self.cache is None or ttl <= 0:
+            return
+        try:
+            client = await self.cache.get_client()
+            await client.set(redis_key, pem.decode("ascii"), ex=ttl)
+        except Exception as e:
+            print("[Webhook Signature] shared certificate write failed:", repr(e))
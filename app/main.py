@@ -1,18 +1,106 @@
-import uvicorn
-from fastapi import FastAPI
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Response
+from app.api.lookup_server import LookupServer
 from app.api.routes import router
 from app.core.config import settings
-from app.db.dynamodb import ensure_table_exists
+from app.core.metrics import MetricsMiddleware, mark_process_dead, render
+from app.db.cache_warmer import warm_cache
+from app.db.dynamodb import create_repository
+from app.db.redis_cache import RedisCache
+from app.db.snapshot import SnapshotManager
+from app.integrations.paypal_client import AsyncPayPalClient
+from app.integrations.webhook_signature import WebhookVerifier
+from app.services.premium import PremiumResolver
+from app.services.startup import StartupChecks
+from app.services.webhooks import WebhookProcessor, WebhookQueue, start_consumers, stop_consumers
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled Redis client and one DynamoDB resource per worker, shared by all requests.
+    # Building the boto3 session/resource is CPU-bound (service model loading), so it runs in a thread
+    app.state.cache = RedisCache()
+    app.state.repo = await asyncio.to_thread(create_repository)
+    await app.state.repo.start()
+    # Table check (once per deployment) and pool warm-up run in the background; /ready waits for them
+    app.state.startup = StartupChecks(app.state.cache, app.state.repo)
+    app.state.startup.start()
+    # Shared mmap'd snapshot for network-free "not premium" answers (optional)
+    app.state.snapshot = None
+    if settings.snapshot_path:
+        app.state.snapshot = SnapshotManager(app.state.cache)
+        await app.state.snapshot.start()
+    app.state.resolver = PremiumResolver(app.state.cache, app.state.repo, app.state.snapshot)
+    # Line-protocol lookups over TCP / a Unix socket for co-located callers (optional)
+    app.state.lookup_server = None
+    if settings.lookup_tcp_port or settings.lookup_unix_socket:
+        app.state.lookup_server = LookupServer(app.state.resolver)
+        await app.state.lookup_server.start()
+    # Pooled async PayPal client for webhook order lookups (token shared through Redis)
+    app.state.paypal = None
+    if settings.paypal_client_id and settings.paypal_client_secret:
+        app.state.paypal = AsyncPayPalClient(app.state.cache)
+    # Local webhook signature checks; certificates shared through Redis (off without PAYPAL_WEBHOOK_ID)
+    app.state.webhook_verifier = None
+    if settings.paypal_webhook_id:
+        app.state.webhook_verifier = WebhookVerifier(app.state.cache)
+    app.state.webhooks = WebhookProcessor(app.state.cache, app.state.repo, app.state.snapshot, app.state.paypal)
+    # Webhooks are queued on a Redis Stream and applied by background consumers
+    app.state.webhook_queue = None
+    app.state.webhook_consumers = []
+    if settings.webhook_queue_enabled:
+        app.state.webhook_queue = WebhookQueue(app.state.cache)
+        app.state.webhook_consumers = start_consumers(app.state.cache, app.state.webhooks, settings.webhook_consumers)
+    # Keep this worker's L1 (and snapshot deltas) coherent with writes made by other workers
+    await app.state.cache.start_invalidation_listener()
+    # Preload Redis from a table scan in a background thread; a Redis lock lets one worker do it
+    app.state.cache_warm_stop = threading.Event()
+    app.state.cache_warm_task = None
+    if settings.cache_warm_on_startup:
+        app.state.cache_warm_task = asyncio.create_task(
+            asyncio.to_thread(warm_cache, stop=app.state.cache_warm_stop)
+        )
+    try:
+        yield
+    finally:
+        if app.state.cache_warm_task is not None:
+            # The scan stops at its next page; the thread is joined by the default executor
+            app.state.cache_warm_stop.set()
+            await asyncio.gather(app.state.cache_warm_task, return_exceptions=True)
+        await app.state.startup.close()
+        await stop_consumers(app.state.webhook_consumers)
+        if app.state.lookup_server is not None:
+            await app.state.lookup_server.close()
+        await app.state.resolver.close()
+        if app.state.paypal is not None:
+            await app.state.paypal.aclose()
+        if app.state.webhook_verifier is not None:
+            await app.state.webhook_verifier.aclose()
+        if app.state.snapshot is not None:
+            await app.state.snapshot.close()
+        await app.state.cache.close()
+        await app.state.repo.aclose()
+        mark_process_dead()
 
-app = FastAPI(title=settings.app_name)
+
+app = FastAPI(title=settings.app_name, lifespan=lifespan)
 app.include_router(router, prefix=settings.api_prefix)
 
+if settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware)
 
-@app.on_event("startup")
-async def _startup():
-    # Ensure DynamoDB table exists at startup (idempotent)
-    ensure_table_exists(settings.dynamodb_table, settings.aws_region)
+    @app.get("/metrics", include_in_schema=False)
+    def metrics() -> Response:
+        # Plain def: merging the per-worker files is blocking I/O, so it runs in the threadpool
+        body, content_type = render()
+        return Response(body, media_type=content_type)
 
 
 if __name__ == "__main__":
+    # Only needed when run as a script; importing app.main (workers, tools) does not load it
+    import uvicorn
+
     uvicorn.run("app.main:app", host="0.0.0.0", port=8080, reload=False)
@@ -1,11 +1,50 @@
-from pydantic import BaseModel, EmailStr
+from typing import Annotated, Dict, List, Tuple
+
+import orjson
+from pydantic import AfterValidator, BaseModel, EmailStr, Field, WithJsonSchema
+
+from app.core.config import settings
+from app.core.emails import normalize_email
+
+# EmailStr-compatible (same normalized value, same errors, same OpenAPI schema) but cheaper;
+# see app.core.emails. PREMIUM_FAST_PATH=false switches the check routes back to EmailStr.
+FastEmailStr = Annotated[str, AfterValidator(normalize_email), WithJsonSchema({"type": "string", "format": "email"})]
+CheckEmail = FastEmailStr if settings.premium_fast_path else EmailStr
 
 
 class PremiumCheckRequest(BaseModel):
-    email: EmailStr
+    email: CheckEmail
 
 
 class PremiumCheckResponse(BaseModel):
     email: EmailStr
     premium: bool
-    source: str  # cache or db
+    source: str  # snapshot, cache or db
+
+
+class PremiumCheckBatchRequest(BaseModel):
+    emails: List[CheckEmail] = Field(min_length=1, max_length=settings.premium_batch_max_emails)
+
+
+class PremiumCheckBatchResponse(BaseModel):
+    # Same order as the request; duplicates are answered once and repeated
+    results: List[PremiumCheckResponse]
+
+
+# Everything after the email in a PremiumCheckResponse body, for each (premium, source)
+_CHECK_SUFFIXES: Dict[Tuple[bool, str], bytes] = {
+    (premium, source): b',"premium":' + (b"true" if premium else b"false") + b',"source":"' + source.encode() + b'"}'
+    for premium in (True, False)
+    for source in ("snapshot", "cache", "db")
+}
+
+
+def encode_check_response(email: str, premium: bool, source: str) -> bytes:
+    """JSON body of PremiumCheckResponse, byte-identical to FastAPI's rendering of the model.
+
+    `email` must already be normalized (it is not validated again).
+    """
+    suffix = _CHECK_SUFFIXES.get((premium, source))
+    if suffix is None:
+        return orjson.dumps({"email": email, "premium": premium, "source": source})
+    return b'{"email":' + orjson.dumps(email) + suffix
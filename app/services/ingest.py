@@ -0,0 +1,139 @@
+"""Bulk, deduplicated ingest of PayPal transactions into the premium table."""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.core.config import settings
+from app.db.cache_layout import make_layout, needs_server_info
+from app.db.dynamodb import BATCH_GET_MAX_KEYS, DynamoRepository, expiry_for_day
+from app.db.snapshot import DELTA_KEY, delta_mapping
+
+# Emails per Redis pipeline when announcing new users
+ANNOUNCE_BATCH = 1000
+
+
+def transaction_utc_day(raw: Optional[str]) -> Optional[str]:
+    """UTC YYYY-MM-DD of a reporting API timestamp, e.g. 2025-10-16T21:23:45-0400.
+
+    Returns None when the value is missing; falls back to today's UTC date when unparseable.
+    """
+    if not raw:
+        return None
+    try:
+        # Python's %z accepts PayPal's "+HHMM" offsets already
+        dt = datetime.strptime(raw, "%Y-%m-%dT%H:%M:%S%z")
+        return dt.astimezone(timezone.utc).strftime("%Y-%m-%d")
+    except Exception:
+        return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+def latest_day_by_email(transactions: Iterable[Dict]) -> Dict[str, str]:
+    """Normalize payer emails and keep the latest transaction day for each."""
+    latest: Dict[str, str] = {}
+    for t in transactions:
+        email = (t.get("email") or "").strip().lower()
+        if not email:
+            continue
+        day = transaction_utc_day(t.get("date"))
+        if not day:
+            continue
+        # YYYY-MM-DD strings order chronologically
+        if day > latest.get(email, ""):
+            latest[email] = day
+    return latest
+
+
+@dataclass
+class IngestStats:
+    unique_emails: int = 0
+    existing: int = 0
+    created: int = 0
+    # Existing subscriptions whose expiry a newer purchase extended (PREMIUM_PERIOD_DAYS > 0)
+    renewed: int = 0
+    seconds: float = 0.0
+    created_emails: List[str] = field(default_factory=list)
+
+    @property
+    def emails_per_second(self) -> float:
+        return self.unique_emails / self.seconds if self.seconds else 0.0
+
+
+def bulk_ingest(latest: Dict[str, str], repo: DynamoRepository, concurrency: int = 8) -> IngestStats:
+    """Insert emails that are not in the table yet, using the given day as their timestamp.
+
+    Existence is checked with BatchGetItem (100 keys) and new users are written with
+    BatchWriteItem (25 items); chunks run `concurrency` at a time.
+
+    With expiry on, a purchase that runs past an item's current expiry (including items that
+    expired but were not deleted yet) goes through the conditional UpdateItem the webhook
+    uses, so renewals extend the subscription and never race a newer expiry with a blind put.
+    Revived expired items count as created; extended active ones as renewed.
+    """
+    started = time.perf_counter()
+    emails = list(latest)
+    chunks = [emails[i:i + BATCH_GET_MAX_KEYS] for i in range(0, len(emails), BATCH_GET_MAX_KEYS)]
+
+    def ingest_chunk(chunk: List[str]) -> Tuple[List[str], int]:
+        expiry_on = settings.premium_period_days > 0
+        existing = repo._batch_get_existing_sync(chunk, include_expired=expiry_on)
+        new_items = [(e, latest[e]) for e in chunk if e not in existing]
+        if new_items:
+            repo._batch_put_with_timestamp_sync(new_items)
+        created = [e for e, _ in new_items]
+        renewed = 0
+        if expiry_on:
+            for e, stored in existing.items():
+                expiry = expiry_for_day(latest[e])
+                if stored is None or stored >= expiry[0]:
+                    continue  # never expires, or already covers this purchase
+                was_created, expires_at = repo._upsert_premium_sync(e, latest[e])
+                if was_created:
+                    created.append(e)
+                elif expires_at == expiry[0]:
+                    renewed += 1
+        return created, renewed
+
+    stats = IngestStats(unique_emails=len(emails))
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="ingest") as pool:
+        for created, renewed in pool.map(ingest_chunk, chunks):
+            stats.created_emails.extend(created)
+            stats.renewed += renewed
+    stats.created = len(stats.created_emails)
+    stats.existing = stats.unique_emails - stats.created - stats.renewed
+    stats.seconds = time.perf_counter() - started
+    return stats
+
+
+def announce_new_users(client: Any, emails: List[str], latest: Dict[str, str]) -> None:
+    """Make users created by bulk_ingest visible right away, as the webhook does.
+
+    `client` is a sync redis.Redis (decode_responses=True). Each email is written through to
+    the cache as premium (TTL clamped to its expiry), recorded in `snapshot:delta` when
+    SNAPSHOT_PATH is set, and published on L1_INVALIDATION_CHANNEL so every worker drops a
+    cached "not premium".
+    """
+    if not emails:
+        return
+    info = None
+    if needs_server_info():
+        try:
+            info = client.info("server")
+        except Exception as e:
+            print("[Ingest] could not read server version:", repr(e))
+    layout = make_layout(info)
+    ttl = settings.redis_ttl_seconds + max(0, settings.redis_stale_grace_seconds)
+    for i in range(0, len(emails), ANNOUNCE_BATCH):
+        batch = emails[i:i + ANNOUNCE_BATCH]
+        now = time.time()
+        pipe = client.pipeline(transaction=False)
+        if settings.snapshot_path:
+            pipe.zadd(DELTA_KEY, delta_mapping(batch))
+        for email in batch:
+            expiry = expiry_for_day(latest[email])
+            remaining = ttl if expiry is None else min(ttl, int(expiry[0] - now))
+            if remaining > 0:
+                layout.queue_write(pipe, email, True, remaining)
+            pipe.publish(settings.l1_invalidation_channel, email)
+        pipe.execute()
@@ -0,0 +1,223 @@
+import asyncio
+import math
+import random
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from app.core.circuit_breaker import CircuitBreaker
+from app.core.config import settings
+from app.core.metrics import CHECK_SOURCES, STALE_SERVED
+from app.core.singleflight import SingleFlight
+from app.db.dynamodb import DynamoRepository
+from app.db.redis_cache import RedisCache
+from app.db.snapshot import SnapshotManager
+
+
+class DatabaseUnavailable(Exception):
+    """DynamoDB could not answer; the routes surface this as 503."""
+
+
+class PremiumResolver:
+    """Cache-then-DynamoDB resolution shared by the premium check routes.
+
+    - Concurrent misses for the same email share one DynamoDB read and one cache write
+      (SingleFlight), so an expiring hot key does not turn into a thundering herd.
+    - Optionally a short Redis lock extends that across workers: the loser waits briefly
+      for the winner to fill the cache instead of issuing its own read.
+    - With a snapshot loaded, emails that are definitely not premium are answered from the
+      mmap'd Bloom filter / hash array without any network I/O (source "snapshot").
+    - Cache hits close to expiry are refreshed early in the background (XFetch), so hot
+      keys are renewed before they expire rather than after.
+    - Entries past their soft TTL but inside the grace window (REDIS_STALE_GRACE_SECONDS)
+      are served as-is and reloaded in the background, so a slow or failing DynamoDB does
+      not delay answers we already had.
+    - DynamoDB reads go through a circuit breaker: after repeated errors or slow calls,
+      misses fail fast with DatabaseUnavailable instead of waiting out boto3's retries.
+
+    One instance per worker process (see app.main lifespan).
+    """
+
+    def __init__(self, cache: RedisCache, repo: DynamoRepository, snapshot: Optional[SnapshotManager] = None):
+        self.cache = cache
+        self.repo = repo
+        self.snapshot = snapshot
+        self._flight = SingleFlight()
+        self._background: Set[asyncio.Task] = set()
+        # Running estimate of a DynamoDB load (seconds), the "delta" in XFetch
+        self._db_latency = 0.01
+        self.breaker = CircuitBreaker(
+            "dynamodb",
+            failure_threshold=settings.dynamodb_breaker_failure_threshold,
+            reset_seconds=settings.dynamodb_breaker_reset_seconds,
+            latency_budget=settings.dynamodb_breaker_latency_budget_ms / 1000.0,
+            timeout=settings.dynamodb_breaker_timeout_ms / 1000.0,
+            enabled=settings.dynamodb_breaker_enabled,
+        )
+
+    async def resolve(self, email: str) -> Tuple[bool, str]:
+        """Return (premium, source) where source is "snapshot", "cache" or "db".
+
+        DynamoDB errors raise DatabaseUnavailable; cache errors on write are swallowed.
+        """
+        key = email.lower()
+        if self.snapshot is not None and self.snapshot.definitely_not_premium(key):
+            CHECK_SOURCES["snapshot"].inc()
+            return False, "snapshot"
+        if settings.premium_early_refresh_enabled or self.cache.grace:
+            cached, ttl_ms = await self.cache.get_premium_with_ttl(key)
+            if cached is not None:
+                if self.cache.is_stale(ttl_ms):
+                    # Past the soft TTL: answer now, reload behind the response
+                    STALE_SERVED.inc()
+                    self._refresh_in_background(key)
+                elif (settings.premium_early_refresh_enabled and ttl_ms is not None
+                        and self._should_refresh_early(ttl_ms - self.cache.grace * 1000)):
+                    self._refresh_in_background(key)
+                CHECK_SOURCES["cache"].inc()
+                return cached, "cache"
+        else:
+            cached = await self.cache.get_premium(key)
+            if cached is not None:
+                CHECK_SOURCES["cache"].inc()
+                return cached, "cache"
+
+        premium = await self._flight.do(key, lambda: self._load(key))
+        CHECK_SOURCES["db"].inc()
+        return premium, "db"
+
+    async def resolve_many(self, emails: Iterable[str]) -> Dict[str, Tuple[bool, str]]:
+        """(premium, source) for many emails, keyed by lowercased email.
+
+        Snapshot negatives first, then one pipelined cache read, then BatchGetItem for the
+        misses and one pipelined cache backfill. DynamoDB errors raise DatabaseUnavailable.
+        Every input email is counted once in premium_checks_total, duplicates included.
+        """
+        keys = [e.lower() for e in emails]
+        answers: Dict[str, Tuple[bool, str]] = {}
+        lookup = keys
+        if self.snapshot is not None:
+            # Definite negatives from the mmap'd snapshot need no network I/O
+            lookup = []
+            for key in keys:
+                if self.snapshot.definitely_not_premium(key):
+                    answers[key] = (False, "snapshot")
+                else:
+                    lookup.append(key)
+
+        # One pipelined round trip (GET/HGET per key) for all cache lookups; stale entries are answered and reloaded in the background
+        cached = await self.cache.get_premium_many_with_ttl(lookup)
+        misses = []
+        stale = []
+        for e, (v, ttl_ms) in cached.items():
+            if v is None:
+                misses.append(e)
+                continue
+            answers[e] = (v, "cache")
+            if self.cache.is_stale(ttl_ms):
+                stale.append(e)
+        if stale:
+            STALE_SERVED.inc(len(stale))
+            self._refresh_many_in_background(stale)
+
+        # One BatchGetItem per 100 misses
+        if misses:
+            try:
+                found = await self.breaker.call(lambda: self.repo.batch_premium_until(misses))
+            except Exception as e:
+                raise DatabaseUnavailable(repr(e)) from e
+            answers.update({e: (v, "db") for e, (v, _) in found.items()})
+            # Backfill cache in one pipelined write, clamped to each subscription's expiry
+            try:
+                await self._cache_found(found)
+            except Exception:
+                pass
+
+        for key in keys:
+            CHECK_SOURCES[answers[key][1]].inc()
+        return answers
+
+    def _should_refresh_early(self, ttl_ms: int) -> bool:
+        # XFetch: recompute when delta * beta * -ln(U) reaches the remaining lifetime
+        gap = self._db_latency * settings.premium_early_refresh_beta * -math.log(1.0 - random.random())
+        return gap * 1000.0 >= ttl_ms
+
+    def _refresh_in_background(self, key: str) -> None:
+        # Nothing to gain while the breaker is failing fast; the cached answer stays until its hard TTL
+        if self._flight.in_flight(key) or self.breaker.is_open:
+            return
+        task = asyncio.ensure_future(self._flight.do(key, lambda: self._load(key)))
+        self._background.add(task)
+        task.add_done_callback(self._background_done)
+
+    def _refresh_many_in_background(self, keys: List[str]) -> None:
+        if self.breaker.is_open:
+            return
+        task = asyncio.ensure_future(self._load_many(keys))
+        self._background.add(task)
+        task.add_done_callback(self._background_done)
+
+    async def _load_many(self, keys: List[str]) -> None:
+        found = await self.breaker.call(lambda: self.repo.batch_premium_until(keys))
+        await self._cache_found(found)
+
+    async def _cache_found(self, found: Dict[str, Tuple[bool, Optional[int]]]) -> None:
+        await self.cache.set_premium_many(
+            {e: v for e, (v, _) in found.items()},
+            {e: exp for e, (_, exp) in found.items()},
+        )
+
+    def _background_done(self, task: "asyncio.Task") -> None:
+        self._background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print("[PremiumResolver] background refresh failed:", repr(task.exception()))
+
+    async def _load(self, key: str) -> bool:
+        token: Optional[str] = None
+        if settings.premium_lock_enabled:
+            try:
+                token = await self.cache.acquire_lock(f"premium:{key}", settings.premium_lock_ttl_ms)
+            except Exception:
+                token = None
+            else:
+                if token is None:
+                    # Another worker is loading this key; give it a moment to fill the cache
+                    waited = await self._wait_for_cache(key)
+                    if waited is not None:
+                        return waited
+        try:
+            started = time.perf_counter()
+            try:
+                premium, expires_at = await self.breaker.call(lambda: self.repo.premium_until(key))
+            except Exception as e:
+                raise DatabaseUnavailable(repr(e)) from e
+            self._db_latency = 0.8 * self._db_latency + 0.2 * (time.perf_counter() - started)
+            try:
+                await self.cache.set_premium(key, premium, expires_at)
+            except Exception:
+                # Cache failure should not fail the request
+                pass
+            return premium
+        finally:
+            if token is not None:
+                try:
+                    await self.cache.release_lock(f"premium:{key}", token)
+                except Exception:
+                    pass
+
+    async def _wait_for_cache(self, key: str) -> Optional[bool]:
+        deadline = time.monotonic() + settings.premium_lock_wait_ms / 1000.0
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.02)
+            try:
+                cached = await self.cache.get_premium(key)
+            except Exception:
+                return None
+            if cached is not None:
+                return cached
+        return None
+
+    async def close(self) -> None:
+        for task in list(self._background):
+            task.cancel()
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
@@ -0,0 +1,139 @@
+"""Per-worker startup work that runs after the worker starts accepting requests, gating GET /ready.
+
+- Table check: `ensure_table_exists` (boto3 DescribeTable, maybe CreateTable and a waiter)
+  runs once per deployment instead of once per worker. The first worker takes the Redis
+  lock `lock:table-check` and runs it in a thread. It then sets a marker
+  (`startup:table-ready:<table>`, STARTUP_TABLE_CHECK_TTL_SECONDS), and the other workers
+  wait for that marker instead of calling DynamoDB themselves. Without Redis, every worker
+  checks for itself.
+- Pool warm-up: STARTUP_WARM_CONNECTIONS concurrent Redis PINGs and DynamoDB key reads open
+  that many pooled connections (TCP and TLS), so the first real requests do not pay for the
+  handshakes.
+
+The checks run in a background task started by the lifespan handler; they never block the
+event loop.
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.core.config import settings
+from app.db.dynamodb import DynamoRepository, ensure_table_exists
+from app.db.redis_cache import RedisCache
+
+TABLE_CHECK_LOCK = "table-check"
+TABLE_CHECK_LOCK_TTL_MS = 120_000
+TABLE_READY_KEY = "startup:table-ready:{table}"
+# Key read by the DynamoDB warm-up requests; it never exists
+WARM_KEY = "__startup-warmup__"
+# Retry delays (seconds) for a failed table check, capped at the last value
+RETRY_DELAYS = (1.0, 2.0, 5.0, 10.0, 30.0)
+
+
+async def ensure_table_once(cache: RedisCache, table_name: str, region: str) -> str:
+    """Run the table check unless another worker already did; returns how the table was confirmed.
+
+    Results: "marker" (checked recently by some worker), "waited" (another worker checked it
+    while this one waited) or "checked" (this worker ran ensure_table_exists).
+    """
+    marker = TABLE_READY_KEY.format(table=table_name)
+    token: Optional[str] = None
+    try:
+        client = await cache.get_client()
+        if await client.exists(marker):
+            return "marker"
+        token = await cache.acquire_lock(TABLE_CHECK_LOCK, TABLE_CHECK_LOCK_TTL_MS)
+        if token is None:
+            # Another worker is checking; its marker normally appears well before the lock expires
+            deadline = time.monotonic() + TABLE_CHECK_LOCK_TTL_MS / 1000.0
+            while time.monotonic() < deadline:
+                await asyncio.sleep(0.25)
+                if await client.exists(marker):
+                    return "waited"
+    except Exception as e:
+        print("[Startup] Redis unavailable for the table check marker; checking directly:", repr(e))
+
+    try:
+        await asyncio.to_thread(ensure_table_exists, table_name, region)
+        try:
+            client = await cache.get_client()
+            await client.set(marker, "1", ex=settings.startup_table_check_ttl_seconds)
+        except Exception as e:
+            print("[Startup] could not record the table check:", repr(e))
+        return "checked"
+    finally:
+        if token is not None:
+            try:
+                await cache.release_lock(TABLE_CHECK_LOCK, token)
+            except Exception:
+                pass
+
+
+class StartupChecks:
+    """Background table check and pool warm-up for one worker; `ready` once both are done."""
+
+    def __init__(self, cache: RedisCache, repo: DynamoRepository):
+        self.cache = cache
+        self.repo = repo
+        self.table: Optional[str] = None  # how the table was confirmed (see ensure_table_once)
+        self.pools_warm = False
+        self.error: Optional[str] = None
+        self.started_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.table is not None and self.pools_warm
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        # DynamoDB connections are warmed after the check, since the table may only just exist
+        await asyncio.gather(self._check_table(), self._warm(self._ping_redis))
+        await self._warm(lambda: self.repo.is_premium(WARM_KEY))
+        self.pools_warm = True
+        self.finished_at = time.monotonic()
+        print(f"[Startup] ready in {self.finished_at - self.started_at:.2f}s (table: {self.table})")
+
+    async def _check_table(self) -> None:
+        attempt = 0
+        while True:
+            try:
+                self.table = await ensure_table_once(self.cache, settings.dynamodb_table, settings.aws_region)
+                self.error = None
+                return
+            except Exception as e:
+                # Not ready until DynamoDB answers; keep retrying rather than exiting the worker
+                self.error = repr(e)
+                print("[Startup] table check failed; retrying:", repr(e))
+                await asyncio.sleep(RETRY_DELAYS[min(attempt, len(RETRY_DELAYS) - 1)])
+                attempt += 1
+
+    async def _ping_redis(self) -> None:
+        client = await self.cache.get_client()
+        await client.ping()
+
+    async def _warm(self, call: Callable[[], Awaitable[Any]]) -> None:
+        # Concurrent calls check out that many pooled connections. Best effort: a failure here
+        # only means the first requests open their own connections
+        n = max(1, settings.startup_warm_connections)
+        for r in await asyncio.gather(*(call() for _ in range(n)), return_exceptions=True):
+            if isinstance(r, Exception):
+                print("[Startup] connection warm-up failed:", repr(r))
+                break
+
+    def status(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "table": self.table,
+            "pools_warm": self.pools_warm,
+            "error": self.error,
+            "seconds": round((self.finished_at or time.monotonic()) - self.started_at, 3),
+        }
+
+    async def close(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
@@ -0,0 +1,352 @@
+import asyncio
+import json
+import os
+import socket
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import PAYPAL_ORDER_LOOKUPS, WEBHOOK_EVENTS, WEBHOOK_SECONDS
+from app.db.dynamodb import DynamoRepository
+from app.db.redis_cache import RedisCache
+from app.db.snapshot import SnapshotManager, record_deltas
+from app.integrations.paypal_client import AsyncPayPalClient
+
+# Headers kept alongside queued events (signature verification, debugging)
+WEBHOOK_HEADER_KEYS = [
+    "paypal-transmission-id",
+    "paypal-transmission-time",
+    "paypal-transmission-sig",
+    "paypal-cert-url",
+    "paypal-auth-algo",
+    "content-type",
+    "user-agent",
+]
+
+
+class WebhookProcessor:
+    """Applies one PayPal webhook event: resolve the payer email, upsert DynamoDB, update caches.
+
+    Used inline by the HTTP handler and by the queue consumers.
+    """
+
+    def __init__(self,
+                 cache: RedisCache,
+                 repo: DynamoRepository,
+                 snapshot: Optional[SnapshotManager] = None,
+                 paypal: Optional[AsyncPayPalClient] = None):
+        self.cache = cache
+        self.repo = repo
+        self.snapshot = snapshot
+        self.paypal = paypal
+
+    async def process(self, raw: bytes, headers: Dict[str, str], received_at: Optional[float] = None) -> Dict:
+        """Return the webhook result; {"error": ...} marks a retryable failure.
+
+        `received_at` (epoch seconds) is when a queued event reached the HTTP handler; the
+        processing-time metric then covers the time it spent on the stream.
+        """
+        started = time.time() if received_at is None else received_at
+        mode = "inline" if received_at is None else "queue"
+        try:
+            result = await self._apply(raw, headers)
+        except Exception:
+            WEBHOOK_EVENTS.labels("error").inc()
+            raise
+        if result.get("error"):
+            outcome = "error"
+        elif result.get("skipped"):
+            outcome = "skipped"
+        else:
+            outcome = result.get("action", "ok")
+        WEBHOOK_EVENTS.labels(outcome).inc()
+        WEBHOOK_SECONDS.labels(mode).observe(max(0.0, time.time() - started))
+        return result
+
+    async def _apply(self, raw: bytes, headers: Dict[str, str]) -> Dict:
+        body_text = raw.decode("utf-8", errors="replace")
+
+        # Try to detect event_type and parse JSON payload
+        event_type = None
+        try:
+            payload = json.loads(body_text) if body_text else {}
+            event_type = payload.get("event_type")
+        except Exception:
+            payload = {}
+        print("[PayPal Webhook] event_type=", event_type)
+
+        # Extract order_id if present: resource.supplementary_data.related_ids.order_id
+        order_id = None
+        try:
+            order_id = (
+                payload.get("resource", {})
+                       .get("supplementary_data", {})
+                       .get("related_ids", {})
+                       .get("order_id")
+                if isinstance(payload, dict) else None
+            )
+            if isinstance(order_id, str) and order_id:
+                print("[PayPal Webhook] order_id=", order_id)
+        except Exception:
+            order_id = None
+
+        # Derive UTC date string YYYY-MM-DD from resource.create_time (fallback: today's UTC date)
+        date_str = None
+        try:
+            r_create = (
+                payload.get("resource", {}).get("create_time")
+                if isinstance(payload, dict) else None
+            )
+            if isinstance(r_create, str) and r_create:
+                dt = None
+                try:
+                    # canonical Z format
+                    dt = datetime.strptime(r_create, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+                except Exception:
+                    try:
+                        # fallback: ISO8601 with offset
+                        dt = datetime.fromisoformat(r_create.replace("Z", "+00:00")).astimezone(timezone.utc)
+                    except Exception:
+                        dt = None
+                if dt is not None:
+                    date_str = dt.strftime("%Y-%m-%d")
+        except Exception:
+            date_str = None
+        if not date_str:
+            date_str = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+        # Resolve payer email: the webhook payload when it carries one, else the (cached) order lookup
+        try:
+            email = (
+                payload.get("resource", {})
+                       .get("payer", {})
+                       .get("email_address")
+                if isinstance(payload, dict) else None
+            )
+        except Exception:
+            email = None
+        if isinstance(email, str) and email:
+            PAYPAL_ORDER_LOOKUPS.labels("payload").inc()
+        else:
+            email = None
+            try:
+                if self.paypal is not None and isinstance(order_id, str) and order_id:
+                    email = await self.paypal.payer_email_for_order(order_id)
+            except Exception as e:
+                # Rate limited or PayPal down after retries; retryable like a DynamoDB failure
+                print("[PayPal Webhook] order lookup failed:", repr(e))
+                return {"status": "ok", "error": "paypal"}
+
+        if not email or not isinstance(email, str):
+            print("[PayPal Webhook] No payer email found; skipping DB upsert")
+            return {"status": "ok", "skipped": True}
+
+        # Upsert into DynamoDB with timestamp (single UpdateItem)
+        try:
+            created, expires_at = await self.repo.upsert_premium(email, date_str)
+            action = "created" if created else "updated"
+        except Exception as e:
+            # Avoid failing the webhook; log and return ok
+            print("[PayPal Webhook] DynamoDB upsert failed:", repr(e))
+            return {"status": "ok", "error": "dynamodb"}
+
+        # Write through to Redis so a cached premium:false is replaced right away,
+        # then drop the email from every worker's L1 (and snapshot negatives)
+        try:
+            if self.snapshot is not None:
+                await self.snapshot.record_delta(email)
+            else:
+                # Standalone consumers: workers reload snapshot:delta, so it must be written here too
+                await record_deltas(self.cache, [email])
+            # The stored expiry, which a late older purchase does not shorten
+            await self.cache.set_premium(email, True, expires_at)
+            await self.cache.invalidate(email)
+        except Exception as e:
+            print("[PayPal Webhook] cache write-through failed:", repr(e))
+
+        return {"status": "ok", "email": email, "date": date_str, "action": action}
+
+
+def event_dedupe_id(raw: bytes, headers: Dict[str, str]) -> Optional[str]:
+    """PayPal event id (stable across redeliveries), falling back to the transmission id."""
+    try:
+        payload = json.loads(raw) if raw else {}
+        event_id = payload.get("id") if isinstance(payload, dict) else None
+    except Exception:
+        event_id = None
+    if isinstance(event_id, str) and event_id:
+        return event_id
+    return headers.get("paypal-transmission-id") or None
+
+
+class WebhookQueue:
+    """Appends raw webhook events to a Redis Stream so the HTTP handler can return at once."""
+
+    def __init__(self, cache: RedisCache):
+        self.cache = cache
+        self.stream = settings.webhook_stream
+
+    async def enqueue(self, raw: bytes, headers: Dict[str, str]) -> str:
+        client = await self.cache.get_client()
+        fields = {
+            "body": raw.decode("utf-8", errors="replace"),
+            "headers": json.dumps(headers),
+            "received_at": f"{time.time():.3f}",
+        }
+        return await client.xadd(self.stream, fields, maxlen=settings.webhook_stream_maxlen, approximate=True)
+
+
+class WebhookConsumer:
+    """Consumer-group reader for the webhook stream.
+
+    - Reads batches with XREADGROUP and processes them concurrently, then XACKs the successes.
+    - Events are deduplicated on the PayPal event/transmission id with a Redis marker, so
+      redeliveries never repeat the order lookup or the DynamoDB write.
+    - Failed entries stay pending; any consumer reclaims them with XAUTOCLAIM once idle for
+      WEBHOOK_RECLAIM_IDLE_MS, and after WEBHOOK_MAX_DELIVERIES they go to the dead-letter stream.
+    """
+
+    def __init__(self, cache: RedisCache, processor: WebhookProcessor, name: Optional[str] = None):
+        self.cache = cache
+        self.processor = processor
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.stream = settings.webhook_stream
+        self.group = settings.webhook_consumer_group
+        self.attempts_key = f"{self.stream}:attempts"
+        self.dead_letter_stream = f"{self.stream}:dead"
+        # Blocking reads must return before the pool's socket timeout fires
+        self.block_ms = max(100, min(settings.webhook_block_ms, int(settings.redis_socket_timeout * 1000) - 500))
+        self._last_reclaim = 0.0
+        # XAUTOCLAIM cursor: a scan of the pending list resumes here until Redis returns 0-0
+        self._reclaim_start = "0-0"
+
+    async def ensure_group(self):
+        client = await self.cache.get_client()
+        try:
+            await client.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def run(self):
+        backoff = 0.5
+        while True:
+            try:
+                await self.ensure_group()
+                while True:
+                    await self.run_once()
+                    backoff = 0.5
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[Webhook Consumer {self.name}] error:", repr(e))
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+
+    async def run_once(self) -> int:
+        """Reclaim stuck entries if due, then read and handle one batch; returns entries handled."""
+        client = await self.cache.get_client()
+        entries: List[Tuple[str, Optional[Dict[str, str]]]] = []
+        now = time.monotonic()
+        # A scan in progress continues on the next pass; a new one starts once the interval is due
+        if self._reclaim_start != "0-0" or now - self._last_reclaim >= settings.webhook_reclaim_idle_ms / 1000.0:
+            if self._reclaim_start == "0-0":
+                self._last_reclaim = now
+            claimed = await client.xautoclaim(
+                self.stream, self.group, self.name,
+                min_idle_time=settings.webhook_reclaim_idle_ms,
+                start_id=self._reclaim_start,
+                count=settings.webhook_batch_size,
+            )
+            self._reclaim_start = claimed[0]
+            entries.extend(claimed[1])
+        if not entries:
+            resp = await client.xreadgroup(
+                self.group, self.name, {self.stream: ">"},
+                count=settings.webhook_batch_size,
+                block=self.block_ms,
+            )
+            for _stream, stream_entries in resp or []:
+                entries.extend(stream_entries)
+        if not entries:
+            return 0
+
+        # Redeliveries of one event inside a batch are handled once and acked together
+        groups: Dict[str, List[str]] = {}
+        parsed: Dict[str, Tuple[bytes, Dict[str, str], Dict[str, str]]] = {}
+        done: List[str] = []
+        for entry_id, fields in entries:
+            if not fields:
+                # Trimmed from the stream while pending
+                done.append(entry_id)
+                continue
+            raw = fields.get("body", "").encode("utf-8")
+            try:
+                headers = json.loads(fields.get("headers") or "{}")
+            except Exception:
+                headers = {}
+            seen_key = f"paypal:webhook:seen:{event_dedupe_id(raw, headers) or entry_id}"
+            if seen_key not in groups:
+                groups[seen_key] = []
+                parsed[seen_key] = (raw, headers, fields)
+            groups[seen_key].append(entry_id)
+
+        keys = list(groups)
+        outcomes = await asyncio.gather(*(self._handle(groups[k][0], k, *parsed[k]) for k in keys))
+        for key, ok in zip(keys, outcomes):
+            if ok:
+                done.extend(groups[key])
+        if done:
+            await client.xack(self.stream, self.group, *done)
+        return len(entries)
+
+    async def _handle(self, entry_id: str, seen_key: str, raw: bytes,
+                      headers: Dict[str, str], fields: Dict[str, str]) -> bool:
+        """Process one event; True means its entries can be acknowledged."""
+        client = await self.cache.get_client()
+        if not await client.set(seen_key, "processing", nx=True, ex=settings.webhook_processing_ttl_seconds):
+            if await client.get(seen_key) == "done":
+                print("[Webhook Consumer] duplicate event skipped:", seen_key)
+                WEBHOOK_EVENTS.labels("duplicate").inc()
+                return True
+            # Another consumer is on it; leave pending, a later reclaim will find it done
+            return False
+
+        try:
+            received_at = float(fields.get("received_at") or 0) or None
+        except ValueError:
+            received_at = None
+        try:
+            result = await self.processor.process(raw, headers, received_at)
+        except Exception as e:
+            result = {"status": "error", "error": repr(e)}
+
+        if result.get("error"):
+            await client.delete(seen_key)
+            attempts = await client.hincrby(self.attempts_key, entry_id, 1)
+            if attempts < settings.webhook_max_deliveries:
+                return False
+            print(f"[Webhook Consumer] giving up on {entry_id} after {attempts} attempts:", result.get("error"))
+            await client.xadd(self.dead_letter_stream, {**fields, "error": str(result.get("error"))},
+                              maxlen=settings.webhook_stream_maxlen, approximate=True)
+            await client.hdel(self.attempts_key, entry_id)
+            return True
+
+        await client.set(seen_key, "done", ex=settings.webhook_dedupe_ttl_seconds)
+        await client.hdel(self.attempts_key, entry_id)
+        return True
+
+
+def start_consumers(cache: RedisCache, processor: WebhookProcessor, count: int) -> List[asyncio.Task]:
+    base = f"{socket.gethostname()}-{os.getpid()}"
+    return [
+        asyncio.create_task(WebhookConsumer(cache, processor, name=f"{base}-{i}").run())
+        for i in range(count)
+    ]
+
+
+async def stop_consumers(tasks: List[asyncio.Task]) -> None:
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Compare two benchmark result files and flag regressions.
+
+A scenario regresses when its throughput drops, or its p95/p99 latency grows, by more than
+--threshold (relative). Scenarios are matched by name; missing ones are listed.
+
+Usage:
+  python -m benchmarks.compare baseline.json current.json [--threshold 0.10]
+
+Exit status is 1 when any regression is found, so this can gate CI.
+"""
+import argparse
+import json
+import sys
+from typing import Dict, List, Tuple
+
+# (metric, True if higher is better)
+METRICS: List[Tuple[str, bool]] = [("rps", True), ("p50_ms", False), ("p95_ms", False), ("p99_ms", False)]
+GATED = {"rps", "p95_ms", "p99_ms"}
+
+
+def load(path: str) -> Dict[str, Dict]:
+    with open(path) as f:
+        return {s["name"]: s for s in json.load(f)["scenarios"]}
+
+
+def compare(baseline: Dict[str, Dict], current: Dict[str, Dict], threshold: float) -> List[str]:
+    """Print a per-scenario table; returns the regression messages."""
+    regressions = []
+    for name in sorted(set(baseline) | set(current)):
+        if name not in current:
+            print(f"{name}: missing from current run")
+            continue
+        if name not in baseline:
+            print(f"{name}: new scenario")
+            continue
+        parts = []
+        for metric, higher_is_better in METRICS:
+            old, new = baseline[name].get(metric), current[name].get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = ""
+            if metric in GATED and worse > threshold:
+                flag = " !"
+                regressions.append(f"{name}: {metric} {old:.2f} -> {new:.2f} ({change:+.1%})")
+            parts.append(f"{metric} {old:.2f}->{new:.2f} ({change:+.1%}){flag}")
+        print(f"{name}: " + ", ".join(parts))
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args(argv)
+    regressions = compare(load(args.baseline), load(args.current), args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print("\nno regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
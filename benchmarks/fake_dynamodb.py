@@ -0,0 +1,248 @@
+"""In-process DynamoDB stand-in speaking the JSON wire protocol, for benchmarks.
+
+boto3 is pointed at it with AWS_ENDPOINT_URL_DYNAMODB, so the app runs unmodified. Only the
+operations this service uses are implemented (CreateTable, DescribeTable, DescribeTimeToLive,
+GetItem, PutItem, UpdateItem with simple SET/REMOVE clauses and OR-ed conditions,
+BatchGetItem, BatchWriteItem, Scan without paging). Tables always report the expiry index and TTL as present.
+
+Run it in its own process (`python -m benchmarks.fake_dynamodb`, as benchmarks.stack does)
+so it does not compete with the load generator for the GIL.
+
+Emails starting with one of `premium_prefixes` exist without being stored, so a benchmark can
+ask for an unlimited number of distinct premium emails (guaranteed cache misses). Every
+request waits `latency_ms` to approximate the network round trip to DynamoDB.
+"""
+import argparse
+import json
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, Optional, Tuple
+
+ERROR_PREFIX = "com.amazonaws.dynamodb.v20120810#"
+
+
+class DynamoError(Exception):
+    def __init__(self, code: str, message: str, item: Optional[Dict] = None):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        # ReturnValuesOnConditionCheckFailure=ALL_OLD: the item that failed the condition
+        self.item = item
+
+
+class FakeDynamo:
+    def __init__(self, premium_prefixes: Iterable[str] = (), latency_ms: float = 0.0):
+        self.premium_prefixes = tuple(premium_prefixes)
+        self.latency = latency_ms / 1000.0
+        self.tables: Dict[str, Dict[str, Dict]] = {}
+        self.calls: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    # --- helpers ---
+    def _table(self, name: str) -> Dict[str, Dict]:
+        table = self.tables.get(name)
+        if table is None:
+            raise DynamoError("ResourceNotFoundException", f"Requested resource not found: Table: {name} not found")
+        return table
+
+    def _get(self, table: Dict[str, Dict], email: str) -> Optional[Dict]:
+        item = table.get(email)
+        if item is None and self.premium_prefixes and email.startswith(self.premium_prefixes):
+            item = {"email": {"S": email}}
+        return item
+
+    def _describe(self, name: str) -> Dict:
+        return {
+            "TableName": name,
+            "TableStatus": "ACTIVE",
+            "ItemCount": len(self.tables[name]),
+            "KeySchema": [{"AttributeName": "email", "KeyType": "HASH"}],
+            "AttributeDefinitions": [{"AttributeName": "email", "AttributeType": "S"}],
+            "BillingModeSummary": {"BillingMode": "PAY_PER_REQUEST"},
+            "GlobalSecondaryIndexes": [{"IndexName": "expiry_day-index", "IndexStatus": "ACTIVE"}],
+        }
+
+    @staticmethod
+    def _resolve(token: str, names: Dict[str, str]) -> str:
+        return names.get(token, token)
+
+    # --- operations ---
+    def handle(self, op: str, body: Dict) -> Dict:
+        with self._lock:
+            self.calls[op] = self.calls.get(op, 0) + 1
+        method = getattr(self, f"op_{op}", None)
+        if method is None:
+            raise DynamoError("UnknownOperationException", f"{op} is not supported by the benchmark fake")
+        return method(body)
+
+    def op_CreateTable(self, body: Dict) -> Dict:
+        name = body["TableName"]
+        with self._lock:
+            if name in self.tables:
+                raise DynamoError("ResourceInUseException", f"Table already exists: {name}")
+            self.tables[name] = {}
+        return {"TableDescription": self._describe(name)}
+
+    def op_DescribeTable(self, body: Dict) -> Dict:
+        self._table(body["TableName"])
+        return {"Table": self._describe(body["TableName"])}
+
+    def op_DescribeTimeToLive(self, body: Dict) -> Dict:
+        self._table(body["TableName"])
+        return {"TimeToLiveDescription": {"TimeToLiveStatus": "ENABLED", "AttributeName": "expires_at"}}
+
+    def op_GetItem(self, body: Dict) -> Dict:
+        item = self._get(self._table(body["TableName"]), body["Key"]["email"]["S"])
+        return {"Item": item} if item is not None else {}
+
+    def op_PutItem(self, body: Dict) -> Dict:
+        table = self._table(body["TableName"])
+        item = body["Item"]
+        table[item["email"]["S"]] = item
+        return {}
+
+    def _term_holds(self, term: str, item: Optional[Dict], names: Dict[str, str], values: Dict) -> bool:
+        """attribute_exists(a), attribute_not_exists(a) or `a <op> :v` on a number attribute."""
+        func = re.fullmatch(r"(attribute_not_exists|attribute_exists)\(\s*(\S+?)\s*\)", term)
+        if func:
+            present = item is not None and self._resolve(func.group(2), names) in item
+            return (func.group(1) == "attribute_exists") == present
+        compare = re.fullmatch(r"(\S+)\s*(<=|>=|<|>|=)\s*(\S+)", term)
+        if not compare:
+            raise DynamoError("ValidationException", f"Unsupported condition: {term}")
+        attr = (item or {}).get(self._resolve(compare.group(1), names))
+        if attr is None or "N" not in attr:
+            return False
+        left, right = float(attr["N"]), float(values[compare.group(3)]["N"])
+        return {"<=": left <= right, ">=": left >= right, "<": left < right,
+                ">": left > right, "=": left == right}[compare.group(2)]
+
+    def _check_condition(self, body: Dict, item: Optional[Dict]) -> None:
+        condition = body.get("ConditionExpression")
+        if not condition:
+            return
+        names = body.get("ExpressionAttributeNames", {})
+        values = body.get("ExpressionAttributeValues", {})
+        terms = [t.strip() for t in re.split(r"\s+OR\s+", condition)]
+        if not any(self._term_holds(t, item, names, values) for t in terms):
+            old = item if body.get("ReturnValuesOnConditionCheckFailure") == "ALL_OLD" else None
+            raise DynamoError("ConditionalCheckFailedException", "The conditional request failed", old)
+
+    def op_UpdateItem(self, body: Dict) -> Dict:
+        table = self._table(body["TableName"])
+        email = body["Key"]["email"]["S"]
+        names = body.get("ExpressionAttributeNames", {})
+        values = body.get("ExpressionAttributeValues", {})
+        with self._lock:
+            old = table.get(email)
+            self._check_condition(body, old)
+            new = dict(old) if old else {"email": {"S": email}}
+            expression = body.get("UpdateExpression", "").strip()
+            if not expression.upper().startswith("SET "):
+                raise DynamoError("ValidationException", "Only SET [REMOVE] update expressions are supported")
+            set_part, _, remove_part = expression[4:].partition(" REMOVE ")
+            for clause in set_part.split(","):
+                target, _, source = clause.partition("=")
+                new[self._resolve(target.strip(), names)] = values[source.strip()]
+            for token in filter(None, (t.strip() for t in remove_part.split(","))):
+                new.pop(self._resolve(token, names), None)
+            table[email] = new
+        if body.get("ReturnValues") == "ALL_OLD" and old is not None:
+            return {"Attributes": old}
+        return {}
+
+    def op_BatchGetItem(self, body: Dict) -> Dict:
+        responses = {}
+        for name, request in body["RequestItems"].items():
+            table = self._table(name)
+            found = []
+            for key in request["Keys"]:
+                item = self._get(table, key["email"]["S"])
+                if item is not None:
+                    found.append(item)
+            responses[name] = found
+        return {"Responses": responses, "UnprocessedKeys": {}}
+
+    def op_BatchWriteItem(self, body: Dict) -> Dict:
+        for name, requests in body["RequestItems"].items():
+            table = self._table(name)
+            for request in requests:
+                if "PutRequest" in request:
+                    item = request["PutRequest"]["Item"]
+                    table[item["email"]["S"]] = item
+                elif "DeleteRequest" in request:
+                    table.pop(request["DeleteRequest"]["Key"]["email"]["S"], None)
+        return {"UnprocessedItems": {}}
+
+    def op_Scan(self, body: Dict) -> Dict:
+        items = list(self._table(body["TableName"]).values())
+        total = body.get("TotalSegments")
+        if total:
+            segment = body.get("Segment", 0)
+            items = [i for i in items if zlib.crc32(i["email"]["S"].encode()) % total == segment]
+        return {"Items": items, "Count": len(items), "ScannedCount": len(items)}
+
+
+def _handler_for(fake: FakeDynamo):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body are separate writes; avoid stalls on delayed ACKs
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):  # noqa: A002 - BaseHTTPRequestHandler signature
+            pass
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            op = (self.headers.get("X-Amz-Target") or "").rpartition(".")[2]
+            if fake.latency:
+                time.sleep(fake.latency)
+            try:
+                status, body = 200, fake.handle(op, payload)
+            except DynamoError as e:
+                status, body = 400, {"__type": ERROR_PREFIX + e.code, "message": e.message}
+                if e.item is not None:
+                    body["Item"] = e.item
+            raw = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/x-amz-json-1.0")
+            self.send_header("Content-Length", str(len(raw)))
+            self.send_header("x-amz-crc32", str(zlib.crc32(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+    return Handler
+
+
+def serve(fake: FakeDynamo, host: str = "127.0.0.1", port: int = 0) -> Tuple[ThreadingHTTPServer, str]:
+    """Serve `fake` on a background thread; returns (server, endpoint URL)."""
+    server = ThreadingHTTPServer((host, port), _handler_for(fake))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-dynamodb", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the DynamoDB fake until interrupted")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--table", action="append", default=[], help="table to create up front")
+    parser.add_argument("--premium-prefix", action="append", default=[])
+    args = parser.parse_args()
+    fake = FakeDynamo(args.premium_prefix, args.latency_ms)
+    for table in args.table:
+        fake.tables[table] = {}
+    server, url = serve(fake, port=args.port)
+    print(f"fake DynamoDB on {url}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,523 @@
+"""PayPal REST stand-in for the sync and webhook benchmarks, plus a signed webhook emitter.
+
+The app reaches it through PAYPAL_BASE_URL. Implemented endpoints:
+
+  POST /v1/oauth2/token                         client-credentials token (any id/secret)
+  GET  /v1/reporting/transactions               paginated synthetic transactions
+  GET  /v2/checkout/orders/{id}                 payer email derived from the id; 404 for MISSING-*
+  GET  /v1/notifications/certs/{name}           the webhook signing certificate (--cert-file)
+  POST /v1/notifications/verify-webhook-signature   always SUCCESS
+  GET  /__stats                                 request counters, for the harness
+
+Transactions are never stored: row i happens at `i * 3600 / rows_per_hour` seconds after the
+epoch and belongs to payer `i // purchases_per_payer`, so any window can be paged through at
+any volume (millions of rows) with constant memory, and the same window always returns the
+same rows. Windows with more than 10,000 rows are rejected with RESULTSET_TOO_LARGE, like the
+real API, which exercises TransactionSync's slice splitting.
+
+Order lookups wait `order_latency_ms` and answer 429 (with Retry-After) for a `rate_429`
+fraction of requests. Run it in its own process (`python -m benchmarks.fake_paypal serve`,
+as benchmarks.stack does).
+
+`python -m benchmarks.fake_paypal emit` posts PAYMENT.CAPTURE.COMPLETED events to a webhook
+URL, signed the way PayPal signs them (SHA256withRSA over
+"<transmission id>|<transmission time>|<webhook id>|<crc32 of body>").
+`python -m benchmarks.fake_paypal selfcheck` checks, offline, that the app's verifier accepts
+those signatures and rejects a tampered body, another webhook id, an expired certificate
+and a certificate URL outside the allowlist.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import math
+import os
+import random
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+MAX_RESULT_SET = 10000
+MAX_PAGE_SIZE = 500
+PAYER_DOMAIN = "@payers.bench.example.com"
+BUYER_DOMAIN = "@buyers.bench.example.com"
+CERT_NAME = "CERT-bench"
+DEFAULT_WEBHOOK_ID = "WH-BENCH"
+
+
+def payer_email(index: int) -> str:
+    return f"payer-{index}{PAYER_DOMAIN}"
+
+
+def order_email(order_id: str) -> str:
+    return f"buyer-{order_id.lower()}{BUYER_DOMAIN}"
+
+
+def _parse_time(raw: str) -> datetime:
+    # format_paypal_time: 2025-10-16T21:00:00+0000 ('+' may arrive unescaped as a space)
+    return datetime.strptime(raw.replace(" ", "+"), "%Y-%m-%dT%H:%M:%S%z")
+
+
+class FakePayPal:
+    def __init__(self,
+                 rows_per_hour: float = 3600.0,
+                 purchases_per_payer: int = 2,
+                 page_latency_ms: float = 0.0,
+                 order_latency_ms: float = 0.0,
+                 rate_429: float = 0.0,
+                 cert_pem: Optional[bytes] = None):
+        self.rows_per_hour = rows_per_hour
+        self.purchases_per_payer = max(1, purchases_per_payer)
+        self.page_latency = page_latency_ms / 1000.0
+        self.order_latency = order_latency_ms / 1000.0
+        self.rate_429 = rate_429
+        self.cert_pem = cert_pem
+        self.tokens = set()
+        self.stats: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._rng = random.Random()
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.stats[name] = self.stats.get(name, 0) + n
+
+    # --- OAuth ---
+    def issue_token(self) -> Dict:
+        token = "A21AA" + uuid.uuid4().hex
+        with self._lock:
+            self.tokens.add(token)
+        self.count("tokens")
+        return {
+            "scope": "https://uri.paypal.com/services/reporting/search/read",
+            "access_token": token,
+            "token_type": "Bearer",
+            "app_id": "APP-BENCH",
+            "expires_in": 32400,
+            "nonce": uuid.uuid4().hex,
+        }
+
+    def authorized(self, header: Optional[str]) -> bool:
+        if not header or not header.startswith("Bearer "):
+            return False
+        return header[len("Bearer "):] in self.tokens
+
+    # --- reporting ---
+    def row_range(self, start: datetime, end: datetime) -> Tuple[int, int]:
+        """Row indices [first, last) whose timestamps fall in [start, end)."""
+        per_second = self.rows_per_hour / 3600.0
+        first = math.ceil(start.timestamp() * per_second)
+        last = math.ceil(end.timestamp() * per_second)
+        return first, max(first, last)
+
+    def row(self, i: int) -> Dict:
+        at = datetime.fromtimestamp(i * 3600.0 / self.rows_per_hour, tz=timezone.utc)
+        stamp = at.strftime("%Y-%m-%dT%H:%M:%S+0000")
+        return {
+            "transaction_info": {
+                "transaction_id": f"BENCH{i:015d}",
+                "transaction_event_code": "T0006",
+                "transaction_initiation_date": stamp,
+                "transaction_updated_date": stamp,
+                "transaction_amount": {"currency_code": "USD", "value": f"{(i % 50) + 4.99:.2f}"},
+                "transaction_status": "S",
+            },
+            "payer_info": {
+                "account_id": f"PAYER{i // self.purchases_per_payer:013d}",
+                "email_address": payer_email(i // self.purchases_per_payer),
+            },
+        }
+
+    def search(self, params: Dict[str, str]) -> Tuple[int, Dict]:
+        try:
+            start = _parse_time(params["start_date"])
+            end = _parse_time(params["end_date"])
+            page = int(params.get("page") or 1)
+            page_size = int(params.get("page_size") or 100)
+        except (KeyError, ValueError) as e:
+            return 400, {"name": "INVALID_REQUEST", "message": f"Invalid request: {e!r}"}
+        if page_size < 1 or page_size > MAX_PAGE_SIZE or page < 1:
+            return 400, {"name": "INVALID_REQUEST", "message": "page_size must be 1-500 and page >= 1"}
+        if end - start > timedelta(days=31):
+            return 400, {"name": "INVALID_REQUEST", "message": "Date range is greater than 31 days"}
+        first, last = self.row_range(start, end)
+        total = last - first
+        if total > MAX_RESULT_SET:
+            self.count("too_large")
+            return 400, {
+                "name": "RESULTSET_TOO_LARGE",
+                "message": "Result set size is greater than the maximum limit. Change the filter criteria and try again.",
+            }
+        total_pages = max(1, math.ceil(total / page_size))
+        lo = first + (page - 1) * page_size
+        rows = [self.row(i) for i in range(lo, min(lo + page_size, last))]
+        self.count("pages")
+        self.count("transactions", len(rows))
+        return 200, {
+            "transaction_details": rows,
+            "account_number": "BENCHACCOUNT",
+            "start_date": params["start_date"],
+            "end_date": params["end_date"],
+            "last_refreshed_datetime": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S+0000"),
+            "page": page,
+            "total_items": total,
+            "total_pages": total_pages,
+        }
+
+    # --- orders ---
+    def order(self, order_id: str) -> Tuple[int, Dict, Dict[str, str]]:
+        if self.rate_429 and self._rng.random() < self.rate_429:
+            self.count("orders_429")
+            return 429, {"name": "RATE_LIMIT_REACHED", "message": "Too many requests"}, {"Retry-After": "1"}
+        if order_id.upper().startswith("MISSING"):
+            self.count("orders_404")
+            return 404, {"name": "RESOURCE_NOT_FOUND", "message": "The specified resource does not exist."}, {}
+        self.count("orders")
+        return 200, {
+            "id": order_id,
+            "intent": "CAPTURE",
+            "status": "COMPLETED",
+            "payer": {
+                "payer_id": f"PAYER{zlib.crc32(order_id.encode()):010d}",
+                "email_address": order_email(order_id),
+            },
+        }, {}
+
+
+def _handler_for(fake: FakePayPal):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body are separate writes; avoid stalls on delayed ACKs
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):  # noqa: A002 - BaseHTTPRequestHandler signature
+            pass
+
+        def _send(self, status: int, body, headers: Optional[Dict[str, str]] = None,
+                  content_type: str = "application/json") -> None:
+            raw = body if isinstance(body, bytes) else json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(raw)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def _unauthorized(self) -> bool:
+            if fake.authorized(self.headers.get("Authorization")):
+                return False
+            fake.count("unauthorized")
+            self._send(401, {"error": "invalid_token", "error_description": "Token signature verification failed"})
+            return True
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            self.rfile.read(length)
+            path = urlsplit(self.path).path
+            if path == "/v1/oauth2/token":
+                if not (self.headers.get("Authorization") or "").startswith("Basic "):
+                    self._send(401, {"error": "invalid_client", "error_description": "Client Authentication failed"})
+                    return
+                self._send(200, fake.issue_token())
+            elif path == "/v1/notifications/verify-webhook-signature":
+                if self._unauthorized():
+                    return
+                self._send(200, {"verification_status": "SUCCESS"})
+            else:
+                self._send(404, {"name": "NOT_FOUND", "message": path})
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if url.path == "/__stats":
+                with fake._lock:
+                    self._send(200, dict(fake.stats))
+                return
+            if url.path == f"/v1/notifications/certs/{CERT_NAME}" and fake.cert_pem:
+                self._send(200, fake.cert_pem, content_type="application/x-pem-file")
+                return
+            if self._unauthorized():
+                return
+            if url.path == "/v1/reporting/transactions":
+                if fake.page_latency:
+                    time.sleep(fake.page_latency)
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                status, body = fake.search(params)
+                self._send(status, body)
+            elif url.path.startswith("/v2/checkout/orders/"):
+                if fake.order_latency:
+                    time.sleep(fake.order_latency)
+                status, body, headers = fake.order(url.path.rsplit("/", 1)[1])
+                self._send(status, body, headers)
+            else:
+                self._send(404, {"name": "NOT_FOUND", "message": url.path})
+
+    return Handler
+
+
+def serve(fake: FakePayPal, host: str = "127.0.0.1", port: int = 0) -> Tuple[ThreadingHTTPServer, str]:
+    """Serve `fake` on a background thread; returns (server, base URL)."""
+    server = ThreadingHTTPServer((host, port), _handler_for(fake))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-paypal", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+# --- webhooks ---
+class WebhookSigner:
+    """Self-signed RSA key + certificate that signs webhook transmissions like PayPal does.
+
+    Needs the `cryptography` package (benchmarks/requirements.txt).
+    """
+
+    def __init__(self, key_pem: bytes, cert_pem: bytes):
+        from cryptography.hazmat.primitives.serialization import load_pem_private_key
+
+        self.key_pem = key_pem
+        self.cert_pem = cert_pem
+        self._key = load_pem_private_key(key_pem, password=None)
+
+    @classmethod
+    def generate(cls, not_after: Optional[datetime] = None) -> "WebhookSigner":
+        """New key and certificate, valid for 30 days unless `not_after` says otherwise."""
+        from cryptography import x509
+        from cryptography.hazmat.primitives import hashes, serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        from cryptography.x509.oid import NameOID
+
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "messageverificationcerts.paypal.com")])
+        now = datetime.now(timezone.utc)
+        if not_after is None:
+            not_after = now + timedelta(days=30)
+        cert = (
+            x509.CertificateBuilder()
+            .subject_name(name)
+            .issuer_name(name)
+            .public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(min(now, not_after) - timedelta(days=1))
+            .not_valid_after(not_after)
+            .sign(key, hashes.SHA256())
+        )
+        key_pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                    serialization.NoEncryption())
+        return cls(key_pem, cert.public_bytes(serialization.Encoding.PEM))
+
+    @classmethod
+    def load(cls, key_path: str, cert_path: str) -> "WebhookSigner":
+        with open(key_path, "rb") as k, open(cert_path, "rb") as c:
+            return cls(k.read(), c.read())
+
+    def write(self, directory: str) -> Tuple[str, str]:
+        key_path = os.path.join(directory, "webhook-signer.key")
+        cert_path = os.path.join(directory, "webhook-signer.crt")
+        with open(key_path, "wb") as f:
+            f.write(self.key_pem)
+        with open(cert_path, "wb") as f:
+            f.write(self.cert_pem)
+        return key_path, cert_path
+
+    def headers(self, body: bytes, cert_url: str, webhook_id: str = DEFAULT_WEBHOOK_ID) -> Dict[str, str]:
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import padding
+
+        transmission_id = str(uuid.uuid4())
+        transmission_time = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        message = f"{transmission_id}|{transmission_time}|{webhook_id}|{zlib.crc32(body)}".encode()
+        signature = self._key.sign(message, padding.PKCS1v15(), hashes.SHA256())
+        return {
+            "Content-Type": "application/json",
+            "User-Agent": "PayPal/AUHD-214.0-58843434",
+            "PAYPAL-TRANSMISSION-ID": transmission_id,
+            "PAYPAL-TRANSMISSION-TIME": transmission_time,
+            "PAYPAL-TRANSMISSION-SIG": base64.b64encode(signature).decode(),
+            "PAYPAL-CERT-URL": cert_url,
+            "PAYPAL-AUTH-ALGO": "SHA256withRSA",
+        }
+
+
+def selfcheck(webhook_id: str = DEFAULT_WEBHOOK_ID) -> List[str]:
+    """Verify WebhookSigner's events with the app's WebhookVerifier, offline.
+
+    Certificates come from an in-memory fetcher, so no server or network is needed. Returns
+    the names of the checks that passed and raises AssertionError on the first failure.
+    """
+    from app.integrations.webhook_signature import WebhookSignatureError, WebhookVerifier
+
+    origin = "https://certs.selfcheck.test"
+    signer = WebhookSigner.generate()
+    expired = WebhookSigner.generate(not_after=datetime.now(timezone.utc) - timedelta(hours=1))
+    certs = {f"{origin}/good.pem": signer.cert_pem, f"{origin}/expired.pem": expired.cert_pem}
+
+    async def fetch(url: str) -> bytes:
+        return certs[url]
+
+    def lowercase(headers: Dict[str, str]) -> Dict[str, str]:
+        return {k.lower(): v for k, v in headers.items()}
+
+    async def rejected(verifier, body: bytes, headers: Dict[str, str]) -> bool:
+        try:
+            await verifier.verify(body, headers)
+        except WebhookSignatureError:
+            return True
+        return False
+
+    async def run() -> List[str]:
+        verifier = WebhookVerifier(webhook_id=webhook_id, cert_hosts=origin, fetcher=fetch)
+        body = capture_event("selfcheck", 0)
+        passed = []
+
+        await verifier.verify(body, lowercase(signer.headers(body, f"{origin}/good.pem", webhook_id)))
+        passed.append("signed event accepted")
+
+        headers = lowercase(signer.headers(body, f"{origin}/good.pem", webhook_id))
+        assert await rejected(verifier, body.replace(b"selfcheck-0", b"selfcheck-1"), headers), \
+            "tampered body was accepted"
+        passed.append("tampered body rejected")
+
+        headers = lowercase(signer.headers(body, f"{origin}/good.pem", "another-webhook"))
+        assert await rejected(verifier, body, headers), "event signed for another webhook id was accepted"
+        passed.append("other webhook id rejected")
+
+        headers = lowercase(expired.headers(body, f"{origin}/expired.pem", webhook_id))
+        assert await rejected(verifier, body, headers), "expired certificate was accepted"
+        passed.append("expired certificate rejected")
+
+        certs["https://certs.attacker.test/good.pem"] = signer.cert_pem
+        headers = lowercase(signer.headers(body, "https://certs.attacker.test/good.pem", webhook_id))
+        assert await rejected(verifier, body, headers), "certificate URL outside the allowlist was accepted"
+        passed.append("non-allowlisted certificate host rejected")
+        return passed
+
+    return asyncio.run(run())
+
+
+def capture_event(tag: str, n: int, missing: bool = False) -> bytes:
+    """PAYMENT.CAPTURE.COMPLETED with a unique event id and order id (no payer email, like PayPal's)."""
+    order_id = f"{'MISSING-' if missing else ''}{tag}-{n}"
+    now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    event = {
+        "id": f"WH-{tag}-{n}",
+        "event_version": "1.0",
+        "create_time": now,
+        "resource_type": "capture",
+        "event_type": "PAYMENT.CAPTURE.COMPLETED",
+        "summary": "Payment completed for $ 9.99 USD",
+        "resource": {
+            "id": f"CAP-{tag}-{n}",
+            "status": "COMPLETED",
+            "amount": {"currency_code": "USD", "value": "9.99"},
+            "create_time": now,
+            "update_time": now,
+            "supplementary_data": {"related_ids": {"order_id": order_id}},
+        },
+    }
+    return json.dumps(event).encode()
+
+
+async def emit_webhooks(target: str, events: int, concurrency: int, signer: WebhookSigner, cert_url: str,
+                        tag: Optional[str] = None, missing_ratio: float = 0.0,
+                        webhook_id: str = DEFAULT_WEBHOOK_ID) -> Dict:
+    """POST `events` signed events to `target`, `concurrency` at a time.
+
+    Returns {"event_ids", "latencies_ms", "errors", "seconds", "first_sent"} where
+    `first_sent` is a time.time() stamp, so callers can measure end-to-end processing.
+    """
+    import httpx
+
+    tag = tag or uuid.uuid4().hex[:8]
+    rng = random.Random(tag)
+    queue = list(range(events))
+    queue.reverse()
+    event_ids: List[str] = []
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=30.0) as client:
+        async def worker():
+            while queue:
+                n = queue.pop()
+                body = capture_event(tag, n, missing=rng.random() < missing_ratio)
+                headers = signer.headers(body, cert_url, webhook_id)
+                sent = time.perf_counter()
+                try:
+                    resp = await client.post(target, content=body, headers=headers)
+                    error = None if resp.status_code == 200 else f"http_{resp.status_code}"
+                except httpx.HTTPError as e:
+                    error = type(e).__name__
+                if error:
+                    errors[error] = errors.get(error, 0) + 1
+                    continue
+                latencies.append((time.perf_counter() - sent) * 1000.0)
+                event_ids.append(f"WH-{tag}-{n}")
+
+        first_sent = time.time()
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        seconds = time.perf_counter() - started
+    return {"event_ids": event_ids, "latencies_ms": latencies, "errors": errors,
+            "seconds": seconds, "first_sent": first_sent}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake PayPal REST API and webhook emitter")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    srv = sub.add_parser("serve", help="serve the fake API until interrupted")
+    srv.add_argument("--port", type=int, default=8001)
+    srv.add_argument("--rows-per-hour", type=float, default=3600.0, help="synthetic transaction volume")
+    srv.add_argument("--purchases-per-payer", type=int, default=2, help="consecutive rows sharing a payer")
+    srv.add_argument("--page-latency-ms", type=float, default=0.0)
+    srv.add_argument("--order-latency-ms", type=float, default=0.0)
+    srv.add_argument("--rate-429", type=float, default=0.0, help="fraction of order lookups answered 429")
+    srv.add_argument("--cert-file", default=None, help=f"PEM served at /v1/notifications/certs/{CERT_NAME}")
+
+    emit = sub.add_parser("emit", help="post signed webhook events to a URL")
+    emit.add_argument("--target", required=True, help="e.g. http://127.0.0.1:8080/v1/webhooks/paypal")
+    emit.add_argument("--events", type=int, default=1000)
+    emit.add_argument("--concurrency", type=int, default=16)
+    emit.add_argument("--key-file", required=True)
+    emit.add_argument("--cert-file", required=True)
+    emit.add_argument("--cert-url", required=True, help="URL the fake serves --cert-file at")
+    emit.add_argument("--missing-ratio", type=float, default=0.0, help="fraction of events whose order 404s")
+    emit.add_argument("--webhook-id", default=DEFAULT_WEBHOOK_ID)
+
+    sub.add_parser("selfcheck", help="sign events and check the app's verifier accepts and rejects them")
+    args = parser.parse_args()
+
+    if args.command == "selfcheck":
+        for name in selfcheck():
+            print(f"ok  {name}")
+        return
+
+    if args.command == "emit":
+        signer = WebhookSigner.load(args.key_file, args.cert_file)
+        result = asyncio.run(emit_webhooks(args.target, args.events, args.concurrency, signer, args.cert_url,
+                                           missing_ratio=args.missing_ratio, webhook_id=args.webhook_id))
+        sent = len(result["event_ids"])
+        print(f"{sent} events accepted in {result['seconds']:.2f}s "
+              f"({sent / result['seconds']:.0f}/s), errors {result['errors']}")
+        return
+
+    cert_pem = None
+    if args.cert_file:
+        with open(args.cert_file, "rb") as f:
+            cert_pem = f.read()
+    fake = FakePayPal(args.rows_per_hour, args.purchases_per_payer, args.page_latency_ms,
+                      args.order_latency_ms, args.rate_429, cert_pem)
+    server, url = serve(fake, port=args.port)
+    print(f"fake PayPal on {url}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
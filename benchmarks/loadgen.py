@@ -0,0 +1,104 @@
+"""Closed-loop HTTP load generator for the premium check routes.
+
+`concurrency` coroutines each send one request at a time for `duration` seconds (after a
+`warmup` whose samples are discarded). Several generator processes can be used so the client
+is not the bottleneck against a multi-worker server; their samples are merged by the caller.
+"""
+import asyncio
+import itertools
+import os
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+import httpx
+
+HIT_PREFIX = "bench-hit-"
+MISS_PREFIX = "bench-miss-"
+UNKNOWN_PREFIX = "bench-unknown-"
+DOMAIN = "@bench.example.com"
+
+
+def hit_email(i: int) -> str:
+    return f"{HIT_PREFIX}{i}{DOMAIN}"
+
+
+@dataclass
+class LoadSpec:
+    base_url: str
+    method: str  # "post" | "get"
+    concurrency: int
+    duration: float
+    warmup: float
+    mix: Dict[str, float]  # weights for "hit", "miss", "unknown"
+    hit_pool: int
+    tag: str  # makes miss/unknown emails unique per scenario
+
+
+@dataclass
+class LoadResult:
+    latencies_ms: List[float] = field(default_factory=list)
+    sources: Counter = field(default_factory=Counter)
+    kinds: Counter = field(default_factory=Counter)
+    errors: Counter = field(default_factory=Counter)
+    elapsed: float = 0.0
+
+
+async def _run(spec: LoadSpec, proc_index: int) -> LoadResult:
+    result = LoadResult()
+    kinds = list(spec.mix)
+    weights = [spec.mix[k] for k in kinds]
+    serial = itertools.count()
+    rng = random.Random(f"{spec.tag}-{proc_index}-{os.getpid()}")
+    url = f"{spec.base_url}/v1/premium/check"
+    limits = httpx.Limits(max_connections=spec.concurrency, max_keepalive_connections=spec.concurrency)
+
+    def next_email() -> Tuple[str, str]:
+        kind = rng.choices(kinds, weights)[0]
+        if kind == "hit":
+            return kind, hit_email(rng.randrange(spec.hit_pool))
+        n = next(serial)
+        prefix = MISS_PREFIX if kind == "miss" else UNKNOWN_PREFIX
+        # Never repeated, so misses stay misses for the whole run
+        return kind, f"{prefix}{spec.tag}-{proc_index}-{n}{DOMAIN}"
+
+    async with httpx.AsyncClient(limits=limits, timeout=30.0) as client:
+        start = time.perf_counter()
+        measure_from = start + spec.warmup
+        stop_at = measure_from + spec.duration
+
+        async def worker():
+            while True:
+                now = time.perf_counter()
+                if now >= stop_at:
+                    return
+                kind, email = next_email()
+                sent = time.perf_counter()
+                try:
+                    if spec.method == "get":
+                        resp = await client.get(url, params={"email": email})
+                    else:
+                        resp = await client.post(url, json={"email": email})
+                    error = None if resp.status_code == 200 else f"http_{resp.status_code}"
+                except httpx.HTTPError as e:
+                    resp, error = None, type(e).__name__
+                done = time.perf_counter()
+                if sent < measure_from:
+                    continue
+                if error:
+                    result.errors[error] += 1
+                    continue
+                result.latencies_ms.append((done - sent) * 1000.0)
+                result.kinds[kind] += 1
+                result.sources[resp.json().get("source", "?")] += 1
+
+        await asyncio.gather(*(worker() for _ in range(spec.concurrency)))
+        result.elapsed = time.perf_counter() - measure_from
+    return result
+
+
+def run_load(spec: LoadSpec, proc_index: int = 0) -> LoadResult:
+    """Entry point for one generator process (picklable for multiprocessing)."""
+    return asyncio.run(_run(spec, proc_index))
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for the PayPal ingestion paths, against local stand-ins.
+
+Starts Redis, the DynamoDB fake and the PayPal fake (benchmarks.fake_paypal), then runs:
+
+  sync     TransactionSync over a synthetic window (--hours x --rows-per-hour rows), then
+           latest_day_by_email + bulk_ingest into DynamoDB, i.e. what
+           scripts/paypal_fetch_hourly_transactions.py does. Reports transactions/s for the
+           fetch and end to end, pages/s and ingested emails/s. One scenario per
+           --sync-concurrency value, each over its own window so every run creates new users.
+  webhook  `uvicorn app.main:app` with PAYPAL_BASE_URL pointing at the fake. --events signed
+           PAYMENT.CAPTURE.COMPLETED events are posted at each --webhook-concurrency; every
+           event costs a local signature check, an order lookup, a DynamoDB upsert and a Redis write. Reports accepted
+           events/s with ack latency and, for the queue mode, processed events/s measured
+           until every event's dedupe marker reads "done".
+
+The `rps` field of each scenario is transactions/s (sync) or processed events/s (webhook),
+so result files can be diffed with benchmarks.compare like benchmarks.run's.
+
+Usage:
+  python -m benchmarks.paypal_bench [--only sync,webhook] [--hours 24] [--rows-per-hour 20000]
+      [--sync-concurrency 1,4,8] [--events 2000] [--webhook-modes queue,inline]
+      [--webhook-concurrency 16,64] [--workers 1] [--order-latency-ms 30] [--rate-429 0.01]
+      [--env WEBHOOK_CONSUMERS=4] [--compare baseline.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+from benchmarks.fake_paypal import CERT_NAME, DEFAULT_WEBHOOK_ID, WebhookSigner, emit_webhooks
+from benchmarks.run import git_revision, parse_list, percentile
+from benchmarks.stack import REPO_ROOT, ApiServer, LocalDynamo, LocalPayPal, LocalRedis, app_env
+
+TABLE = "bench_premium_users"
+
+
+def run_sync(args, index: int, concurrency: int) -> Dict:
+    """One TransactionSync + bulk_ingest pass in this process (the env points at the fakes)."""
+    from app.db.dynamodb import DynamoRepository
+    from app.integrations.paypal_client import PayPalClient
+    from app.integrations.paypal_sync import TransactionSync
+    from app.services.ingest import bulk_ingest, latest_day_by_email
+
+    window = timedelta(hours=args.hours)
+    # Whole hours in the past, a different window per scenario so payers are always new
+    anchor = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0) - timedelta(days=1)
+    end = anchor - index * window
+    start = end - window
+    sync = TransactionSync(client=PayPalClient(), slice_minutes=args.slice_minutes, concurrency=concurrency,
+                           requests_per_second=args.sync_rps, page_size=args.page_size,
+                           checkpoint_key="bench:paypal:sync:hwm")
+    repo = DynamoRepository()
+    try:
+        started = time.perf_counter()
+        latest = latest_day_by_email(sync.iter_window(start, end))
+        fetch_seconds = time.perf_counter() - started
+        stats = bulk_ingest(latest, repo, concurrency=args.ingest_concurrency)
+        total = time.perf_counter() - started
+    finally:
+        repo.close()
+    return {
+        "transactions": sync.items_yielded,
+        "pages": sync.pages_fetched,
+        "unique_payers": len(latest),
+        "created": stats.created,
+        "renewed": stats.renewed,
+        "existing": stats.existing,
+        "fetch_seconds": round(fetch_seconds, 3),
+        "ingest_seconds": round(stats.seconds, 3),
+        "seconds": round(total, 3),
+        "fetch_tx_per_s": round(sync.items_yielded / fetch_seconds, 2) if fetch_seconds else 0.0,
+        "pages_per_s": round(sync.pages_fetched / fetch_seconds, 2) if fetch_seconds else 0.0,
+        "ingest_emails_per_s": round(stats.emails_per_second, 2),
+        "rps": round(sync.items_yielded / total, 2) if total else 0.0,
+    }
+
+
+def wait_processed(redis_url: str, event_ids: List[str], timeout: float) -> float:
+    """Poll the consumers' dedupe markers; returns the time.time() all were done (or the deadline)."""
+    from redis import Redis
+
+    client = Redis.from_url(redis_url, decode_responses=True)
+    keys = [f"paypal:webhook:seen:{e}" for e in event_ids]
+    deadline = time.time() + timeout
+    try:
+        while keys and time.time() < deadline:
+            remaining = []
+            for i in range(0, len(keys), 1000):
+                chunk = keys[i:i + 1000]
+                remaining.extend(k for k, v in zip(chunk, client.mget(chunk)) if v != "done")
+            keys = remaining
+            if keys:
+                time.sleep(0.05)
+    finally:
+        client.close()
+    if keys:
+        print(f"  {len(keys)} events still unprocessed after {timeout:.0f}s")
+    return time.time()
+
+
+def run_webhooks(args, api: ApiServer, paypal: LocalPayPal, signer: WebhookSigner, redis_url: str,
+                 mode: str, concurrency: int, tag: str) -> Dict:
+    before = paypal.stats()
+    result = asyncio.run(emit_webhooks(f"{api.url}/v1/webhooks/paypal", args.events, concurrency, signer,
+                                       f"{paypal.url}/v1/notifications/certs/{CERT_NAME}", tag=tag,
+                                       missing_ratio=args.missing_ratio))
+    accepted = len(result["event_ids"])
+    if mode == "queue":
+        finished = wait_processed(redis_url, result["event_ids"], args.drain_timeout)
+        processed_seconds = finished - result["first_sent"]
+    else:
+        # Inline: the response is sent after processing
+        processed_seconds = result["seconds"]
+    after = paypal.stats()
+    latencies = sorted(result["latencies_ms"])
+    return {
+        "events": accepted,
+        "errors": result["errors"],
+        "accept_seconds": round(result["seconds"], 3),
+        "accepted_per_s": round(accepted / result["seconds"], 2) if result["seconds"] else 0.0,
+        "seconds": round(processed_seconds, 3),
+        "rps": round(accepted / processed_seconds, 2) if processed_seconds else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "max_ms": round(latencies[-1], 3) if latencies else 0.0,
+        "paypal": {k: after.get(k, 0) - before.get(k, 0) for k in ("orders", "orders_404", "orders_429", "tokens")},
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--only", default="sync,webhook", help="benchmarks to run")
+    # sync
+    parser.add_argument("--hours", type=float, default=24.0, help="synced window per scenario")
+    parser.add_argument("--rows-per-hour", type=float, default=20000.0, help="synthetic PayPal volume")
+    parser.add_argument("--purchases-per-payer", type=int, default=2)
+    parser.add_argument("--page-latency-ms", type=float, default=20.0, help="simulated reporting API latency")
+    parser.add_argument("--sync-concurrency", default="1,4,8", help="TransactionSync slices in flight")
+    parser.add_argument("--slice-minutes", type=int, default=30)
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--sync-rps", type=float, default=1000.0, help="reporting API request budget")
+    parser.add_argument("--ingest-concurrency", type=int, default=8, help="bulk_ingest chunks in flight")
+    # webhook
+    parser.add_argument("--events", type=int, default=2000, help="webhook events per scenario")
+    parser.add_argument("--webhook-modes", default="queue,inline", help="queue (Redis Stream) and/or inline")
+    parser.add_argument("--webhook-concurrency", default="16,64", help="webhook deliveries in flight")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument("--order-latency-ms", type=float, default=30.0, help="simulated order lookup latency")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="fraction of order lookups answered 429")
+    parser.add_argument("--missing-ratio", type=float, default=0.0, help="fraction of events whose order 404s")
+    parser.add_argument("--drain-timeout", type=float, default=300.0, help="max wait for queued events")
+    parser.add_argument("--dynamo-latency-ms", type=float, default=2.0, help="simulated DynamoDB round trip")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="extra app settings")
+    parser.add_argument("--output", default=None, help="result file (default benchmarks/results/paypal-<utc>.json)")
+    parser.add_argument("--compare", default=None, help="baseline result file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change counted as regression")
+    args = parser.parse_args(argv)
+
+    only = set(parse_list(args.only, str))
+    extra = dict(e.split("=", 1) for e in args.env)
+    workdir = tempfile.mkdtemp(prefix="bench-paypal-")
+    signer = WebhookSigner.generate()
+    _key_path, cert_path = signer.write(workdir)
+
+    redis = LocalRedis().start()
+    dynamo = LocalDynamo(TABLE, latency_ms=args.dynamo_latency_ms).start()
+    paypal = LocalPayPal(args.rows_per_hour, args.purchases_per_payer, args.page_latency_ms,
+                         args.order_latency_ms, args.rate_429, cert_file=cert_path).start()
+    scenarios = []
+    try:
+        env = app_env(redis.url, dynamo.url, TABLE, extra, paypal_url=paypal.url)
+        if "sync" in only:
+            # The sync runs in this process; its settings are read on first import
+            os.environ.clear()
+            os.environ.update(env)
+            for i, concurrency in enumerate(parse_list(args.sync_concurrency)):
+                name = f"sync-c{concurrency}-{int(args.rows_per_hour)}ph-{args.hours:g}h"
+                stats = run_sync(args, i, concurrency)
+                scenarios.append({"name": name, "kind": "sync", "concurrency": concurrency, **stats})
+                print(f"{name}: {stats['transactions']} tx / {stats['pages']} pages, fetch "
+                      f"{stats['fetch_tx_per_s']:.0f} tx/s ({stats['pages_per_s']:.1f} pages/s), ingest "
+                      f"{stats['unique_payers']} payers at {stats['ingest_emails_per_s']:.0f}/s, "
+                      f"end to end {stats['rps']:.0f} tx/s")
+        if "webhook" in only:
+            for mode in parse_list(args.webhook_modes, str):
+                # Signatures are verified against the fake's certificate, as in production
+                api_env = {**env, "WEBHOOK_QUEUE_ENABLED": "true" if mode == "queue" else "false",
+                           "PAYPAL_WEBHOOK_ID": DEFAULT_WEBHOOK_ID, "PAYPAL_WEBHOOK_CERT_HOSTS": paypal.url, **extra}
+                api = ApiServer(api_env, args.workers).start()
+                try:
+                    for concurrency in parse_list(args.webhook_concurrency):
+                        name = f"webhook-{mode}-w{args.workers}-c{concurrency}"
+                        stats = run_webhooks(args, api, paypal, signer, redis.url, mode, concurrency,
+                                             tag=f"{int(time.time())}{len(scenarios)}")
+                        scenarios.append({"name": name, "kind": "webhook", "mode": mode,
+                                          "workers": args.workers, "concurrency": concurrency, **stats})
+                        print(f"{name}: accepted {stats['accepted_per_s']:.0f} ev/s (p50 {stats['p50_ms']:.1f}ms "
+                              f"p99 {stats['p99_ms']:.1f}ms), processed {stats['rps']:.0f} ev/s, "
+                              f"errors {sum(stats['errors'].values())}, paypal {stats['paypal']}")
+                finally:
+                    api.stop()
+    finally:
+        paypal.stop()
+        dynamo.stop()
+        redis.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "git": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "redis": redis.kind,
+            "dynamodb": "fake",
+            "paypal": "fake",
+            "args": vars(args),
+        },
+        "scenarios": scenarios,
+    }
+    output = args.output or os.path.join(
+        REPO_ROOT, "benchmarks", "results", "paypal-" + datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ") + ".json"
+    )
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {output}")
+
+    if args.compare:
+        from benchmarks.compare import compare, load
+        regressions = compare(load(args.compare), {s["name"]: s for s in scenarios}, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
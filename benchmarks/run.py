@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+End-to-end latency benchmark for POST/GET /v1/premium/check against local stand-ins.
+
+Starts Redis (redis-server if installed, else fakeredis) and the in-process DynamoDB fake,
+then for each worker count launches `uvicorn app.main:app` and drives it with every
+method x concurrency combination. Emails are drawn from a hit/miss/unknown mix:
+
+  hit      one of --hit-pool premium emails preloaded into Redis
+  miss     a never-seen premium email: Redis miss, found in DynamoDB
+  unknown  a never-seen email that is not premium: Redis miss, absent from DynamoDB
+
+Each scenario reports throughput, p50/p95/p99/max latency, errors and the `source` mix the
+API answered with. Results go to a JSON file; pass --compare to diff against an earlier run.
+
+Usage:
+  python -m benchmarks.run [--workers 1,4] [--concurrency 16,64] [--methods post,get]
+      [--mix hit=0.8,miss=0.15,unknown=0.05] [--duration 10] [--load-processes 2]
+      [--dynamo-latency-ms 2] [--env L1_CACHE_ENABLED=false] [--compare baseline.json]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, List
+
+from benchmarks.loadgen import HIT_PREFIX, MISS_PREFIX, LoadSpec, hit_email, run_load
+from benchmarks.stack import REPO_ROOT, ApiServer, LocalDynamo, LocalRedis, app_env
+
+TABLE = "bench_premium_users"
+
+
+def parse_list(raw: str, cast=int) -> List:
+    return [cast(x) for x in raw.split(",") if x]
+
+
+def parse_mix(raw: str) -> Dict[str, float]:
+    mix = {}
+    for part in raw.split(","):
+        kind, _, weight = part.partition("=")
+        if kind not in ("hit", "miss", "unknown"):
+            raise SystemExit(f"unknown mix kind {kind!r} (use hit, miss, unknown)")
+        mix[kind] = float(weight)
+    return {k: w for k, w in mix.items() if w > 0}
+
+
+def percentile(ordered: List[float], p: float) -> float:
+    if not ordered:
+        return 0.0
+    rank = max(0, min(len(ordered) - 1, int(round(p / 100.0 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def seed_hits(redis_url: str, count: int) -> None:
+    """Preload the hit pool in whatever layout the app is configured for."""
+    from redis import Redis
+    from app.db.cache_layout import make_layout, needs_server_info
+
+    client = Redis.from_url(redis_url, decode_responses=True)
+    info = client.info("server") if needs_server_info() else None
+    layout = make_layout(info)
+    for start in range(0, count, 1000):
+        pipe = client.pipeline(transaction=False)
+        for i in range(start, min(start + 1000, count)):
+            layout.queue_write(pipe, hit_email(i), True, 24 * 3600)
+        pipe.execute()
+    client.close()
+
+
+def run_scenario(spec: LoadSpec, processes: int) -> Dict:
+    if processes <= 1:
+        parts = [run_load(spec, 0)]
+    else:
+        ctx = multiprocessing.get_context("spawn")
+        per_process = LoadSpec(**{**spec.__dict__, "concurrency": max(1, spec.concurrency // processes)})
+        with ctx.Pool(processes) as pool:
+            parts = pool.starmap(run_load, [(per_process, i) for i in range(processes)])
+    latencies = sorted(x for p in parts for x in p.latencies_ms)
+    elapsed = max(p.elapsed for p in parts) or 1.0
+    errors, sources, kinds = Counter(), Counter(), Counter()
+    for p in parts:
+        errors.update(p.errors)
+        sources.update(p.sources)
+        kinds.update(p.kinds)
+    return {
+        "requests": len(latencies),
+        "errors": dict(errors),
+        "seconds": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 2),
+        "mean_ms": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "max_ms": round(latencies[-1], 3) if latencies else 0.0,
+        "kinds": dict(kinds),
+        "sources": dict(sources),
+    }
+
+
+def git_revision() -> str:
+    try:
+        rev = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, text=True).strip()
+        dirty = subprocess.call(["git", "diff", "--quiet"], cwd=REPO_ROOT) != 0
+        return rev + ("-dirty" if dirty else "")
+    except Exception:
+        return "unknown"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default="1,4", help="uvicorn worker counts")
+    parser.add_argument("--concurrency", default="16,64", help="in-flight requests")
+    parser.add_argument("--methods", default="post,get")
+    parser.add_argument("--mix", default="hit=0.8,miss=0.15,unknown=0.05")
+    parser.add_argument("--duration", type=float, default=10.0, help="measured seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=2.0, help="unmeasured seconds per scenario")
+    parser.add_argument("--hit-pool", type=int, default=10000)
+    parser.add_argument("--load-processes", type=int, default=1, help="load generator processes")
+    parser.add_argument("--dynamo-latency-ms", type=float, default=2.0, help="simulated DynamoDB round trip")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="extra app settings")
+    parser.add_argument("--output", default=None, help="result file (default benchmarks/results/<utc>.json)")
+    parser.add_argument("--compare", default=None, help="baseline result file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change counted as regression")
+    args = parser.parse_args(argv)
+
+    extra = dict(e.split("=", 1) for e in args.env)
+    # The seeding code reads the same settings as the app (e.g. REDIS_CACHE_LAYOUT)
+    os.environ.update(extra)
+    mix = parse_mix(args.mix)
+    mix_label = "-".join(f"{k}{int(round(w * 100))}" for k, w in mix.items())
+
+    redis = LocalRedis().start()
+    dynamo = LocalDynamo(TABLE, premium_prefixes=(HIT_PREFIX, MISS_PREFIX), latency_ms=args.dynamo_latency_ms).start()
+    scenarios = []
+    try:
+        seed_hits(redis.url, args.hit_pool)
+        env = app_env(redis.url, dynamo.url, TABLE, extra)
+        for workers in parse_list(args.workers):
+            api = ApiServer(env, workers).start()
+            try:
+                for method in parse_list(args.methods, str):
+                    for concurrency in parse_list(args.concurrency):
+                        name = f"{method}-w{workers}-c{concurrency}-{mix_label}"
+                        spec = LoadSpec(api.url, method, concurrency, args.duration, args.warmup,
+                                        mix, args.hit_pool, tag=f"{int(time.time())}-{len(scenarios)}")
+                        stats = run_scenario(spec, args.load_processes)
+                        scenarios.append({"name": name, "method": method, "workers": workers,
+                                          "concurrency": concurrency, "mix": mix, **stats})
+                        print(f"{name}: {stats['rps']:.0f} req/s  p50 {stats['p50_ms']:.2f}ms  "
+                              f"p95 {stats['p95_ms']:.2f}ms  p99 {stats['p99_ms']:.2f}ms  "
+                              f"errors {sum(stats['errors'].values())}  sources {stats['sources']}")
+            finally:
+                api.stop()
+    finally:
+        dynamo.stop()
+        redis.stop()
+
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "git": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "redis": redis.kind,
+            "dynamodb": "fake",
+            "args": vars(args),
+        },
+        "scenarios": scenarios,
+    }
+    output = args.output or os.path.join(
+        REPO_ROOT, "benchmarks", "results", datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ") + ".json"
+    )
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {output}")
+
+    if args.compare:
+        from benchmarks.compare import compare, load
+        regressions = compare(load(args.compare), {s["name"]: s for s in scenarios}, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
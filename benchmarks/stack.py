@@ -0,0 +1,221 @@
+"""Local stand-ins and the API process under test.
+
+- Redis: a real `redis-server` when one is on PATH (closest to production), otherwise
+  fakeredis' TcpFakeServer in a child process.
+- DynamoDB: benchmarks.fake_dynamodb served over HTTP from a child process; the app reaches
+  it through AWS_ENDPOINT_URL_DYNAMODB, so no AWS access or credentials are needed.
+- PayPal: benchmarks.fake_paypal from a child process, reached through PAYPAL_BASE_URL
+  (only when a benchmark passes `paypal_url` to app_env).
+- API: `uvicorn app.main:app` in a subprocess with the requested number of workers.
+"""
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, Optional
+
+import httpx
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"nothing listening on port {port} after {timeout}s")
+
+
+class LocalRedis:
+    def __init__(self):
+        self.port = free_port()
+        self.kind = "redis-server" if shutil.which("redis-server") else "fakeredis"
+        self._proc: Optional[subprocess.Popen] = None
+        self._dir: Optional[str] = None
+
+    @property
+    def url(self) -> str:
+        return f"redis://127.0.0.1:{self.port}/0"
+
+    def start(self) -> "LocalRedis":
+        if self.kind == "redis-server":
+            self._dir = tempfile.mkdtemp(prefix="bench-redis-")
+            self._proc = subprocess.Popen(
+                ["redis-server", "--port", str(self.port), "--save", "", "--appendonly", "no", "--dir", self._dir],
+                stdout=subprocess.DEVNULL,
+            )
+        else:
+            # Own process, so the fake does not share the GIL with the load generator
+            self._proc = subprocess.Popen([sys.executable, "-m", "benchmarks.stack", "fakeredis", str(self.port)],
+                                          cwd=REPO_ROOT)
+        wait_for_port(self.port)
+        return self
+
+    def stop(self) -> None:
+        if self._proc is not None:
+            self._proc.terminate()
+            self._proc.wait(timeout=10)
+        if self._dir is not None:
+            shutil.rmtree(self._dir, ignore_errors=True)
+
+
+class LocalDynamo:
+    def __init__(self, table: str, premium_prefixes=(), latency_ms: float = 0.0):
+        self.table = table
+        self.premium_prefixes = tuple(premium_prefixes)
+        self.latency_ms = latency_ms
+        self.port = free_port()
+        self._proc: Optional[subprocess.Popen] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self) -> "LocalDynamo":
+        cmd = [sys.executable, "-m", "benchmarks.fake_dynamodb", "--port", str(self.port),
+               "--latency-ms", str(self.latency_ms), "--table", self.table]
+        for prefix in self.premium_prefixes:
+            cmd += ["--premium-prefix", prefix]
+        self._proc = subprocess.Popen(cmd, cwd=REPO_ROOT, stdout=subprocess.DEVNULL)
+        wait_for_port(self.port)
+        return self
+
+    def stop(self) -> None:
+        if self._proc is not None:
+            self._proc.terminate()
+            self._proc.wait(timeout=10)
+
+
+class LocalPayPal:
+    def __init__(self, rows_per_hour: float = 3600.0, purchases_per_payer: int = 2, page_latency_ms: float = 0.0,
+                 order_latency_ms: float = 0.0, rate_429: float = 0.0, cert_file: Optional[str] = None):
+        self.args = ["--rows-per-hour", str(rows_per_hour), "--purchases-per-payer", str(purchases_per_payer),
+                     "--page-latency-ms", str(page_latency_ms), "--order-latency-ms", str(order_latency_ms),
+                     "--rate-429", str(rate_429)]
+        if cert_file:
+            self.args += ["--cert-file", cert_file]
+        self.port = free_port()
+        self._proc: Optional[subprocess.Popen] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self) -> "LocalPayPal":
+        self._proc = subprocess.Popen([sys.executable, "-m", "benchmarks.fake_paypal", "serve",
+                                       "--port", str(self.port), *self.args],
+                                      cwd=REPO_ROOT, stdout=subprocess.DEVNULL)
+        wait_for_port(self.port)
+        return self
+
+    def stats(self) -> Dict[str, int]:
+        return httpx.get(f"{self.url}/__stats", timeout=5.0).json()
+
+    def stop(self) -> None:
+        if self._proc is not None:
+            self._proc.terminate()
+            self._proc.wait(timeout=10)
+
+
+def app_env(redis_url: str, dynamo_url: str, table: str, extra: Optional[Dict[str, str]] = None,
+            paypal_url: Optional[str] = None) -> Dict[str, str]:
+    """Environment for the API process: local stand-ins, no background jobs, PayPal only if given."""
+    env = {k: v for k, v in os.environ.items() if not k.startswith(("AWS_", "PAYPAL_"))}
+    env.update({
+        "PYTHONPATH": REPO_ROOT,
+        "REDIS_URL": redis_url,
+        "AWS_ENDPOINT_URL_DYNAMODB": dynamo_url,
+        "AWS_REGION": "us-east-1",
+        "AWS_DEFAULT_REGION": "us-east-1",
+        "AWS_ACCESS_KEY_ID": "bench",
+        "AWS_SECRET_ACCESS_KEY": "bench",
+        "DYNAMODB_TABLE": table,
+        "WEBHOOK_QUEUE_ENABLED": "false",
+        "CACHE_WARM_ON_STARTUP": "false",
+        "SNAPSHOT_PATH": "",
+    })
+    if paypal_url:
+        env.update({
+            "PAYPAL_BASE_URL": paypal_url,
+            "PAYPAL_CLIENT_ID": "bench",
+            "PAYPAL_CLIENT_SECRET": "bench",
+        })
+    env.update(extra or {})
+    return env
+
+
+class ApiServer:
+    def __init__(self, env: Dict[str, str], workers: int = 1):
+        self.env = env
+        self.workers = workers
+        self.port = free_port()
+        self._proc: Optional[subprocess.Popen] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self, timeout: float = 60.0) -> "ApiServer":
+        self._proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(self.port),
+             "--workers", str(self.workers), "--no-access-log", "--log-level", "warning"],
+            cwd=REPO_ROOT,
+            env=self.env,
+        )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self._proc.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {self._proc.returncode}")
+            try:
+                if httpx.get(f"{self.url}/v1/ready", timeout=1.0).status_code == 200:
+                    # Give the remaining workers a moment to finish their lifespan startup
+                    time.sleep(0.5 * (self.workers - 1))
+                    return self
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f"API not healthy after {timeout}s")
+
+    def stop(self) -> None:
+        if self._proc is not None and self._proc.poll() is None:
+            self._proc.terminate()
+            try:
+                self._proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                self._proc.kill()
+        self._proc = None
+
+
+def _serve_fakeredis(port: int) -> None:
+    from fakeredis import TcpFakeServer
+    server = TcpFakeServer(("127.0.0.1", port))
+    server.daemon_threads = True
+    # Replies are written piecemeal; without TCP_NODELAY pipelines stall on delayed ACKs
+
+    class Handler(server.RequestHandlerClass):
+        disable_nagle_algorithm = True
+
+    server.RequestHandlerClass = Handler
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "fakeredis":
+        _serve_fakeredis(int(sys.argv[2]))
+    else:
+        raise SystemExit("usage: python -m benchmarks.stack fakeredis <port>")
@@ -18,6 +18,15 @@ exec_uvicorn() {
   fi
 }
 
+# Prometheus multiprocess mode: workers share sample files, which must not outlive a restart
+if [ -n "${PROMETHEUS_MULTIPROC_DIR:-}" ]; then
+  rm -rf "${PROMETHEUS_MULTIPROC_DIR}"
+  mkdir -p "${PROMETHEUS_MULTIPROC_DIR}"
+  if [ "$(id -u)" = "0" ]; then
+    chown appuser:appuser "${PROMETHEUS_MULTIPROC_DIR}"
+  fi
+fi
+
 echo "> Starting HTTP on ${UVICORN_HOST}:${UVICORN_PORT_HTTP} via Uvicorn (TLS terminated by Nginx)."
 exec_uvicorn \
   --host "${UVICORN_HOST}" \
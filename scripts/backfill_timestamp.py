@@ -4,72 +4,104 @@ Backfill 'timestamp' attribute for items that miss it.
 
 - Writes 'timestamp' in UTC as YYYY-MM-DD
 - Uses conditional update to avoid overwriting if already present
+- Parallel scan (Segment/TotalSegments) across a thread pool, see app/db/scan.py
+- Resumable: each segment's position is checkpointed to --checkpoint after every page;
+  rerun the same command after a crash to continue (the file is removed on completion)
+- Paced by consumed capacity (--target-rcu/--target-wcu) and backs off on throttling
 
 Usage:
-  python scripts/backfill_timestamp.py --table <TABLE_NAME> --region <AWS_REGION>
+  python scripts/backfill_timestamp.py --table <TABLE_NAME> --region <AWS_REGION> \
+      [--segments 8] [--workers 8] [--target-rcu 200] [--target-wcu 100] [--dry-run]
 
 Env vars respected (fallbacks to app config if you import it):
   AWS_REGION, DYNAMODB_TABLE
 """
 import argparse
+import os
+import threading
 from datetime import datetime, timezone
-import time
-import boto3
+from typing import Dict, List, Optional
+
 from botocore.exceptions import ClientError
 
+from app.db.scan import AdaptiveRateLimiter, ParallelScanner
 
-def backfill(table_name: str, region: str, dry_run: bool = False) -> None:
-    dynamo = boto3.resource("dynamodb", region_name=region)
-    table = dynamo.Table(table_name)  # type: ignore[attr-defined]
 
+def backfill(table_name: str,
+             region: str,
+             dry_run: bool = False,
+             segments: int = 8,
+             workers: Optional[int] = None,
+             checkpoint: Optional[str] = None,
+             target_rcu: Optional[float] = None,
+             target_wcu: Optional[float] = None) -> None:
     today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-    scanned = 0
+    scanner = ParallelScanner(
+        table_name,
+        region,
+        total_segments=segments,
+        workers=workers,
+        # A dry run must not leave a checkpoint that makes the real run skip pages
+        checkpoint_path=None if dry_run else checkpoint,
+        limiter=AdaptiveRateLimiter(target_rcu, target_wcu),
+        projection="#e, is_premium, #ts",
+        expression_attribute_names={"#e": "email", "#ts": "timestamp"},
+    )
     updated = 0
+    lock = threading.Lock()
 
-    params = {
-        "ProjectionExpression": "#e, is_premium, #ts",
-        "ExpressionAttributeNames": {"#e": "email", "#ts": "timestamp"},
-    }
-
-    resp = table.scan(**params)
-    while True:
-        items = resp.get("Items", [])
-        scanned += len(items)
+    def handle(items: List[Dict], segment: int) -> None:
+        nonlocal updated
+        table = scanner.table()
         for it in items:
             if "timestamp" in it and isinstance(it["timestamp"], str) and len(it["timestamp"]) == 10:
                 continue
             email = it["email"].lower()
             if dry_run:
                 print(f"Would update {email} -> timestamp={today}")
-                updated += 1
+                with lock:
+                    updated += 1
                 continue
             try:
-                table.update_item(
+                scanner.call(
+                    "write",
+                    table.update_item,
                     Key={"email": email},
                     UpdateExpression="SET #ts = :ts",
                     ExpressionAttributeNames={"#ts": "timestamp"},
                     ExpressionAttributeValues={":ts": today},
                     ConditionExpression="attribute_not_exists(#ts)",
                 )
-                updated += 1
+                with lock:
+                    updated += 1
             except ClientError as e:
                 if e.response["Error"].get("Code") == "ConditionalCheckFailedException":
-                    # Someone already set it between scan and update
+                    # Someone already set it between scan and update (or a resumed page)
                     continue
                 raise
-        if "LastEvaluatedKey" not in resp:
-            break
-        # simple pacing to avoid throttling in large tables
-        time.sleep(0.1)
-        resp = table.scan(ExclusiveStartKey=resp["LastEvaluatedKey"], **params)
 
-    print(f"Scanned: {scanned}, Updated: {updated}, Date used: {today}")
+    stats = scanner.run(handle)
+    print(
+        f"Scanned: {stats.items}, Updated: {updated}, Date used: {today} "
+        f"({stats.pages} pages in {stats.seconds:.1f}s, throttled {stats.throttles}x, "
+        f"RCU {stats.consumed.get('read', 0):.0f}, WCU {stats.consumed.get('write', 0):.0f})"
+    )
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--table", required=True)
-    parser.add_argument("--region", default="us-east-1")
+    parser.add_argument("--table", default=os.getenv("DYNAMODB_TABLE"), required=not os.getenv("DYNAMODB_TABLE"))
+    parser.add_argument("--region", default=os.getenv("AWS_REGION", "us-east-1"))
     parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--segments", type=int, default=8, help="TotalSegments of the parallel scan")
+    parser.add_argument("--workers", type=int, default=None, help="threads (default: one per segment)")
+    parser.add_argument("--checkpoint", default=None,
+                        help="resume file (default: .backfill_timestamp.<table>.json; '' disables)")
+    parser.add_argument("--target-rcu", type=float, default=None, help="read capacity units per second")
+    parser.add_argument("--target-wcu", type=float, default=None, help="write capacity units per second")
     args = parser.parse_args()
-    backfill(args.table, args.region, args.dry_run)
+    checkpoint = args.checkpoint
+    if checkpoint is None:
+        checkpoint = f".backfill_timestamp.{args.table}.json"
+    backfill(args.table, args.region, args.dry_run, args.segments, args.workers,
+             checkpoint or None, args.target_rcu, args.target_wcu)
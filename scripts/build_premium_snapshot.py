@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Rebuild the memory-mapped premium snapshot used by the API for negative lookups.
+
+- Scans the premium table (key only) into a sorted hash array + Bloom filter
+- Writes the file atomically; API workers pick it up within SNAPSHOT_RELOAD_INTERVAL_SECONDS
+- Trims webhook deltas that are now folded into the snapshot
+
+Usage:
+  python scripts/build_premium_snapshot.py [--path /data/premium_snapshot.bin] [--fp-rate 0.01]
+
+Env vars respected: SNAPSHOT_PATH, DYNAMODB_TABLE, AWS_REGION, REDIS_URL
+"""
+import argparse
+import time
+
+from redis import Redis
+
+from app.core.config import settings
+from app.db.dynamodb import DynamoRepository
+from app.db.snapshot import DELTA_KEY, DELTA_MARGIN_SECONDS, build_snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--path", default=settings.snapshot_path)
+    parser.add_argument("--fp-rate", type=float, default=settings.snapshot_false_positive_rate)
+    args = parser.parse_args()
+    if not args.path:
+        print("[Snapshot] SNAPSHOT_PATH not set; nothing to do")
+        return
+
+    started = time.time()
+    repo = DynamoRepository()
+    count = build_snapshot(repo._iter_emails_sync(), args.path, args.fp_rate)
+    repo.close()
+    print(f"[Snapshot] wrote {count} entries to {args.path} in {time.time() - started:.1f}s")
+
+    # Deltas recorded before the scan started are part of the new snapshot
+    try:
+        client = Redis.from_url(settings.redis_url, decode_responses=True)
+        removed = client.zremrangebyscore(DELTA_KEY, "-inf", started - DELTA_MARGIN_SECONDS)
+        client.close()
+        print(f"[Snapshot] trimmed {removed} deltas")
+    except Exception as e:
+        print("[Snapshot] could not trim deltas:", repr(e))
+
+
+if __name__ == "__main__":
+    main()
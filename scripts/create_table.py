@@ -2,23 +2,24 @@
 import argparse
 import boto3
 
+from app.db.dynamodb import ensure_expiry_schema, expiry_enabled, expiry_for_day, table_definition
+
 
 def ensure_table(table_name: str, region: str):
     dynamodb = boto3.client("dynamodb", region_name=region)
     existing = dynamodb.list_tables()["TableNames"]
     if table_name in existing:
         print(f"Table {table_name} already exists")
+        # With PREMIUM_PERIOD_DAYS > 0, tables created before subscription expiry get the index and TTL
+        if expiry_enabled():
+            ensure_expiry_schema(dynamodb, table_name, dynamodb.describe_table(TableName=table_name)["Table"])
         return
     print(f"Creating table {table_name} ...")
-    dynamodb.create_table(
-        TableName=table_name,
-        AttributeDefinitions=[{"AttributeName": "email", "AttributeType": "S"}],
-        KeySchema=[{"AttributeName": "email", "KeyType": "HASH"}],
-        BillingMode="PAY_PER_REQUEST",
-        Tags=[{"Key": "app", "Value": "paypal-premium-manager"}],
-    )
+    dynamodb.create_table(**table_definition(table_name, with_expiry_index=expiry_enabled()))
     waiter = dynamodb.get_waiter("table_exists")
     waiter.wait(TableName=table_name)
+    if expiry_enabled():
+        ensure_expiry_schema(dynamodb, table_name, dynamodb.describe_table(TableName=table_name)["Table"])
     print("Table is ready.")
 
 
@@ -28,7 +29,11 @@ def seed_user(table_name: str, region: str, email: str, premium: bool):
     # Add UTC date timestamp in YYYY-MM-DD format
     from datetime import datetime, timezone
     ts = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-    table.put_item(Item={"email": email.lower(), "is_premium": premium, "timestamp": ts})
+    item = {"email": email.lower(), "is_premium": premium, "timestamp": ts}
+    expiry = expiry_for_day(ts)
+    if expiry is not None:
+        item["expires_at"], item["expiry_day"] = expiry
+    table.put_item(Item=item)
     print(f"Seeded {email} -> {premium}")
 
 
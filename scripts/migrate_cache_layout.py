@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Migrate cached premium flags from `premium:<email>` keys to the bucketed hash layout.
+
+- SCANs premium:* and copies each flag with its remaining TTL into the pb:<bucket> hashes
+  (REDIS_BUCKET_COUNT, REDIS_BUCKET_EXPIRY), in pipelined batches
+- --delete-old removes the old keys once copied (do it after switching REDIS_CACHE_LAYOUT=buckets)
+- --prune removes expired embedded-expiry fields from the buckets (REDIS_BUCKET_EXPIRY=embedded)
+- Prints a memory report: sampled bytes per entry in each layout and INFO used_memory before/after
+
+Digests cannot be turned back into emails; to go back to REDIS_CACHE_LAYOUT=keys just switch
+the setting (and optionally run scripts/warm_cache.py).
+
+Usage:
+  python scripts/migrate_cache_layout.py [--delete-old] [--prune] [--batch 1000] [--sample 1000]
+
+Env vars respected: REDIS_URL, REDIS_TTL_SECONDS, REDIS_BUCKET_COUNT, REDIS_BUCKET_EXPIRY
+"""
+import argparse
+import math
+import random
+import time
+from typing import List, Optional
+
+from redis import Redis
+
+from app.core.config import settings
+from app.db.cache_layout import BUCKET_PREFIX, KEY_PREFIX, make_bucket_layout
+
+
+def used_memory(client: Redis) -> Optional[int]:
+    try:
+        return int(client.info("memory")["used_memory"])
+    except Exception:
+        return None
+
+
+def sampled_bytes(client: Redis, keys: List[str], entries_per_key) -> Optional[float]:
+    """Average MEMORY USAGE per cached entry over `keys` (None if the server can't tell)."""
+    total_bytes = 0
+    total_entries = 0
+    for key in keys:
+        try:
+            usage = client.memory_usage(key, samples=0)
+        except Exception:
+            return None
+        if usage is None:
+            continue
+        total_bytes += usage
+        total_entries += entries_per_key(key)
+    return total_bytes / total_entries if total_entries else None
+
+
+def migrate(batch: int, delete_old: bool, sample: int) -> None:
+    client = Redis.from_url(settings.redis_url, decode_responses=True, socket_timeout=settings.redis_socket_timeout)
+    try:
+        info = client.info("server")
+    except Exception:
+        info = None
+    layout = make_bucket_layout(info)
+    mode = "field" if layout.field_expiry else "embedded"
+    print(f"[Cache Layout] {layout.bucket_count} buckets, {mode} expiry")
+
+    before = used_memory(client)
+    started = time.time()
+    migrated = 0
+    skipped = 0
+    old_sample: List[str] = []
+    cursor = 0
+    while True:
+        cursor, keys = client.scan(cursor=cursor, match=f"{KEY_PREFIX}*", count=batch)
+        if keys:
+            pipe = client.pipeline(transaction=False)
+            for key in keys:
+                pipe.get(key)
+                pipe.pttl(key)
+            replies = pipe.execute()
+            pipe = client.pipeline(transaction=False)
+            for i, key in enumerate(keys):
+                val, pttl = replies[2 * i], replies[2 * i + 1]
+                if val is None or pttl == -2:
+                    skipped += 1
+                    continue
+                # Near-expiry keys keep their short TTL per field; queue_write only ever extends a bucket's TTL
+                ttl = settings.redis_ttl_seconds if pttl is None or pttl < 0 else max(1, math.ceil(pttl / 1000))
+                layout.queue_write(pipe, key[len(KEY_PREFIX):], val == "1", ttl)
+                migrated += 1
+                # Reservoir sample of old keys for the memory report
+                if len(old_sample) < sample:
+                    old_sample.append(key)
+                else:
+                    j = random.randrange(migrated)
+                    if j < sample:
+                        old_sample[j] = key
+            pipe.execute()
+        if cursor == 0:
+            break
+
+    old_per_entry = sampled_bytes(client, old_sample, lambda _: 1)
+    bucket_keys = list({layout.locate(k[len(KEY_PREFIX):])[0] for k in old_sample})
+    new_per_entry = sampled_bytes(client, bucket_keys, lambda k: client.hlen(k) or 1)
+
+    deleted = 0
+    if delete_old:
+        cursor = 0
+        while True:
+            cursor, keys = client.scan(cursor=cursor, match=f"{KEY_PREFIX}*", count=batch)
+            if keys:
+                deleted += client.unlink(*keys)
+            if cursor == 0:
+                break
+    after = used_memory(client)
+    client.close()
+
+    print(f"[Cache Layout] migrated {migrated} flags ({skipped} expired during scan) in {time.time() - started:.1f}s")
+    if old_per_entry is not None and new_per_entry is not None:
+        saved = (old_per_entry - new_per_entry) * migrated
+        print(f"[Cache Layout] ~{old_per_entry:.0f} B/entry as keys, ~{new_per_entry:.0f} B/entry in buckets; "
+              f"estimated saving {saved / 1048576:.1f} MiB once old keys are gone")
+    if delete_old:
+        print(f"[Cache Layout] deleted {deleted} old keys")
+    if before is not None and after is not None:
+        print(f"[Cache Layout] used_memory {before / 1048576:.1f} MiB -> {after / 1048576:.1f} MiB "
+              f"({(before - after) / 1048576:+.1f} MiB)")
+
+
+def prune(batch: int) -> None:
+    # Fields are binary digests, so read them without decoding
+    client = Redis.from_url(settings.redis_url, socket_timeout=settings.redis_socket_timeout)
+    now = int(time.time())
+    removed = 0
+    cursor = 0
+    while True:
+        cursor, keys = client.scan(cursor=cursor, match=f"{BUCKET_PREFIX}*", count=batch)
+        for key in keys:
+            expired = [f for f, v in client.hscan_iter(key, count=batch) if len(v) > 1 and int(v[1:]) <= now]
+            if expired:
+                removed += client.hdel(key, *expired)
+        if cursor == 0:
+            break
+    client.close()
+    print(f"[Cache Layout] pruned {removed} expired fields")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--sample", type=int, default=1000, help="keys sampled for the memory report")
+    parser.add_argument("--delete-old", action="store_true", help="remove premium:* keys after copying")
+    parser.add_argument("--prune", action="store_true", help="only drop expired embedded-expiry fields")
+    args = parser.parse_args()
+    if args.prune:
+        prune(args.batch)
+    else:
+        migrate(args.batch, args.delete_old, args.sample)
+
+
+if __name__ == "__main__":
+    main()
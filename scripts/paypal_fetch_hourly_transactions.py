@@ -1,36 +1,56 @@
 #!/usr/bin/env python3
-from datetime import datetime, timezone
-from app.integrations.paypal_client import PayPalClient
+import argparse
+import time
+
+from redis import Redis
+
+from app.core.config import settings
+from app.integrations.paypal_sync import TransactionSync
 from app.db.dynamodb import DynamoRepository
+from app.services.ingest import announce_new_users, bulk_ingest, latest_day_by_email
 
 def main():
-    client = PayPalClient()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=8, help="DynamoDB batch chunks in flight")
+    parser.add_argument("--verbose", action="store_true", help="print every transaction")
+    args = parser.parse_args()
+
+    sync = TransactionSync()
     repo = DynamoRepository()
-    txns = client.search_transactions_last_hour()
-    simplified = [{"date": t.get("date"), "email": t.get("email"), "amount": t.get("amount")} for t in txns]
-    print(simplified)
-
-    # Insert into DynamoDB if email doesn't exist; use transaction initiation date for timestamp
-    for t in txns:
-        email = (t.get("email") or "").strip().lower()
-        if not email:
-            continue
-        # Parse transaction_initiation_date (ISO8601 with offset, without colon in offset per PayPal)
-        # Example: 2025-10-17T01:23:45+0000 or 2025-10-16T21:23:45-0400
-        raw = t.get("date")
-        if not raw:
-            continue
-        try:
-            # Normalize offset string: Python's %z accepts "+HHMM" already
-            dt = datetime.strptime(raw, "%Y-%m-%dT%H:%M:%S%z")
-            utc_day = dt.astimezone(timezone.utc).strftime("%Y-%m-%d")
-        except Exception:
-            # If parsing fails, fallback to today's UTC date
-            utc_day = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-
-        # Only insert if not exists
-        if not repo._exists_sync(email):  # safe here in a short-lived script; avoids extra thread hop
-            repo._put_item_with_timestamp_sync(email, True, utc_day)
+
+    # Stream every transaction since the last checkpoint (all pages, slices fetched in parallel)
+    def transactions():
+        for t in sync.run():
+            if args.verbose:
+                print({"date": t.get("date"), "email": t.get("email"), "amount": t.get("amount")})
+            yield t
+
+    started = time.perf_counter()
+    # Dedupe payers first, keeping the latest transaction date (used as the item timestamp)
+    latest = latest_day_by_email(transactions())
+    fetch_seconds = time.perf_counter() - started
+    print(f"[PayPal Sync] {sync.items_yielded} transactions from {sync.pages_fetched} pages "
+          f"-> {len(latest)} unique payers in {fetch_seconds:.1f}s")
+
+    # Insert only emails that don't exist yet (BatchGetItem + BatchWriteItem); raises on failed items
+    stats = bulk_ingest(latest, repo, concurrency=args.concurrency)
+    print(f"[Ingest] {stats.unique_emails} emails: {stats.created} created, {stats.renewed} renewed, {stats.existing} existing "
+          f"in {stats.seconds:.2f}s ({stats.emails_per_second:.0f} emails/s)")
+    repo.close()
+
+    # New users must not keep a cached or snapshot "not premium" until the next rebuild
+    client = Redis.from_url(settings.redis_url, decode_responses=True, socket_timeout=settings.redis_socket_timeout)
+    try:
+        announce_new_users(client, stats.created_emails, latest)
+    except Exception as e:
+        print("[Ingest] could not announce new users:", repr(e))
+    finally:
+        client.close()
+
+    # Only now is everything up to the high-water mark in DynamoDB
+    if sync.high_water_mark is not None:
+        sync.save_checkpoint(sync.high_water_mark)
+        print(f"[PayPal Sync] checkpoint -> {sync.high_water_mark.isoformat()}")
 
 if __name__ == "__main__":
     main()
@@ -2,6 +2,7 @@
 from app.integrations.paypal_client import PayPalClient
 
 def main():
+    # force_refresh also publishes the new token to Redis for the API workers and other scripts
     client = PayPalClient()
     token = client.get_access_token(force_refresh=True)
     print("Refreshed PayPal access token (masked):", token[:6] + "...")
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Remove lapsed subscriptions (PREMIUM_PERIOD_DAYS) without scanning the table.
+
+- Queries the expiry-day index only for the days that are due: from the last swept day
+  (Redis key PREMIUM_SWEEP_CHECKPOINT_KEY, or PREMIUM_SWEEP_INITIAL_LOOKBACK_DAYS back on
+  the first run) through today
+- Deletes each expired item with a condition on `expires_at`, so a renewal that lands
+  meanwhile is kept
+- Caches the email as not premium and publishes it on L1_INVALIDATION_CHANNEL so every API
+  worker drops its L1 copy
+
+Reads already treat expired items as not premium, and DynamoDB's TTL deletes them
+eventually; the sweep makes both the table and the caches reflect it promptly.
+
+Usage:
+  python scripts/sweep_expired.py [--since YYYY-MM-DD] [--dry-run]
+
+Env vars respected: DYNAMODB_TABLE, AWS_REGION, REDIS_URL, PREMIUM_PERIOD_DAYS
+"""
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+
+from botocore.exceptions import ClientError
+from redis import Redis
+
+from app.core.config import settings
+from app.db.cache_layout import make_layout, needs_server_info
+from app.db.dynamodb import DynamoRepository, ensure_expiry_schema, expiry_enabled
+
+
+def days_between(first: str, last: str):
+    day = datetime.strptime(first, "%Y-%m-%d")
+    end = datetime.strptime(last, "%Y-%m-%d")
+    while day <= end:
+        yield day.strftime("%Y-%m-%d")
+        day += timedelta(days=1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--since", default=None, help="first expiry day to sweep (default: checkpoint)")
+    parser.add_argument("--dry-run", action="store_true", help="list expired emails without deleting")
+    args = parser.parse_args()
+    if not expiry_enabled():
+        print("[Sweep] PREMIUM_PERIOD_DAYS is 0; nothing expires")
+        return
+
+    repo = DynamoRepository()
+    # The index and TTL are added here (and by create_table.py), not at API startup
+    try:
+        client = repo._table.meta.client
+        ensure_expiry_schema(client, repo.table_name, client.describe_table(TableName=repo.table_name)["Table"])
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") != "AccessDeniedException":
+            raise
+        print("[Sweep] not allowed to update the table schema; assuming the index exists:", repr(e))
+
+    now = int(time.time())
+    today = datetime.fromtimestamp(now, timezone.utc).strftime("%Y-%m-%d")
+    client = Redis.from_url(settings.redis_url, decode_responses=True,
+                            socket_timeout=settings.redis_socket_timeout)
+    first = args.since or client.get(settings.premium_sweep_checkpoint_key)
+    if not first:
+        first = (datetime.fromtimestamp(now, timezone.utc)
+                 - timedelta(days=settings.premium_sweep_initial_lookback_days)).strftime("%Y-%m-%d")
+
+    info = None
+    if needs_server_info():
+        try:
+            info = client.info("server")
+        except Exception as e:
+            print("[Sweep] could not read server version:", repr(e))
+    layout = make_layout(info)
+    ttl = settings.redis_ttl_seconds + max(0, settings.redis_stale_grace_seconds)
+
+    started = time.perf_counter()
+    found = deleted = renewed = 0
+    for day in days_between(first, today):
+        expired = list(repo._iter_expired_sync(day, now))
+        found += len(expired)
+        if args.dry_run:
+            for email, expires_at in expired:
+                print(f"Would expire {email} (expired {datetime.fromtimestamp(expires_at, timezone.utc):%Y-%m-%d %H:%M}Z)")
+            continue
+        gone = []
+        for email, _ in expired:
+            if repo._delete_expired_sync(email, now):
+                gone.append(email)
+            else:
+                renewed += 1
+        deleted += len(gone)
+        if gone:
+            # Replace any cached "premium" right away, then drop every worker's L1 copy
+            pipe = client.pipeline(transaction=False)
+            for email in gone:
+                layout.queue_write(pipe, email, False, ttl)
+                pipe.publish(settings.l1_invalidation_channel, email)
+            pipe.execute()
+        # Every item of a day is due from 00:00 UTC that day, so a swept day is complete
+        client.set(settings.premium_sweep_checkpoint_key, day)
+        print(f"[Sweep] {day}: {len(expired)} expired, {len(gone)} deleted")
+    repo.close()
+    client.close()
+    print(f"[Sweep] {found} expired, {deleted} deleted, {renewed} renewed meanwhile "
+          f"in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
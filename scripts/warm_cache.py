@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Preload Redis with premium:<email> for every row of the premium table.
+
+- Parallel table scan, pipelined SETEX batches, TTLs jittered by CACHE_WARM_TTL_JITTER
+- Progress is published in Redis (CACHE_WARM_PROGRESS_KEY) and reported by /v1/health
+- Only one warmer runs at a time (Redis lock); a recent completed warm-up is skipped unless --force
+
+Usage:
+  python scripts/warm_cache.py [--segments 4] [--batch-size 500] [--target-rcu 200] [--force]
+
+Env vars respected: DYNAMODB_TABLE, AWS_REGION, REDIS_URL, REDIS_TTL_SECONDS
+"""
+import argparse
+
+from app.core.config import settings
+from app.db.cache_warmer import warm_cache
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--segments", type=int, default=settings.cache_warm_segments)
+    parser.add_argument("--batch-size", type=int, default=settings.cache_warm_batch_size)
+    parser.add_argument("--target-rcu", type=float, default=None, help="read capacity units per second")
+    parser.add_argument("--force", action="store_true", help="warm even if a recent warm-up finished")
+    args = parser.parse_args()
+    progress = warm_cache(segments=args.segments, batch_size=args.batch_size,
+                          target_rcu=args.target_rcu, force=args.force)
+    print(f"[Cache Warm] state={progress.get('state')} loaded={progress.get('loaded')} total~{progress.get('total')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Run PayPal webhook stream consumers outside the API process.
+
+Useful with WEBHOOK_CONSUMERS=0 on the API workers, or to drain a backlog faster.
+
+Usage:
+  python scripts/webhook_consumer.py [--consumers 4]
+"""
+import argparse
+import asyncio
+
+from app.core.config import settings
+from app.db.dynamodb import create_repository
+from app.db.redis_cache import RedisCache
+from app.integrations.paypal_client import AsyncPayPalClient
+from app.services.webhooks import WebhookProcessor, start_consumers, stop_consumers
+
+
+async def run(consumers: int):
+    cache = RedisCache()
+    repo = create_repository()
+    await repo.start()
+    paypal = None
+    if settings.paypal_client_id and settings.paypal_client_secret:
+        paypal = AsyncPayPalClient(cache)
+    # No SnapshotManager here; the processor still records snapshot deltas in Redis (SNAPSHOT_PATH)
+    processor = WebhookProcessor(cache, repo, None, paypal)
+    tasks = start_consumers(cache, processor, consumers)
+    print(f"[Webhook Consumer] running {consumers} consumers on {settings.webhook_stream}")
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        await stop_consumers(tasks)
+        if paypal is not None:
+            await paypal.aclose()
+        await cache.close()
+        await repo.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--consumers", type=int, default=max(1, settings.webhook_consumers))
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args.consumers))
+    except KeyboardInterrupt:
+        pass